@@ -1,22 +1,28 @@
 # app.py - full merged application with messaging, reporting, and admin review
 # Roles updated: "employer" -> "client", "candidate" -> "contractor"
 import os
+import hashlib
+import hmac
+import json
 import math
 import re
 import sqlite3
 import smtplib
-from datetime import datetime, timedelta
+import threading
+import time
+import click
+from datetime import datetime
 from email.message import EmailMessage
 from werkzeug.utils import secure_filename
 from flask import send_from_directory, abort
-from flask_mail import Mail, Message
 from flask import url_for
 from dotenv import load_dotenv
 load_dotenv()
 
-import requests
 from flask import (
+    Blueprint,
     Flask,
+    current_app,
     render_template,
     render_template_string,
     request,
@@ -25,6 +31,9 @@ from flask import (
     flash,
     jsonify,
     abort,
+    g,
+    has_app_context,
+    Response,
 )
 from flask_login import (
     LoginManager,
@@ -34,10 +43,19 @@ from flask_login import (
     current_user,
     UserMixin,
 )
+from werkzeug.local import LocalProxy
 from werkzeug.security import generate_password_hash, check_password_hash
 
 from models import (
-    init_db,
+    get_connection,
+    configure_pool,
+    configure_writer,
+    run_write,
+    flush_writes,
+    set_connection_scope,
+    configure_user_cache,
+    set_request_memo,
+    release_connections,
     get_user_by_email,
     create_user,
     get_user_by_id,
@@ -45,6 +63,11 @@ from models import (
     update_job,
     delete_job,
     get_jobs,
+    get_job_points,
+    get_jobs_by_ids,
+    get_users_by_ids,
+    count_jobs,
+    bbox_for_radius,
     get_job_by_id,
     create_application,
     get_applications_by_job,
@@ -53,6 +76,7 @@ from models import (
     create_rating,
     get_ratings_for_target,
     get_average_rating_for_target,
+    get_rating_summary,
     get_all_users,
     set_user_ban,
     unset_user_ban,
@@ -66,51 +90,275 @@ from models import (
     consume_token,
     purge_expired_tokens,
     get_token_info,
-    get_latest_token_for_email
+    get_latest_token_for_email,
+    get_data_version,
+    get_job_coordinates,
+    migrate_database,
+    check_schema,
+    SCHEMA_VERSION,
+    utc_now_iso,
+    enqueue_email,
+    claim_outbox_batch,
+    get_cached_geocode,
+    claim_geocode_batch,
+    reserve_rate_slot,
+    backfill_short_locations,
+    get_job_markers,
+    iter_jobs,
+    record_queries,
+    find_table_scans,
 )
+from geo import make_distance_engine, short_addr_from_display, ClusterIndex
+from mailer import OutboxWorker
+from geocoding import Geocoder, GeocodeWorker, NOMINATIM_URL
+from compression import compress_response, DEFAULT_MIMETYPES
 
 BASE_DIR = os.path.abspath(os.path.dirname(__file__))
 DB_PATH = os.path.join(BASE_DIR, "data.db")
 
-app = Flask(__name__)
-app.config["SECRET_KEY"] = os.environ.get(
-    "FLASK_SECRET_KEY", "change-me-to-a-random-secret"
-)
-app.config["DATABASE"] = DB_PATH
-
-# Mail / Mailtrap config
-app.config["MAIL_SERVER"] = 'smtp.gmail.com'
-app.config["MAIL_PORT"] = 587
-app.config["MAIL_USERNAME"] = os.environ.get("MAIL_USERNAME")
-app.config["MAIL_PASSWORD"] = os.environ.get("MAIL_PASSWORD")
-app.config["MAIL_USE_TLS"] = True
-app.config["MAIL_DEFAULT_SENDER"] = ("GetAJob", os.environ.get("MAIL_USERNAME"))
-
-mail = Mail(app)
-
-# Email / token configuration
-app.config["EMAIL_MODE"] = os.environ.get("EMAIL_MODE", "console")  # 'console' or 'smtp'
-app.config["MAIL_HOST"] = os.environ.get("MAIL_HOST", "")
-app.config["MAIL_PORT"] = int(os.environ.get("MAIL_PORT", "587") or 587)
-app.config["MAIL_USER"] = os.environ.get("MAIL_USER", "")
-app.config["MAIL_PASS"] = os.environ.get("MAIL_PASS", "")
-app.config["MAIL_FROM"] = os.environ.get("MAIL_FROM", "no-reply@example.test")
-
-# token expirations (seconds)
-app.config["EMAIL_VERIFY_EXPIRATION"] = int(os.environ.get("EMAIL_VERIFY_EXPIRATION", 72 * 3600))
-app.config["PASSWORD_RESET_EXPIRATION"] = int(os.environ.get("PASSWORD_RESET_EXPIRATION", 3600))
+# Routes, hooks, template helpers and CLI commands are collected on `site` and attached
+# to each app by create_app(), so this module can be imported once and apps built cheaply.
+site = Blueprint("site", __name__, cli_group=None)
+
+
+def route(rule, **options):
+    """Like site.route(), but endpoints keep their bare names (url_for("index"), not "site.index")."""
+    def decorator(f):
+        endpoint = options.pop("endpoint", None) or f.__name__
+        site.record(lambda state: state.app.add_url_rule(rule, endpoint, f, **options))
+        return f
+    return decorator
+
+
+def load_config(app):
+    """Settings from the environment; create_app(config) overrides them afterwards."""
+    app.config["SECRET_KEY"] = os.environ.get(
+        "FLASK_SECRET_KEY", "change-me-to-a-random-secret"
+    )
+    app.config["DATABASE"] = DB_PATH
+
+    # Mail / Mailtrap config
+    app.config["MAIL_SERVER"] = os.environ.get("MAIL_SERVER", 'smtp.gmail.com')
+    app.config["MAIL_PORT"] = int(os.environ.get("MAIL_PORT", 587))
+    app.config["MAIL_USERNAME"] = os.environ.get("MAIL_USERNAME")
+    app.config["MAIL_PASSWORD"] = os.environ.get("MAIL_PASSWORD")
+    app.config["MAIL_USE_TLS"] = os.environ.get("MAIL_USE_TLS", "1") != "0"
+    app.config["MAIL_DEFAULT_SENDER"] = ("GetAJob", os.environ.get("MAIL_USERNAME"))
+
+    # Email / token configuration
+    app.config["EMAIL_MODE"] = os.environ.get("EMAIL_MODE", "console")  # 'console' or 'smtp'
+    app.config["MAIL_HOST"] = os.environ.get("MAIL_HOST", "")
+    app.config["MAIL_PORT"] = int(os.environ.get("MAIL_PORT", "587") or 587)
+    app.config["MAIL_USER"] = os.environ.get("MAIL_USER", "")
+    app.config["MAIL_PASS"] = os.environ.get("MAIL_PASS", "")
+    app.config["MAIL_FROM"] = os.environ.get("MAIL_FROM", "no-reply@example.test")
+
+    # token expirations (seconds)
+    app.config["EMAIL_VERIFY_EXPIRATION"] = int(os.environ.get("EMAIL_VERIFY_EXPIRATION", 72 * 3600))
+    app.config["PASSWORD_RESET_EXPIRATION"] = int(os.environ.get("PASSWORD_RESET_EXPIRATION", 3600))
+
+    # Message stream (SSE): seconds between keepalives / DB re-checks, and max stream lifetime.
+    # Each open stream holds a worker thread for up to MESSAGE_STREAM_MAX_AGE seconds, so run a
+    # threaded or async server (e.g. gunicorn --threads / gevent) and keep MESSAGE_STREAM_MAX_CONNECTIONS
+    # below its thread count; past the cap the stream answers 503 and the page polls instead.
+    # Messages written by other processes reach open streams within MESSAGE_STREAM_POLL seconds.
+    app.config["MESSAGE_STREAM_KEEPALIVE"] = float(os.environ.get("MESSAGE_STREAM_KEEPALIVE", 15))
+    app.config["MESSAGE_STREAM_MAX_AGE"] = float(os.environ.get("MESSAGE_STREAM_MAX_AGE", 300))
+    app.config["MESSAGE_STREAM_MAX_CONNECTIONS"] = int(os.environ.get("MESSAGE_STREAM_MAX_CONNECTIONS", 8))
+    app.config["MESSAGE_STREAM_POLL"] = float(os.environ.get("MESSAGE_STREAM_POLL", 1.0))
+
+    # Outbound email: requests only enqueue into email_outbox. EMAIL_WORKER=thread (default)
+    # delivers from a background thread in this process; with EMAIL_WORKER=off run
+    # `flask --app app send-emails` as a separate process instead.
+    app.config["EMAIL_WORKER"] = os.environ.get("EMAIL_WORKER", "thread")
+    app.config["EMAIL_BATCH_SIZE"] = int(os.environ.get("EMAIL_BATCH_SIZE", 50))
+    app.config["EMAIL_MAX_ATTEMPTS"] = int(os.environ.get("EMAIL_MAX_ATTEMPTS", 6))
+    app.config["EMAIL_RETRY_BASE"] = float(os.environ.get("EMAIL_RETRY_BASE", 30))
+    app.config["EMAIL_RETRY_MAX"] = float(os.environ.get("EMAIL_RETRY_MAX", 3600))
+    app.config["EMAIL_POLL_INTERVAL"] = float(os.environ.get("EMAIL_POLL_INTERVAL", 5))
+
+    # Geocoding (Nominatim): results are cached in memory and in the geocode_cache table.
+    # TTLs are seconds for found / not-found addresses; GEOCODE_URL can point at a local stub.
+    app.config["GEOCODE_URL"] = os.environ.get("GEOCODE_URL", NOMINATIM_URL)
+    app.config["GEOCODE_USER_AGENT"] = os.environ.get("GEOCODE_USER_AGENT", "GetAJob/1.0 (dev@localhost)")  # please replace contact for production
+    app.config["GEOCODE_TIMEOUT"] = float(os.environ.get("GEOCODE_TIMEOUT", 8))
+    app.config["GEOCODE_CACHE_TTL"] = int(os.environ.get("GEOCODE_CACHE_TTL", 30 * 86400))
+    app.config["GEOCODE_NEGATIVE_TTL"] = int(os.environ.get("GEOCODE_NEGATIVE_TTL", 86400))
+    app.config["GEOCODE_LRU_SIZE"] = int(os.environ.get("GEOCODE_LRU_SIZE", 1024))
+    # Addresses not in the cache are geocoded in the background (jobs are saved as
+    # geocode_status='pending'). GEOCODE_WORKER=thread (default) runs the worker in this
+    # process; with GEOCODE_WORKER=off run `flask --app app geocode-jobs` separately. Workers
+    # in several processes claim disjoint jobs and share one GEOCODE_MIN_INTERVAL budget.
+    app.config["GEOCODE_WORKER"] = os.environ.get("GEOCODE_WORKER", "thread")
+    app.config["GEOCODE_MIN_INTERVAL"] = float(os.environ.get("GEOCODE_MIN_INTERVAL", 1.0))  # Nominatim policy: max 1 request/s
+
+    # SQLite connection pool: idle connections kept per worker and PRAGMAs applied once per connection
+    app.config["DB_POOL_SIZE"] = int(os.environ.get("DB_POOL_SIZE", 8))
+    app.config["DB_PRAGMAS"] = {
+        "journal_mode": "WAL",
+        "synchronous": os.environ.get("DB_SYNCHRONOUS", "NORMAL"),
+        "temp_store": "MEMORY",
+        "cache_size": int(os.environ.get("DB_CACHE_SIZE_KB", 8192)) * -1,
+        "busy_timeout": int(os.environ.get("DB_BUSY_TIMEOUT_MS", 5000)),
+    }
+    # Writes for applications, ratings and messages go through one writer thread per process
+    # (DB_WRITER=thread, default), which commits up to DB_WRITER_BATCH queued writes per
+    # transaction. DB_WRITER=off writes on the request's own connection instead. A request
+    # waits at most DB_WRITER_TIMEOUT seconds for its write to commit before it errors out.
+    # DB_SYNCHRONOUS=FULL makes every commit durable across power loss; NORMAL (WAL) only across crashes.
+    app.config["DB_WRITER"] = os.environ.get("DB_WRITER", "thread")
+    app.config["DB_WRITER_BATCH"] = int(os.environ.get("DB_WRITER_BATCH", 100))
+    app.config["DB_WRITER_TIMEOUT"] = float(os.environ.get("DB_WRITER_TIMEOUT", 30))
+
+    # Distance engine for /jobs and /api/jobs_nearby: "scalar" (default) or "numpy" (vectorized,
+    # caches job coordinates as float64 columns and reloads them when jobs change)
+    app.config["DISTANCE_ENGINE"] = os.environ.get("DISTANCE_ENGINE", "scalar")
+
+    # Map API (/api/jobs/bbox): below MAP_CLUSTER_MAX_ZOOM jobs come back as grid clusters,
+    # at or above it as individual markers (at most MAP_MARKER_LIMIT per viewport)
+    app.config["MAP_CLUSTER_MAX_ZOOM"] = int(os.environ.get("MAP_CLUSTER_MAX_ZOOM", 13))
+    app.config["MAP_MARKER_LIMIT"] = int(os.environ.get("MAP_MARKER_LIMIT", 500))
+
+    # Response compression (gzip, or brotli when the optional package is installed) for
+    # allowlisted mimetypes with bodies of at least COMPRESS_MIN_SIZE bytes
+    app.config["COMPRESS_ENABLED"] = os.environ.get("COMPRESS_ENABLED", "1") != "0"
+    app.config["COMPRESS_MIN_SIZE"] = int(os.environ.get("COMPRESS_MIN_SIZE", 1024))
+    app.config["COMPRESS_MIMETYPES"] = DEFAULT_MIMETYPES
+    app.config["COMPRESS_GZIP_LEVEL"] = int(os.environ.get("COMPRESS_GZIP_LEVEL", 6))
+    app.config["COMPRESS_BROTLI_QUALITY"] = int(os.environ.get("COMPRESS_BROTLI_QUALITY", 5))
+
+    # Bearer token for the bulk job export (/api/export/jobs); unset = admins only
+    app.config["EXPORT_API_TOKEN"] = os.environ.get("EXPORT_API_TOKEN", "")
+
+    # User rows are memoized per request and cached process-wide for USER_CACHE_TTL seconds
+    # (0 disables the process cache); helpers that change a user invalidate it immediately.
+    app.config["USER_CACHE_TTL"] = float(os.environ.get("USER_CACHE_TTL", 5))
+    app.config["USER_CACHE_SIZE"] = int(os.environ.get("USER_CACHE_SIZE", 1024))
+
+    # Schema changes are applied by `flask --app app migrate` (the dev server in __main__ runs it
+    # too); the first request only compares the recorded version. AUTO_MIGRATE=1 migrates then instead.
+    app.config["AUTO_MIGRATE"] = os.environ.get("AUTO_MIGRATE", "0") == "1"
+
+
+def create_app(config=None):
+    """
+    Build an app from the environment plus `config` overrides (e.g. {"DATABASE": path} for an
+    isolated test database). Nothing here opens the database, an SMTP connection or an HTTP
+    session: the schema is checked on the first request, and mail / geocoding set up on first use.
+    Connection pool, writer thread and user cache settings apply to this app's DATABASE only.
+    """
+    app = Flask(__name__)
+    load_config(app)
+    if config:
+        app.config.update(config)
+
+    # pool, writer and user cache settings are kept per database file, and only reset when
+    # they change, so building another app (tests, a CLI command) leaves this one's alone
+    db_path = app.config["DATABASE"]
+    configure_pool(size=app.config["DB_POOL_SIZE"], pragmas=app.config["DB_PRAGMAS"], db_path=db_path)
+    configure_writer(
+        enabled=app.config["DB_WRITER"] == "thread",
+        max_batch=app.config["DB_WRITER_BATCH"],
+        timeout=app.config["DB_WRITER_TIMEOUT"],
+        db_path=db_path,
+    )
+    configure_user_cache(ttl=app.config["USER_CACHE_TTL"], max_size=app.config["USER_CACHE_SIZE"], db_path=db_path)
+
+    coordinates = lambda: get_job_coordinates(app.config["DATABASE"])
+    jobs_version = lambda: get_data_version(app.config["DATABASE"], "jobs")
+    geocoder = Geocoder(
+        db_path,
+        url=app.config["GEOCODE_URL"],
+        user_agent=app.config["GEOCODE_USER_AGENT"],
+        timeout=app.config["GEOCODE_TIMEOUT"],
+        ttl=app.config["GEOCODE_CACHE_TTL"],
+        negative_ttl=app.config["GEOCODE_NEGATIVE_TTL"],
+        max_entries=app.config["GEOCODE_LRU_SIZE"],
+        min_interval=app.config["GEOCODE_MIN_INTERVAL"],
+    )
+    app.extensions["jobsite"] = {
+        "email_worker": OutboxWorker(
+            app,
+            batch_size=app.config["EMAIL_BATCH_SIZE"],
+            max_attempts=app.config["EMAIL_MAX_ATTEMPTS"],
+            backoff_base=app.config["EMAIL_RETRY_BASE"],
+            backoff_max=app.config["EMAIL_RETRY_MAX"],
+            poll_interval=app.config["EMAIL_POLL_INTERVAL"],
+        ),
+        "geocoder": geocoder,
+        "geocode_worker": GeocodeWorker(geocoder, db_path),
+        "distance_engine": make_distance_engine(app.config["DISTANCE_ENGINE"], load_rows=coordinates, version=jobs_version),
+        "cluster_index": ClusterIndex(load_rows=coordinates, version=jobs_version),
+        "jobs_snapshot": JobsSnapshot(db_path),
+        "schema": {"version": None},  # filled in by _require_current_schema()
+    }
+
+    login_manager.init_app(app)
+    app.teardown_appcontext(_release_request_connections)
+    app.register_blueprint(site)
+    return app
+
+
+def _service(name):
+    return LocalProxy(lambda: current_app.extensions["jobsite"][name])
+
+
+# Per-app objects built by create_app(), looked up through the current app
+email_worker = _service("email_worker")
+geocoder = _service("geocoder")
+geocode_worker = _service("geocode_worker")
+distance_engine = _service("distance_engine")
+cluster_index = _service("cluster_index")
+jobs_snapshot = _service("jobs_snapshot")
+schema_state = _service("schema")
 
 # Admin secret token used for hidden admin signup/login routes
 ADMIN_SECRET_TOKEN = os.environ.get("ADMIN_SECRET_TOKEN", "change-me-admin-secret")
 
-# Initialize DB (creates file + tables if not present)
-init_db(app.config["DATABASE"])
 
-# Messaging / reporting tables will be ensured after init_db below
+def _request_connections():
+    """Per-app-context connection map so every helper in a request shares one connection."""
+    if not has_app_context():
+        return None
+    if "db_conns" not in g:
+        g.db_conns = {}
+    return g.db_conns
+
+
+set_connection_scope(_request_connections)
+
+
+def _request_memo():
+    if not has_app_context():
+        return None
+    if "lookup_memo" not in g:
+        g.lookup_memo = {}
+    return g.lookup_memo
+
+
+set_request_memo(_request_memo)
+
+
+@site.after_app_request
+def _compress_response(response):
+    if not current_app.config["COMPRESS_ENABLED"]:
+        return response
+    return compress_response(
+        response,
+        request.accept_encodings,
+        min_size=current_app.config["COMPRESS_MIN_SIZE"],
+        mimetypes=current_app.config["COMPRESS_MIMETYPES"],
+        gzip_level=current_app.config["COMPRESS_GZIP_LEVEL"],
+        brotli_quality=current_app.config["COMPRESS_BROTLI_QUALITY"],
+    )
+
+
+def _release_request_connections(exc):
+    release_connections(g.pop("db_conns", None))
+
 
 login_manager = LoginManager()
 login_manager.login_view = "signin"
-login_manager.init_app(app)
 
 
 class User(UserMixin):
@@ -131,7 +379,7 @@ class User(UserMixin):
 
 @login_manager.user_loader
 def load_user(user_id):
-    row = get_user_by_id(app.config["DATABASE"], int(user_id))
+    row = get_user_by_id(current_app.config["DATABASE"], int(user_id))
     if not row:
         return None
 
@@ -219,30 +467,49 @@ def send_verification_email(user, token):
 
     If you did not sign up for a GetAJob account, please ignore this email.
     """
-    msg = Message(subject=subject, recipients=[user_email])
-    msg.body = body
-    msg.html = f"""<p>Hi <strong>{user_name}</strong>,</p>
+    html = f"""<p>Hi <strong>{user_name}</strong>,</p>
     <p>Welcome to GetAJob! This is totally not a scam! Please verify your email address by clicking the link below:</p>
     <p><a href="{verify_url}">Verify Email</a></p>
     <p>If you did not sign up for a GetAJob account, please ignore this email.</p>
     """
-    mail.send(msg)
+    send_email(subject, user_email, html_body=html, text_body=body)
 
 def send_email(subject, recipient, html_body=None, text_body=None):
-    msg = Message(subject=subject, recipients=[recipient])
+    # queue only; the outbox worker does the SMTP round trips outside the request
+    enqueue_email(current_app.config["DATABASE"], recipient, subject, text_body=text_body or subject, html_body=html_body)
+    if current_app.config["EMAIL_WORKER"] == "thread":
+        email_worker.start()
+        email_worker.wake()
+    return True
 
-    #plain text part
-    if text_body:
-        msg.body = text_body
-    else:
-        msg.body = subject #fallback
-    
-    #html part
-    if html_body:
-        msg.html = html_body
 
-    mail.send(msg)
-    return True
+@site.before_app_request
+def _require_current_schema():
+    # checked on the first request, then again only while the database is behind,
+    # so a migrated database costs nothing per request
+    if schema_state["version"] is not None and schema_state["version"] >= SCHEMA_VERSION:
+        return None
+    first_check = schema_state["version"] is None
+    if first_check and current_app.config["AUTO_MIGRATE"]:
+        migrate_database(current_app.config["DATABASE"])
+    schema_state["version"] = check_schema(current_app.config["DATABASE"])
+    if schema_state["version"] < SCHEMA_VERSION:
+        if first_check:
+            current_app.logger.warning(
+                "Database schema is at version %s, expected %s; run `flask --app app migrate`",
+                schema_state["version"], SCHEMA_VERSION,
+            )
+        return "Database schema is out of date; run `flask --app app migrate`.", 503
+    return None
+
+
+@site.before_app_request
+def _start_background_workers():
+    # picks up emails / geocoding queued before a restart; start() is a no-op once running
+    if current_app.config["EMAIL_WORKER"] == "thread":
+        email_worker.start()
+    if current_app.config.get("GEOCODE_WORKER") == "thread":
+        geocode_worker.start()
 
 
 # ---- password validator helper ----
@@ -263,7 +530,7 @@ def validate_password(password):
 
 
 # Date formatting filter (MM-DD-YYYY)
-@app.template_filter('date_only')
+@site.app_template_filter('date_only')
 def date_only(value):
     """
     Jinja filter: returns MM-DD-YYYY for ISO-like datetime strings.
@@ -292,7 +559,7 @@ def date_only(value):
     # Fallback: return first 10 characters (best-effort)
     return s[:10]
 
-@app.template_filter('datetime_format')
+@site.app_template_filter('datetime_format')
 def datetime_format(value):
     """
     Format datetime for display in conversation view.
@@ -312,21 +579,21 @@ def datetime_format(value):
         # Fallback to original value
         return str(value)
 
-@app.context_processor
+@site.app_context_processor
 def inject_current_year():
     return {"current_year": datetime.utcnow().year}
 
-@app.context_processor
+@site.app_context_processor
 def inject_has_edit_profile():
     # Template-safe way to detect whether the edit_profile endpoint exists.
     # Avoids calling url_for inside templates which raises BuildError if the endpoint is missing.
     try:
-        return {"has_edit_profile": "edit_profile" in app.view_functions}
+        return {"has_edit_profile": "edit_profile" in current_app.view_functions}
     except Exception:
         return {"has_edit_profile": False}
 
 # safe_url_for helper for templates (defensive - prevents BuildError from bubbling to template)
-@app.context_processor
+@site.app_context_processor
 def utility_processor():
     def safe_url_for(endpoint, **values):
         try:
@@ -336,7 +603,7 @@ def utility_processor():
     return {"safe_url_for": safe_url_for}
 
 # Template global to display human-friendly role names in templates
-@app.template_global()
+@site.app_template_global()
 def role_display(role):
     """
     Return a human-friendly display string for a role.
@@ -360,34 +627,30 @@ def role_display(role):
     except Exception:
         return "N/A"
 
-# --- Geocoding helper (uses free OpenStreetMap Nominatim) ---
-def geocode_address(address):
+# --- Geocoding helper (uses free OpenStreetMap Nominatim, see geocoding.py) ---
+def resolve_job_location(location_text):
     """
-    Geocode an address using Nominatim (OpenStreetMap).
-    Returns (lat: float, lon: float, display_name: str) or (None, None, None) on failure.
-    This uses the free Nominatim service — be mindful of rate limits for heavy usage.
+    (lat, lng, geocode_status) for a job saved without coordinates, without blocking on
+    the network: cached addresses resolve immediately, anything else is left 'pending'
+    for the geocoding worker.
     """
-    if not address:
+    if not location_text:
         return None, None, None
-    url = "https://nominatim.openstreetmap.org/search"
-    params = {"q": address, "format": "json", "limit": 1}
-    headers = {"User-Agent": "GetAJob/1.0 (dev@localhost)"}  # please replace contact for production
-    try:
-        resp = requests.get(url, params=params, headers=headers, timeout=8)
-        resp.raise_for_status()
-        data = resp.json()
-        if isinstance(data, list) and len(data) > 0:
-            item = data[0]
-            lat = float(item.get("lat"))
-            lon = float(item.get("lon"))
-            name = item.get("display_name")
-            return lat, lon, name
-    except Exception as e:
-        app.logger.warning("Geocode failed for %r: %s", address, e)
-    return None, None, None
+    hit, result = geocoder.cached(location_text)
+    if not hit:
+        return None, None, "pending"
+    if result[0] is None or result[1] is None:
+        return None, None, "failed"
+    return result[0], result[1], "located"
+
+
+def queue_geocoding():
+    if current_app.config["GEOCODE_WORKER"] == "thread":
+        geocode_worker.start()
+        geocode_worker.wake()
 
 
-@app.route("/")
+@route("/")
 def index():
     # If user is signed in, send them to their landing page based on role.
     # Otherwise render the public (unsigned) homepage.
@@ -406,7 +669,7 @@ def index():
 #
 # Auth routes (including secret admin signup/login)
 #
-@app.route("/signup", methods=["GET", "POST"])
+@route("/signup", methods=["GET", "POST"])
 def signup():
     if current_user.is_authenticated:
         return redirect(url_for("profile"))
@@ -435,20 +698,20 @@ def signup():
             flash(reason, "danger")
             return render_template("signup.html", email=email, role=role, username=username, first_name=first_name, last_name=last_name)
 
-        existing = get_user_by_email(app.config["DATABASE"], email)
+        existing = get_user_by_email(current_app.config["DATABASE"], email)
         if existing:
             flash("An account with that email already exists.", "warning")
             return render_template("signup.html", email=email, role=role, username=username, first_name=first_name, last_name=last_name)
 
         # username uniqueness check
-        if get_user_by_username(app.config["DATABASE"], username):
+        if get_user_by_username(current_app.config["DATABASE"], username):
             flash("Username already taken; please choose another.", "warning")
             return render_template("signup.html", email=email, role=role, username=username, first_name=first_name, last_name=last_name)
 
         password_hash = generate_password_hash(password)
         try:
             user = create_user(
-                app.config["DATABASE"],
+                current_app.config["DATABASE"],
                 email,
                 password_hash,
                 role=role,
@@ -463,10 +726,10 @@ def signup():
         
         #new email verification flow
         token = create_token(
-            app.config["DATABASE"],
+            current_app.config["DATABASE"],
             email,
             purpose="verify",
-            expires_seconds=app.config.get("EMAIL_VERIFY_EXPIRATION", 72 * 3600),
+            expires_seconds=current_app.config.get("EMAIL_VERIFY_EXPIRATION", 72 * 3600),
         )
         #use Flask-Mail helper
         send_verification_email(user, token)
@@ -477,7 +740,7 @@ def signup():
 
     return render_template("signup.html")
 
-@app.route("/contractor/dashboard")
+@route("/contractor/dashboard")
 @require_roles("contractor")
 def contractor_dashboard():
     """
@@ -485,22 +748,22 @@ def contractor_dashboard():
     """
     try:
         user_id = int(current_user.get_id())
-        apps = get_applications_by_user(app.config["DATABASE"], user_id)
+        apps = get_applications_by_user(current_app.config["DATABASE"], user_id)
         # Build enriched list of entries with job and employer info
+        jobs = get_jobs_by_ids(current_app.config["DATABASE"], [a["job_id"] for a in apps])
+        employers = get_users_by_ids(current_app.config["DATABASE"], [j["employer_id"] for j in jobs.values()])
         applications = []
         for a in apps:
-            job = get_job_by_id(app.config["DATABASE"], a["job_id"])
-            employer = None
-            if job:
-                employer = get_user_by_id(app.config["DATABASE"], job.get("employer_id"))
+            job = jobs.get(a["job_id"])
+            employer = employers.get(job.get("employer_id")) if job else None
             applications.append({"application": a, "job": job, "employer": employer})
         return render_template("contractor_dashboard.html", applications=applications)
     except Exception:
-        app.logger.exception("Failed to load contractor dashboard")
+        current_app.logger.exception("Failed to load contractor dashboard")
         flash("Unable to load your dashboard right now.", "danger")
         return redirect(url_for("index"))
 
-@app.route(f"/admin/{ADMIN_SECRET_TOKEN}/signup", methods=["GET", "POST"])
+@route(f"/admin/{ADMIN_SECRET_TOKEN}/signup", methods=["GET", "POST"])
 def admin_signup_secret():
     # Hidden signup path to create admin accounts
     if current_user.is_authenticated:
@@ -517,13 +780,13 @@ def admin_signup_secret():
             flash(reason, "danger")
             return render_template("admin_signup.html")
 
-        existing = get_user_by_email(app.config["DATABASE"], email)
+        existing = get_user_by_email(current_app.config["DATABASE"], email)
         if existing:
             flash("Account exists.", "warning")
             return render_template("admin_signup.html")
         password_hash = generate_password_hash(password)
         try:
-            user = create_user(app.config["DATABASE"], email, password_hash, role="admin", verified=1)
+            user = create_user(current_app.config["DATABASE"], email, password_hash, role="admin", verified=1)
         except sqlite3.IntegrityError:
             flash("Account with that email already exists.", "warning")
             return render_template("admin_signup.html")
@@ -533,7 +796,7 @@ def admin_signup_secret():
         return redirect(url_for("admin_dashboard"))
     return render_template("admin_signup.html")
 
-@app.route("/signin", methods=["GET", "POST"])
+@route("/signin", methods=["GET", "POST"])
 def signin():
     if current_user.is_authenticated:
         return redirect(url_for("profile"))
@@ -546,10 +809,10 @@ def signin():
 
         if email and from_signup:
             # only if we came from signup with an email
-            user_row = get_user_by_email(app.config["DATABASE"], email)
+            user_row = get_user_by_email(current_app.config["DATABASE"], email)
             if user_row and not user_row.get("verified"):
                 info = get_latest_token_for_email(
-                    app.config["DATABASE"], email, purpose="verify"
+                    current_app.config["DATABASE"], email, purpose="verify"
                 )
                 if info:
                     expires_at = info.get("expires_at")
@@ -577,7 +840,7 @@ def signin():
             flash("Email and password are required.", "danger")
             return render_template("signin.html", email=email)
 
-        user_row = get_user_by_email(app.config["DATABASE"], email)
+        user_row = get_user_by_email(current_app.config["DATABASE"], email)
         if not user_row:
             flash("Invalid credentials.", "danger")
             return render_template("signin.html", email=email)
@@ -604,7 +867,7 @@ def signin():
 
         # Check verified
         if not user_row.get("verified"):
-            info = get_latest_token_for_email(app.config["DATABASE"], email, purpose="verify")
+            info = get_latest_token_for_email(current_app.config["DATABASE"], email, purpose="verify")
 
             if info:
                 seconds_remaining = None
@@ -626,10 +889,10 @@ def signin():
 
             # no valid token, create a new one and send
             token = create_token(
-                app.config["DATABASE"],
+                current_app.config["DATABASE"],
                 email,
                 purpose="verify",
-                expires_seconds=app.config.get("EMAIL_VERIFY_EXPIRATION", 72 * 3600),
+                expires_seconds=current_app.config.get("EMAIL_VERIFY_EXPIRATION", 72 * 3600),
             )
 
             send_verification_email(user_row, token)
@@ -654,7 +917,7 @@ def signin():
         return redirect(url_for("profile"))
 
 
-@app.route("/admin/conversation/view")
+@route("/admin/conversation/view")
 @require_roles("admin")
 def admin_conversation_view():
     """
@@ -676,20 +939,20 @@ def admin_conversation_view():
         return redirect(url_for('admin_reports_page'))
     
     # Get users
-    user_a = get_user_by_id(app.config["DATABASE"], user_a_id)
-    user_b = get_user_by_id(app.config["DATABASE"], user_b_id)
+    user_a = get_user_by_id(current_app.config["DATABASE"], user_a_id)
+    user_b = get_user_by_id(current_app.config["DATABASE"], user_b_id)
     
     # Get conversation messages
-    messages = get_conversation_rows(app.config["DATABASE"], user_a_id, user_b_id)
+    messages = get_conversation_rows(current_app.config["DATABASE"], user_a_id, user_b_id)
     
     # Get report info if report_id is provided
     report_info = None
     if report_id:
         try:
-            report_info = get_report_by_id(app.config["DATABASE"], int(report_id))
+            report_info = get_report_by_id(current_app.config["DATABASE"], int(report_id))
             if report_info:
                 # Add user objects to report info
-                report_info["reporter"] = get_user_by_id(app.config["DATABASE"], report_info["reporter_id"])
+                report_info["reporter"] = get_user_by_id(current_app.config["DATABASE"], report_info["reporter_id"])
         except Exception:
             pass
     
@@ -702,7 +965,7 @@ def admin_conversation_view():
         messages=messages,
         report_info=report_info
     )
-@app.route("/admin/conversation/delete", methods=["POST"])
+@route("/admin/conversation/delete", methods=["POST"])
 @require_roles("admin")
 def admin_delete_conversation():
     """
@@ -716,22 +979,16 @@ def admin_delete_conversation():
         return redirect(url_for('admin_reports_page'))
     
     try:
-        conn = sqlite3.connect(app.config["DATABASE"])
-        conn.execute(
-            "DELETE FROM messages WHERE (sender_id = ? AND recipient_id = ?) OR (sender_id = ? AND recipient_id = ?)",
-            (int(user_a_id), int(user_b_id), int(user_b_id), int(user_a_id))
-        )
-        conn.commit()
-        conn.close()
+        delete_conversation(current_app.config["DATABASE"], int(user_a_id), int(user_b_id))
         
         flash("Conversation deleted successfully", "success")
     except Exception as e:
-        app.logger.exception("Failed to delete conversation")
+        current_app.logger.exception("Failed to delete conversation")
         flash("Failed to delete conversation", "danger")
     
     return redirect(url_for('admin_reports_page'))
 
-@app.route("/rate/user/<int:user_id>", methods=["POST"])
+@route("/rate/user/<int:user_id>", methods=["POST"])
 @login_required
 def rate_user(user_id):
     # Prevent users rating themselves
@@ -746,7 +1003,7 @@ def rate_user(user_id):
         return redirect(url_for("profile", user_id=user_id))
 
     # Validate target exists
-    row = get_user_by_id(app.config["DATABASE"], user_id)
+    row = get_user_by_id(current_app.config["DATABASE"], user_id)
     if not row:
         flash("User not found.", "warning")
         return redirect(url_for("index"))
@@ -765,7 +1022,7 @@ def rate_user(user_id):
 
     # create_rating(db_path, target_type, target_id, rater_id, rating, comment=None)
     try:
-        create_rating(app.config["DATABASE"], "user", user_id, current_id, rating, comment)
+        create_rating(current_app.config["DATABASE"], "user", user_id, current_id, rating, comment)
         flash("Rating submitted.", "success")
     except Exception as e:
         # Defensive: report an error if DB insert fails
@@ -773,20 +1030,20 @@ def rate_user(user_id):
 
     return redirect(url_for("profile", user_id=user_id))
 
-@app.route("/resend-verify", methods=["POST"])
+@route("/resend-verify", methods=["POST"])
 def resend_verify():
     email = request.form.get("email", "").strip().lower()
     if not email:
         flash("Email required.", "danger")
         return redirect(url_for("signin"))
-    user_row = get_user_by_email(app.config["DATABASE"], email)
+    user_row = get_user_by_email(current_app.config["DATABASE"], email)
     if not user_row:
         flash("No account found with that email.", "warning")
         return redirect(url_for("signin"))
     if user_row.get("verified"):
         flash("Account already verified. Please sign in.", "info")
         return redirect(url_for("signin"))
-    token = create_token(app.config["DATABASE"], email, purpose="verify", expires_seconds=app.config.get("EMAIL_VERIFY_EXPIRATION", 72 * 3600))
+    token = create_token(current_app.config["DATABASE"], email, purpose="verify", expires_seconds=current_app.config.get("EMAIL_VERIFY_EXPIRATION", 72 * 3600))
     verify_url = url_for("verify_email", token=token, _external=True)
     text = f"Please verify your email by visiting: {verify_url}"
     html = f"<p>Please verify your email by clicking <a href='{verify_url}'>this link</a>.</p>"
@@ -795,14 +1052,14 @@ def resend_verify():
     return redirect(url_for("signin"))
 
 
-@app.route("/verify-email/<token>")
+@route("/verify-email/<token>")
 def verify_email(token):
-    email = consume_token(app.config["DATABASE"], token, purpose="verify")
+    email = consume_token(current_app.config["DATABASE"], token, purpose="verify")
     if not email:
         flash("Verification link is invalid or has expired.", "danger")
         return redirect(url_for("signin"))
     # mark verified
-    ok = set_user_verified(app.config["DATABASE"], email)
+    ok = set_user_verified(current_app.config["DATABASE"], email)
     if ok:
         flash("Email verified. You may now sign in.", "success")
     else:
@@ -810,19 +1067,19 @@ def verify_email(token):
     return redirect(url_for("signin"))
 
 
-@app.route("/forgot-password", methods=["GET", "POST"])
+@route("/forgot-password", methods=["GET", "POST"])
 def forgot_password():
     if request.method == "POST":
         email = request.form.get("email", "").strip().lower()
         if not email:
             flash("Email is required.", "danger")
             return render_template("forgot_password.html")
-        user_row = get_user_by_email(app.config["DATABASE"], email)
+        user_row = get_user_by_email(current_app.config["DATABASE"], email)
         if not user_row:
             # don't reveal account existence
             flash("If that email exists, a password reset link has been sent.", "info")
             return redirect(url_for("signin"))
-        token = create_token(app.config["DATABASE"], email, purpose="reset", expires_seconds=app.config.get("PASSWORD_RESET_EXPIRATION", 3600))
+        token = create_token(current_app.config["DATABASE"], email, purpose="reset", expires_seconds=current_app.config.get("PASSWORD_RESET_EXPIRATION", 3600))
         reset_url = url_for("reset_password", token=token, _external=True)
         text = f"To reset your password, visit: {reset_url}\nIf you did not request this, ignore this message."
         html = f"<p>To reset your password, click <a href='{reset_url}'>this link</a>.</p>"
@@ -832,18 +1089,18 @@ def forgot_password():
     return render_template("forgot_password.html")
 
 
-@app.route("/reset-password/<token>", methods=["GET", "POST"])
+@route("/reset-password/<token>", methods=["GET", "POST"])
 def reset_password(token):
     # GET: validate token without consuming so user can see the form.
     if request.method == "GET":
-        info = get_token_info(app.config["DATABASE"], token, purpose="reset")
+        info = get_token_info(current_app.config["DATABASE"], token, purpose="reset")
         if not info:
             flash("Password reset link is invalid or has expired.", "danger")
             return redirect(url_for("forgot_password"))
         return render_template("reset_password.html", token=token)
 
     # POST: consume the token (one-time) and update password
-    email = consume_token(app.config["DATABASE"], token, purpose="reset")
+    email = consume_token(current_app.config["DATABASE"], token, purpose="reset")
     if not email:
         flash("Password reset link is invalid or has expired.", "danger")
         return redirect(url_for("forgot_password"))
@@ -863,12 +1120,12 @@ def reset_password(token):
         return render_template("reset_password.html", token=token)
 
     password_hash = generate_password_hash(password)
-    update_user_password(app.config["DATABASE"], email, password_hash)
+    update_user_password(current_app.config["DATABASE"], email, password_hash)
     flash("Password has been reset. You may sign in now.", "success")
     return redirect(url_for("signin"))
 
 
-@app.route("/logout")
+@route("/logout")
 @login_required
 def logout():
     logout_user()
@@ -881,7 +1138,7 @@ def update_report_status(db_path, report_id, status):
     """
     Update the status of a report.
     """
-    conn = sqlite3.connect(db_path)
+    conn = get_connection(db_path)
     try:
         conn.execute(
             "UPDATE message_reports SET status = ? WHERE id = ?",
@@ -898,7 +1155,7 @@ def update_report_status(db_path, report_id, status):
 from flask import send_from_directory, abort
 import os
 
-@app.route("/uploads/<path:filename>")
+@route("/uploads/<path:filename>")
 @login_required
 def uploaded_file(filename):
     """
@@ -940,13 +1197,14 @@ def _save_uploaded(f):
     filename_unique = f"{ts}_u{uid}_{base}{ext}"
     dest_path = os.path.join(UPLOAD_DIR, filename_unique)
     try:
+        os.makedirs(UPLOAD_DIR, exist_ok=True)
         f.save(dest_path)
     except Exception as e:
-        app.logger.exception("Failed to save uploaded file: %s", e)
+        current_app.logger.exception("Failed to save uploaded file: %s", e)
         return None
     return filename_unique
 
-@app.route("/apply/<int:job_id>", methods=["POST"])
+@route("/apply/<int:job_id>", methods=["POST"])
 @login_required
 def apply_job(job_id):
     # Ensure current_user id is valid
@@ -968,7 +1226,7 @@ def apply_job(job_id):
         return redirect(url_for("job_detail", job_id=job_id))
 
     # Ensure job exists
-    job = get_job_by_id(app.config["DATABASE"], job_id)
+    job = get_job_by_id(current_app.config["DATABASE"], job_id)
     if not job:
         flash("Job not found.", "warning")
         return redirect(url_for("jobs_list"))
@@ -982,19 +1240,6 @@ def apply_job(job_id):
         flash("You cannot apply to your own job.", "warning")
         return redirect(url_for("job_detail", job_id=job_id))
 
-    # Prevent duplicate applications
-    try:
-        apps = get_applications_by_job(app.config["DATABASE"], job_id) or []
-    except Exception:
-        apps = []
-    for a in apps:
-        try:
-            if int(a.get("user_id") or a["user_id"]) == current_id:
-                flash("You have already applied for this job.", "info")
-                return redirect(url_for("job_detail", job_id=job_id))
-        except Exception:
-            continue
-
     # Save uploaded files (uses _save_uploaded helper which should be defined once)
     cover_file = request.files.get("cover_letter_file")
     resume_file = request.files.get("resume_file")
@@ -1016,13 +1261,11 @@ def apply_job(job_id):
     cover_letter_text = (request.form.get("cover_letter") or "").strip() or None
     resume_text = (request.form.get("resume_text") or "").strip() or None
 
-    # Save application to DB (store filenames). Be defensive about model signatures.
-    app_record = None
-    app_id = None
+    # Save application to DB (store filenames). No retry on error: a write that timed out
+    # may still commit, so the uploaded files are kept for it.
     try:
-        # Preferred: model supports storing file paths
         app_record = create_application(
-            app.config["DATABASE"],
+            current_app.config["DATABASE"],
             job_id,
             current_id,
             cover_letter=cover_letter_text,
@@ -1030,66 +1273,25 @@ def apply_job(job_id):
             cover_letter_path=cover_letter_filename,
             resume_path=resume_filename,
         )
-        # create_application is expected to return a dict with id, but handle other shapes defensively
-        if isinstance(app_record, dict):
-            app_id = app_record.get("id") or app_record.get("app_id") or app_record.get("application_id")
-    except TypeError:
-        # model likely has older signature without file path args; fall back
-        try:
-            app_record = create_application(app.config["DATABASE"], job_id, current_id, cover_letter_text, resume_text)
-            if isinstance(app_record, dict):
-                app_id = app_record.get("id") or app_record.get("app_id") or app_record.get("application_id")
-        except Exception:
-            flash("Unable to save your application. Please try again.", "danger")
-            return redirect(url_for("job_detail", job_id=job_id))
     except Exception:
-        # any other error while creating the application
-        try:
-            app_record = create_application(app.config["DATABASE"], job_id, current_id, cover_letter_text, resume_text)
-            if isinstance(app_record, dict):
-                app_id = app_record.get("id") or app_record.get("app_id") or app_record.get("application_id")
-        except Exception:
-            flash("Unable to save your application. Please try again.", "danger")
-            return redirect(url_for("job_detail", job_id=job_id))
-
-    # If create_application didn't already persist file-path columns but the DB supports them,
-    # update the new application row with the stored filenames.
-    if app_id and (cover_letter_filename or resume_filename):
-        try:
-            import sqlite3
-
-            db_path = app.config["DATABASE"]
-            conn = sqlite3.connect(db_path)
-            cur = conn.cursor()
-
-            # find columns on the applications table
-            cur.execute("PRAGMA table_info(applications)")
-            cols = [r[1] for r in cur.fetchall()]  # column name is at index 1
-
-            updates = []
-            params = []
-            if "cover_letter_path" in cols and cover_letter_filename:
-                updates.append("cover_letter_path = ?")
-                params.append(cover_letter_filename)
-            if "resume_path" in cols and resume_filename:
-                updates.append("resume_path = ?")
-                params.append(resume_filename)
-
-            if updates:
-                params.append(app_id)
-                sql = "UPDATE applications SET " + ", ".join(updates) + " WHERE id = ?"
-                cur.execute(sql, params)
-                conn.commit()
+        current_app.logger.exception("Failed to save application for job %s", job_id)
+        flash("Unable to save your application. Please try again.", "danger")
+        return redirect(url_for("job_detail", job_id=job_id))
 
-            conn.close()
-        except Exception:
-            # Non-fatal — if this fails we still continue (files may still be inaccessible
-            # if DB/schema doesn't match; handle that separately by migrating schema).
-            app.logger.exception("Failed to persist uploaded filenames for application %s", app_id)
+    # create_application returns None when the UNIQUE(job_id, user_id) index rejects a duplicate
+    if app_record is None:
+        for name in (cover_letter_filename, resume_filename):
+            if name:
+                try:
+                    os.remove(os.path.join(UPLOAD_DIR, name))
+                except OSError:
+                    pass
+        flash("You have already applied for this job.", "info")
+        return redirect(url_for("job_detail", job_id=job_id))
 
     # Notify employer (best-effort)
     try:
-        employer = get_user_by_id(app.config["DATABASE"], int(employer_id))
+        employer = get_user_by_id(current_app.config["DATABASE"], int(employer_id))
         if employer and employer.get("email"):
             subject = f"New application for: {job.get('title') or getattr(job, 'title', '')}"
             applicant_name = getattr(current_user, "username", None) or getattr(current_user, "first_name", "") or getattr(current_user, "email", "")
@@ -1109,14 +1311,14 @@ def apply_job(job_id):
         except Exception:
             return redirect(url_for("job_detail", job_id=job_id))
 
-@app.context_processor
+@site.app_context_processor
 def inject_tile_settings():
     """
     Provide TILE_URL and TILE_ATTRIBUTION for the map template.
     - If MAPTILER_KEY is present in env/app.config, use MapTiler (recommended).
     - Otherwise fall back to the public OSM tiles (rate-limited).
     """
-    key = os.environ.get("MAPTILER_KEY") or app.config.get("MAPTILER_KEY")
+    key = os.environ.get("MAPTILER_KEY") or current_app.config.get("MAPTILER_KEY")
     if key:
         # MapTiler example (requires free account / key)
         tile_url = f"https://api.maptiler.com/maps/streets/{{z}}/{{x}}/{{y}}.png?key={key}"
@@ -1129,16 +1331,16 @@ def inject_tile_settings():
 
 # Profile view: allow public access to view any user's profile and show ratings.
 # Also keep existing behavior for viewing your own profile when signed in.
-@app.route("/profile")
-@app.route("/profile/<int:user_id>")
+@route("/profile")
+@route("/profile/<int:user_id>")
 def profile(user_id=None):
     """
     Render a user's profile page.
     - If user_id is provided, show that user's profile (public).
     - If not provided, require authentication and show current user's profile.
-    - Collect ratings for the target user and compute an average for display.
+    - Show the target user's rating summary and one page of their ratings.
     """
-    db_path = app.config.get("DATABASE")
+    db_path = current_app.config.get("DATABASE")
 
     # Determine which user to display
     if user_id is None:
@@ -1159,73 +1361,43 @@ def profile(user_id=None):
     if not user_row:
         abort(404)
 
-    # Load ratings for this user (non-fatal if it fails)
+    # Average and histogram come from rating_aggregates; the reviews themselves are paged
+    # newest first with an ?after=<created_at>,<rating id> cursor (non-fatal if it fails)
+    summary = {"avg": None, "count": 0, "histogram": {}}
     ratings = []
-    avg_rating = None
-    try:
-        rows = get_ratings_for_target(db_path, "user", target_id) or []
-        total = 0
-        count = 0
-        for r in rows:
-            # normalize rating value
-            try:
-                r_rating = int(r.get("rating") if isinstance(r, dict) else r.rating)
-            except Exception:
-                continue
-            total += r_rating
-            count += 1
-
-            # attach rater email for display if possible (best-effort)
-            rater_id = r.get("rater_id") if isinstance(r, dict) else getattr(r, "rater_id", None)
-            rater_email = None
-            try:
-                if rater_id:
-                    rr = get_user_by_id(db_path, int(rater_id))
-                    if rr:
-                        rater_email = rr.get("email") if isinstance(rr, dict) else getattr(rr, "email", None)
-            except Exception:
-                rater_email = None
-
-            # ensure template can access these keys
-            if isinstance(r, dict):
-                r["rater_email"] = rater_email
-            else:
-                # if r is an object-like row, try to set attribute (best-effort)
-                try:
-                    setattr(r, "rater_email", rater_email)
-                except Exception:
-                    pass
-
-            ratings.append(r)
-
-        if count > 0:
-            avg_rating = float(total) / float(count)
+    next_url = None
+    after = _parse_jobs_cursor(request.args.get("after"))
+    per_page = max(min(request.args.get("per_page", 20, type=int), 100), 1)
+    try:
+        summary = get_rating_summary(db_path, "user", target_id)
+        rows = get_ratings_for_target(db_path, "user", target_id, limit=per_page + 1, after=after)
+        ratings = rows[:per_page]
+        if len(rows) > per_page:
+            last = ratings[-1]
+            next_url = url_for("profile", user_id=target_id, after="%s,%s" % (last["created_at"], last["id"]), per_page=per_page)
     except Exception:
         # ignore rating loading errors but log
-        app.logger.exception("Failed to load ratings for user %s", target_id)
+        current_app.logger.exception("Failed to load ratings for user %s", target_id)
         ratings = []
-        avg_rating = None
+    first_url = url_for("profile", user_id=target_id) if after else None
 
     # Render the profile template (template already contains logic to show rating form only when
     # current_user is authenticated and viewing another user's profile)
-    return render_template("profile.html", user=user_row, avg_rating=avg_rating, ratings=ratings)
+    return render_template(
+        "profile.html",
+        user=user_row,
+        avg_rating=summary["avg"],
+        rating_summary=summary,
+        ratings=ratings,
+        next_url=next_url,
+        first_url=first_url,
+    )
 
 
 #
 # Jobs listing + filtering
 #
-def haversine_miles(lat1, lon1, lat2, lon2):
-    # returns distance in miles between two points
-    R = 3958.8  # Earth radius in miles
-    phi1 = math.radians(lat1)
-    phi2 = math.radians(lat2)
-    dphi = math.radians(lat2 - lat1)
-    dlambda = math.radians(lon2 - lon1)
-    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-    return R * c
-
-@app.route("/job/<int:job_id>/applicants")
+@route("/job/<int:job_id>/applicants")
 @login_required
 def job_applicants(job_id):
     """
@@ -1239,7 +1411,7 @@ def job_applicants(job_id):
         return redirect(url_for("index"))
 
     # Load job
-    job = get_job_by_id(app.config["DATABASE"], job_id)
+    job = get_job_by_id(current_app.config["DATABASE"], job_id)
     if not job:
         flash("Job not found.", "warning")
         return redirect(url_for("jobs_list"))
@@ -1258,11 +1430,29 @@ def job_applicants(job_id):
         return redirect(url_for("job_detail", job_id=job_id))
 
     # Load applications (get_applications_by_job returns rows that include applicant_email, cover_letter_path, resume_path)
-    applications = get_applications_by_job(app.config["DATABASE"], job_id) or []
+    applications = get_applications_by_job(current_app.config["DATABASE"], job_id) or []
 
     return render_template("job_applicants.html", job=job, applications=applications)
 
-@app.route("/jobs")
+def _parse_jobs_cursor(value, numeric=False):
+    """
+    Parse an ?after=<sort value>,<job id> keyset cursor from the jobs listing; numeric=True
+    for the distance sort. A malformed cursor gives None (the first page).
+    """
+    if not value:
+        return None
+    sort_value, _, job_id = value.rpartition(",")
+    try:
+        if numeric:
+            sort_value = float(sort_value)
+            if math.isnan(sort_value):
+                return None
+        return sort_value, int(job_id)
+    except ValueError:
+        return None
+
+
+@route("/jobs")
 @login_required
 def jobs_list():
     q = (request.args.get("q") or "").strip().lower()
@@ -1270,7 +1460,7 @@ def jobs_list():
     remote_only = request.args.get("remote", "").lower() in ("1", "true", "yes", "on")
     page = max(int(request.args.get("page", 1)), 1)
     per_page = max(min(int(request.args.get("per_page", 20)), 100), 1)
-    sort = (request.args.get("sort") or "date").lower()
+    sort = (request.args.get("sort") or ("relevance" if q else "date")).lower()
 
     lat = request.args.get("lat")
     lng = request.args.get("lng")
@@ -1288,58 +1478,76 @@ def jobs_list():
     except ValueError:
         radius_miles = None
 
-    all_jobs = get_jobs(app.config["DATABASE"])
-    filtered = []
-    for j in all_jobs:
-        include = True
-        if q:
-            in_title = q in (j.get("title") or "").lower()
-            in_descr = q in (j.get("description") or "").lower()
-            in_tags = q in (j.get("tags") or "").lower() if j.get("tags") else False
-            include = in_title or in_descr or in_tags
-        if not include:
-            continue
-
-        if tags_q:
-            wanted = [t.strip() for t in tags_q.split(",") if t.strip()]
-            job_tags = (j.get("tags") or "").lower()
-            if not any(w in job_tags.split(",") or w in job_tags for w in wanted):
-                continue
-
-        if remote_only:
-            job_tags = (j.get("tags") or "").lower()
-            if "remote" not in job_tags:
-                continue
-
-        jlat = j.get("lat")
-        jlng = j.get("lng")
-        if center_lat is not None and jlat is not None and jlng is not None and jlat != "" and jlng != "":
-            try:
-                jlat_f = float(jlat)
-                jlng_f = float(jlng)
-                dist = haversine_miles(center_lat, center_lng, jlat_f, jlng_f)
-                j["_distance_miles"] = round(dist, 2)
-                if radius_miles is not None and dist > radius_miles:
-                    continue
-            except Exception:
-                j["_distance_miles"] = None
+    db_path = current_app.config["DATABASE"]
+    start = (page - 1) * per_page
+    filters = dict(q=q, tags=tags_q, remote_only=remote_only)
+    geo_filtered = center_lat is not None and (radius_miles is not None or sort == "distance")
+    after = _parse_jobs_cursor(request.args.get("after"), numeric=geo_filtered and sort == "distance")
+    next_cursor = None
+    has_more = False
+
+    if geo_filtered:
+        # Distances only need id/lat/lng: rank the (R*Tree-narrowed) points, cut one page
+        # after the cursor, then load full rows for that page alone.
+        bbox = bbox_for_radius(center_lat, center_lng, radius_miles) if radius_miles is not None else None
+        by_distance = sort == "distance"
+        by_relevance = sort == "relevance" and bool(q)
+        order = "id" if by_distance else ("relevance" if by_relevance else "date")
+        points = get_job_points(db_path, bbox=bbox, order=order, **filters)
+        ranked = distance_engine.rank(center_lat, center_lng, points, radius=radius_miles, by_distance=by_distance)
+        total = len(ranked)
+        if by_relevance:
+            # bm25 order has no cheap keyset, as below: paged by offset
+            after = None
+        elif by_distance:
+            key = lambda item: (item[1] if item[1] is not None else math.inf, item[0]["id"])
+            if after is not None:
+                ranked = [item for item in ranked if key(item) > after]
         else:
-            j["_distance_miles"] = None
-
-        filtered.append(j)
-
-    if sort == "distance" and center_lat is not None:
-        filtered.sort(key=lambda x: (x.get("_distance_miles") is None, x.get("_distance_miles") or 99999))
+            key = lambda item: (item[0]["created_at"] or "", item[0]["id"])
+            if after is not None:
+                ranked = [item for item in ranked if key(item) < after]
+        if after is None:
+            ranked = ranked[start:]
+        page_items = ranked[:per_page]
+        has_more = len(ranked) > per_page
+        if has_more and page_items and not by_relevance:
+            next_cursor = key(page_items[-1])
+        rows_by_id = get_jobs_by_ids(db_path, [p["id"] for p, _ in page_items])
+        page_jobs = []
+        for p, dist in page_items:
+            j = rows_by_id.get(p["id"])
+            if j is None:
+                continue
+            j["_distance_miles"] = round(dist, 2) if dist is not None else None
+            page_jobs.append(j)
     else:
-        filtered.sort(key=lambda x: x.get("created_at") or "", reverse=True)
-
-    total = len(filtered)
-    start = (page - 1) * per_page
-    end = start + per_page
-    page_jobs = filtered[start:end]
+        if sort == "relevance" and q:
+            # bm25 order has no cheap keyset, text matches are paged by offset
+            rows = get_jobs(db_path, order="relevance", limit=per_page + 1, offset=start, **filters)
+        else:
+            rows = get_jobs(db_path, limit=per_page + 1, after=after, offset=0 if after else start, **filters)
+        page_jobs = rows[:per_page]
+        if len(rows) > per_page and not (sort == "relevance" and q):
+            next_cursor = (page_jobs[-1]["created_at"] or "", page_jobs[-1]["id"])
+        has_more = len(rows) > per_page
+        total = count_jobs(db_path, **filters)
+        if center_lat is not None:
+            ranked = distance_engine.rank(center_lat, center_lng, page_jobs)
+        else:
+            ranked = [(j, None) for j in page_jobs]
+        for j, dist in ranked:
+            j["_distance_miles"] = round(dist, 2) if dist is not None else None
 
     query_args = dict(request.args)
     query_args.pop("page", None)
+    query_args.pop("after", None)
+    next_url = None
+    if next_cursor is not None:
+        next_url = url_for("jobs_list", after="%s,%s" % (repr(next_cursor[0]) if isinstance(next_cursor[0], float) else next_cursor[0], next_cursor[1]), **query_args)
+    elif sort == "relevance" and q and has_more:
+        next_url = url_for("jobs_list", page=page + 1, **query_args)
+    first_url = url_for("jobs_list", **query_args) if (after is not None or page > 1) else None
 
     return render_template(
         "jobs_list.html",
@@ -1355,11 +1563,13 @@ def jobs_list():
         radius_miles=radius_miles,
         sort=sort,
         query_args=query_args,
+        next_url=next_url,
+        first_url=first_url,
     )
 
 
 # Add client location, map, API endpoints (map and job APIs)
-@app.route("/_client_location")
+@route("/_client_location")
 def client_location():
     ip = request.headers.get("X-Forwarded-For", request.remote_addr)
     if ip and "," in ip:
@@ -1367,6 +1577,8 @@ def client_location():
     if ip in ("127.0.0.1", "::1", "localhost"):
         return jsonify(ok=False)
     try:
+        import requests  # imported on first use; most workers never need the HTTP client
+
         resp = requests.get(f"https://ipapi.co/{ip}/json/", timeout=5)
         resp.raise_for_status()
         j = resp.json()
@@ -1378,12 +1590,11 @@ def client_location():
             return jsonify(ok=False)
         return jsonify(ok=True, lat=float(lat), lon=float(lon), city=city, region=region)
     except Exception as e:
-        app.logger.debug("Client location lookup failed for ip %s: %s", ip, e)
+        current_app.logger.debug("Client location lookup failed for ip %s: %s", ip, e)
         return jsonify(ok=False)
 
 UPLOAD_SUBDIR = "uploads"
 UPLOAD_DIR = os.path.join(os.path.abspath(os.path.dirname(__file__)), "static", UPLOAD_SUBDIR)
-os.makedirs(UPLOAD_DIR, exist_ok=True)
 
 ALLOWED_EXTENSIONS = {"pdf"}
 ALLOWED_MIMES = {"application/pdf"}
@@ -1405,30 +1616,18 @@ def _allowed_file(filename, content_type):
     return True
 
 
-@app.route("/map")
+@route("/map")
 @login_required
 def map_view():
     return render_template("map.html")
 
 
-# -- Short address helpers --
-US_STATES = {
-    "alabama":"AL","alaska":"AK","arizona":"AZ","arkansas":"AR","california":"CA","colorado":"CO",
-    "connecticut":"CT","delaware":"DE","florida":"FL","georgia":"GA","hawaii":"HI","idaho":"ID",
-    "illinois":"IL","indiana":"IN","iowa":"IA","kansas":"KS","kentucky":"KY","louisiana":"LA",
-    "maine":"ME","maryland":"MD","massachusetts":"MA","michigan":"MI","minnesota":"MN","mississippi":"MS",
-    "missouri":"MO","montana":"MT","nebraska":"NE","nevada":"NV","new hampshire":"NH","new jersey":"NJ",
-    "new mexico":"NM","new york":"NY","north carolina":"NC","north dakota":"ND","ohio":"OH",
-    "oklahoma":"OK","oregon":"OR","pennsylvania":"PA","rhode island":"RI","south carolina":"SC",
-    "south dakota":"SD","tennessee":"TN","texas":"TX","utah":"UT","vermont":"VT","virginia":"VA",
-    "washington":"WA","west virginia":"WV","wisconsin":"WI","wyoming":"WY","district of columbia":"DC"
-}
 def create_simple_warning(db_path, user_id, message):
     """
     Create a simple warning for a user.
     """
-    now = datetime.utcnow().isoformat()
-    conn = sqlite3.connect(db_path)
+    now = utc_now_iso()
+    conn = get_connection(db_path)
     try:
         conn.execute(
             "INSERT INTO user_warnings (user_id, message, created_at) VALUES (?, ?, ?)",
@@ -1445,8 +1644,7 @@ def get_user_warnings(db_path, user_id):
     """
     Get warnings for a user.
     """
-    conn = sqlite3.connect(db_path)
-    conn.row_factory = sqlite3.Row
+    conn = get_connection(db_path)
     try:
         rows = conn.execute(
             "SELECT * FROM user_warnings WHERE user_id = ?",
@@ -1456,68 +1654,7 @@ def get_user_warnings(db_path, user_id):
     finally:
         conn.close()
 
-def _lookup_us_state_abbrev(name):
-    if not name:
-        return None
-    n = name.strip().lower()
-    if len(n) == 2 and n.upper() in US_STATES.values():
-        return n.upper()
-    if n in US_STATES:
-        return US_STATES[n]
-    return None
-
-def short_addr_from_display(display_name):
-    if not display_name:
-        return ""
-    parts = [p.strip() for p in display_name.split(",") if p.strip()]
-    if not parts:
-        return ""
-    street = parts[0]
-    city = None
-    state = None
-    if len(parts) >= 2:
-        city = parts[1]
-    candidates = []
-    if len(parts) >= 3:
-        candidates.extend(parts[2:5])
-    else:
-        candidates.extend(parts[1:])
-    for c in candidates:
-        if not c:
-            continue
-        if c.replace(" ", "").isdigit():
-            continue
-        abbrev = _lookup_us_state_abbrev(c)
-        if abbrev:
-            state = abbrev
-            break
-        first_tok = c.split()[0]
-        abbrev = _lookup_us_state_abbrev(first_tok)
-        if abbrev:
-            state = abbrev
-            break
-    if state is None:
-        if len(parts) >= 3:
-            region = parts[2]
-            if region and region.lower() != parts[-1].lower():
-                state = region
-            else:
-                state = parts[-2] if len(parts) >= 2 else None
-        else:
-            state = None
-    out_parts = []
-    if street:
-        out_parts.append(street)
-    city_state = []
-    if city:
-        city_state.append(city)
-    if state:
-        city_state.append(state)
-    if city_state:
-        out_parts.append(", ".join(city_state))
-    return ", ".join(out_parts)
-
-@app.template_filter('short_addr')
+@site.app_template_filter('short_addr')
 def short_addr_filter(value):
     try:
         return short_addr_from_display(value) or ""
@@ -1525,35 +1662,220 @@ def short_addr_filter(value):
         return (value or "")
 
 
-@app.route("/api/jobs")
+# Fields of each job in /api/jobs, in output order; ?fields= picks a subset
+JOB_API_FIELDS = ("id", "employer_id", "title", "description", "location_text", "short_location", "lat", "lng", "salary", "tags", "created_at")
+
+
+def serialize_job(r):
+    lat_val = float(r["lat"]) if r.get("lat") not in (None, "") else None
+    lng_val = float(r["lng"]) if r.get("lng") not in (None, "") else None
+    return {
+        "id": r["id"],
+        "employer_id": r["employer_id"],
+        "title": r["title"],
+        "description": r["description"],
+        "location_text": r.get("location_text"),
+        "short_location": r.get("short_location") or "",
+        "lat": lat_val,
+        "lng": lng_val,
+        "salary": r.get("salary"),
+        "tags": r.get("tags"),
+        "created_at": r.get("created_at"),
+    }
+
+
+class JobsSnapshot:
+    """
+    Serialized /api/jobs bodies for the current jobs data version (models.get_data_version).
+    Any job write bumps the version, so the next request rebuilds the job list once and
+    every field selection is encoded at most once per version. The ETag is a hash of the
+    body, so it is the same in every worker process. There is no Last-Modified: a per-process
+    clock would differ between workers, and one-second resolution could answer a stale 304.
+    """
+
+    MAX_FIELD_SETS = 16
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._version = None
+        self._jobs = None
+        self._bodies = {}  # fields tuple -> entry dict (body, etag, compressed)
+
+    def get(self, fields=JOB_API_FIELDS):
+        version = get_data_version(self.db_path, "jobs")
+        with self._lock:
+            if self._jobs is None or version != self._version:
+                self._jobs = [serialize_job(r) for r in get_jobs(self.db_path)]
+                self._version = version
+                self._bodies = {}
+            entry = self._bodies.get(fields)
+            if entry is None:
+                jobs = self._jobs if fields == JOB_API_FIELDS else [{f: j[f] for f in fields} for j in self._jobs]
+                body = json.dumps({"ok": True, "jobs": jobs}, separators=(",", ":")).encode("utf-8")
+                entry = {
+                    "body": body,
+                    "etag": hashlib.sha1(body).hexdigest()[:20],
+                    "compressed": {},  # encoding -> body, filled by the compression hook
+                }
+                if len(self._bodies) >= self.MAX_FIELD_SETS:
+                    self._bodies.pop(next(iter(self._bodies)))
+                self._bodies[fields] = entry
+            return entry
+
+
+def _parse_job_fields(raw):
+    """?fields=id,title,lat,lng -> tuple in JOB_API_FIELDS order; None if any name is unknown."""
+    if not raw:
+        return JOB_API_FIELDS
+    wanted = {f.strip() for f in raw.split(",") if f.strip()}
+    if not wanted or not wanted <= set(JOB_API_FIELDS):
+        return None
+    return tuple(f for f in JOB_API_FIELDS if f in wanted)
+
+
+def stream_jobs(fmt, fields=JOB_API_FIELDS, after_id=None, batch_size=500):
+    """
+    Streamed job list: "ndjson" yields one JSON object per line, "json" yields the same
+    {"ok": true, "jobs": [...]} document as the snapshot, piece by piece. Rows are read
+    with iter_jobs(), so memory stays flat regardless of table size.
+    """
+    db_path = current_app.config["DATABASE"]  # the generators run after the request context is gone
+
+    def records():
+        for r in iter_jobs(db_path, after_id=after_id, batch_size=batch_size):
+            job = serialize_job(r)
+            yield json.dumps(job if fields == JOB_API_FIELDS else {f: job[f] for f in fields}, separators=(",", ":"))
+
+    def generate_ndjson():
+        batch = []
+        for line in records():
+            batch.append(line + "\n")
+            if len(batch) >= batch_size:
+                yield "".join(batch)
+                batch = []
+        if batch:
+            yield "".join(batch)
+
+    def generate_json():
+        yield '{"ok":true,"jobs":['
+        batch = []
+        first = True
+        for item in records():
+            batch.append(item if first else "," + item)
+            first = False
+            if len(batch) >= batch_size:
+                yield "".join(batch)
+                batch = []
+        yield "".join(batch) + "]}"
+
+    if fmt == "ndjson":
+        return Response(generate_ndjson(), mimetype="application/x-ndjson")
+    return Response(generate_json(), mimetype="application/json")
+
+
+@route("/api/jobs")
 @login_required
 def api_jobs():
+    """
+    Every job as JSON. ?fields= selects keys; ?format=ndjson or ?format=stream streams the
+    list (newline-delimited or as one chunked JSON array) instead of serving the snapshot.
+    """
+    fields = _parse_job_fields(request.args.get("fields"))
+    if fields is None:
+        return jsonify({"ok": False, "error": "Unknown field; allowed: " + ",".join(JOB_API_FIELDS)}), 400
+    fmt = request.args.get("format", "json")
+    if fmt in ("ndjson", "stream"):
+        return stream_jobs("ndjson" if fmt == "ndjson" else "json", fields)
+    try:
+        entry = jobs_snapshot.get(fields)
+    except Exception:
+        current_app.logger.exception("API /api/jobs failed")
+        return jsonify({"ok": False, "error": "Internal server error"}), 500
+    resp = Response(entry["body"], mimetype="application/json")
+    resp.set_etag(entry["etag"])
+    # private: the list is behind login; no-cache: always revalidate (cheap 304)
+    resp.cache_control.private = True
+    resp.cache_control.no_cache = True
+    resp.compressed_cache = entry["compressed"]
+    return resp.make_conditional(request)
+
+@route("/api/export/jobs")
+def api_export_jobs():
+    """
+    Bulk export for the downstream indexer: every job in id order as NDJSON (default) or a
+    chunked JSON array (?format=json). ?after_id= resumes an interrupted export, ?fields=
+    selects keys. Allowed for admins, or with "Authorization: Bearer <EXPORT_API_TOKEN>".
+    """
+    token = current_app.config.get("EXPORT_API_TOKEN")
+    auth = request.headers.get("Authorization", "")
+    if token and auth.startswith("Bearer ") and hmac.compare_digest(auth[7:].strip(), token):
+        return _export_jobs()
+    return require_roles("admin")(_export_jobs)()
+
+
+def _export_jobs():
+    fields = _parse_job_fields(request.args.get("fields"))
+    if fields is None:
+        return jsonify({"ok": False, "error": "Unknown field; allowed: " + ",".join(JOB_API_FIELDS)}), 400
     try:
-        rows = get_jobs(app.config["DATABASE"])
-        jobs = []
-        for r in rows:
-            lat_val = float(r["lat"]) if r.get("lat") not in (None, "") else None
-            lng_val = float(r["lng"]) if r.get("lng") not in (None, "") else None
-            loc_text = r.get("location_text")
-            jobs.append({
+        after_id = int(request.args.get("after_id") or 0)
+    except ValueError:
+        return jsonify({"ok": False, "error": "Invalid after_id"}), 400
+    fmt = "json" if request.args.get("format") == "json" else "ndjson"
+    return stream_jobs(fmt, fields, after_id=after_id)
+
+
+@route("/api/jobs/bbox")
+@login_required
+def api_jobs_bbox():
+    """
+    Jobs inside the map viewport (?south=&west=&north=&east=&zoom=). Low zooms return
+    clusters ({lat, lng, count}, plus id/title for single jobs); high zooms return markers.
+    """
+    try:
+        south = float(request.args["south"])
+        west = float(request.args["west"])
+        north = float(request.args["north"])
+        east = float(request.args["east"])
+        zoom = float(request.args.get("zoom", 0))
+    except (KeyError, ValueError):
+        return jsonify({"ok": False, "error": "south, west, north, east and zoom are required numbers"}), 400
+    if south > north or not (-90.0 <= south <= 90.0 and -90.0 <= north <= 90.0):
+        return jsonify({"ok": False, "error": "Invalid bounds"}), 400
+    # Leaflet reports longitudes past +/-180 when the map is panned around the world
+    if east - west >= 360.0:
+        west, east = -180.0, 180.0
+    else:
+        west = west if -180.0 <= west <= 180.0 else (west + 180.0) % 360.0 - 180.0
+        east = east if -180.0 <= east <= 180.0 else (east + 180.0) % 360.0 - 180.0
+    try:
+        if zoom >= current_app.config["MAP_CLUSTER_MAX_ZOOM"]:
+            limit = current_app.config["MAP_MARKER_LIMIT"]
+            ranges = [(west, east)] if west <= east else [(west, 180.0), (-180.0, east)]
+            rows = []
+            for w, e in ranges:
+                rows.extend(get_job_markers(current_app.config["DATABASE"], (south, north, w, e), limit=limit + 1 - len(rows)))
+            markers = [{
                 "id": r["id"],
-                "employer_id": r["employer_id"],
                 "title": r["title"],
-                "description": r["description"],
-                "location_text": loc_text,
-                "short_location": short_addr_from_display(loc_text),
-                "lat": lat_val,
-                "lng": lng_val,
-                "salary": r.get("salary"),
-                "tags": r.get("tags"),
-                "created_at": r.get("created_at"),
-            })
-        return jsonify({"ok": True, "jobs": jobs})
+                "lat": r["lat"],
+                "lng": r["lng"],
+                "short_location": r.get("short_location") or "",
+            } for r in rows[:limit]]
+            return jsonify({"ok": True, "mode": "markers", "markers": markers, "truncated": len(rows) > limit})
+        clusters = cluster_index.clusters(south, west, north, east, zoom)
+        titles = get_jobs_by_ids(current_app.config["DATABASE"], [c["id"] for c in clusters if "id" in c])
+        for c in clusters:
+            if "id" in c and c["id"] in titles:
+                c["title"] = titles[c["id"]]["title"]
+        return jsonify({"ok": True, "mode": "clusters", "clusters": clusters})
     except Exception:
-        app.logger.exception("API /api/jobs failed")
+        current_app.logger.exception("API /api/jobs/bbox failed")
         return jsonify({"ok": False, "error": "Internal server error"}), 500
 
-@app.route("/api/jobs_nearby")
+
+@route("/api/jobs_nearby")
 @login_required
 def api_jobs_nearby():
     try:
@@ -1574,107 +1896,41 @@ def api_jobs_nearby():
             except ValueError:
                 return jsonify({"ok": False, "error": "Invalid radius_miles"}), 400
 
-        rows = get_jobs(app.config["DATABASE"])
+        if center_lat is not None and radius is not None:
+            rows = get_jobs(current_app.config["DATABASE"], bbox=bbox_for_radius(center_lat, center_lng, radius))
+        else:
+            rows = get_jobs(current_app.config["DATABASE"])
+        if center_lat is not None:
+            ranked = distance_engine.rank(center_lat, center_lng, rows, radius=radius)
+        else:
+            ranked = [(r, None) for r in rows]
         out = []
-        for r in rows:
+        for r, dist in ranked:
             jlat = r.get("lat")
             jlng = r.get("lng")
-            dist = None
-            if center_lat is not None and jlat not in (None, "") and jlng not in (None, ""):
-                try:
-                    dist = haversine_miles(center_lat, center_lng, float(jlat), float(jlng))
-                except Exception:
-                    dist = None
-            if radius is not None and dist is not None and dist > radius:
-                continue
             out.append({
                 "id": r["id"],
                 "title": r["title"],
                 "lat": float(jlat) if jlat not in (None, "") else None,
                 "lng": float(jlng) if jlng not in (None, "") else None,
                 "location_text": r.get("location_text"),
-                "short_location": short_addr_from_display(r.get("location_text")),
+                "short_location": r.get("short_location") or "",
                 "tags": r.get("tags"),
                 "distance_miles": round(dist, 2) if dist is not None else None,
             })
         return jsonify({"ok": True, "jobs": out})
     except Exception:
-        app.logger.exception("API /api/jobs_nearby failed")
+        current_app.logger.exception("API /api/jobs_nearby failed")
         return jsonify({"ok": False, "error": "Internal server error"}), 500
 
 
 # --- Messaging & Reporting DB helpers ---
-def ensure_warnings_table():
-    """
-    Create simple warnings table.
-    """
-    sql = """
-    CREATE TABLE IF NOT EXISTS user_warnings (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user_id INTEGER NOT NULL,
-        message TEXT NOT NULL,
-        created_at TEXT NOT NULL
-    );
-    """
-    conn = sqlite3.connect(app.config["DATABASE"])
-    try:
-        conn.execute(sql)
-        conn.commit()
-    finally:
-        conn.close()
-
-ensure_warnings_table()
-
-def ensure_messages_table():
-    """
-    Create messages table if it doesn't exist.
-    Call this once on startup after init_db(...) has run.
-    """
-    sql = """
-    CREATE TABLE IF NOT EXISTS messages (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        sender_id INTEGER NOT NULL,
-        recipient_id INTEGER NOT NULL,
-        body TEXT NOT NULL,
-        created_at TEXT NOT NULL,
-        is_read INTEGER NOT NULL DEFAULT 0
-    );
-    """
-    conn = sqlite3.connect(app.config["DATABASE"])
-    try:
-        conn.execute(sql)
-        conn.commit()
-    finally:
-        conn.close()
-
-
-def ensure_reports_table():
-    sql = """
-    CREATE TABLE IF NOT EXISTS message_reports (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        reporter_id INTEGER NOT NULL,
-        user_a INTEGER NOT NULL,
-        user_b INTEGER NOT NULL,
-        message_id INTEGER,
-        message_snapshot TEXT,
-        reason TEXT,
-        created_at TEXT NOT NULL,
-        status TEXT DEFAULT 'open'
-    );
-    """
-    conn = sqlite3.connect(app.config["DATABASE"])
-    try:
-        conn.execute(sql)
-        conn.commit()
-    finally:
-        conn.close()
-
 def create_warning(db_path, user_id, admin_id, warning_type, message):
     """
     Create a warning for a user.
     """
-    now = datetime.utcnow().isoformat()
-    conn = sqlite3.connect(db_path)
+    now = utc_now_iso()
+    conn = get_connection(db_path)
     try:
         conn.execute(
             "INSERT INTO admin_warnings (user_id, admin_id, warning_type, message, is_dismissed, created_at) VALUES (?, ?, ?, ?, 0, ?)",
@@ -1691,11 +1947,10 @@ def get_user_unread_warnings(db_path, user_id):
     """
     Get unread warnings for a specific user.
     """
-    conn = sqlite3.connect(db_path)
-    conn.row_factory = sqlite3.Row
+    conn = get_connection(db_path)
     try:
         rows = conn.execute(
-            "SELECT * FROM admin_warnings WHERE user_id = ? AND is_dismissed = 0 ORDER BY datetime(created_at) DESC",
+            "SELECT * FROM admin_warnings WHERE user_id = ? AND is_dismissed = 0 ORDER BY created_at DESC",
             (int(user_id),)
         ).fetchall()
         return [dict(r) for r in rows]
@@ -1706,7 +1961,7 @@ def dismiss_warning(db_path, warning_id):
     """
     Mark a warning as dismissed.
     """
-    conn = sqlite3.connect(db_path)
+    conn = get_connection(db_path)
     try:
         conn.execute(
             "UPDATE admin_warnings SET is_dismissed = 1 WHERE id = ?",
@@ -1719,103 +1974,287 @@ def dismiss_warning(db_path, warning_id):
     finally:
         conn.close()
 
+class MessageHub:
+    """
+    In-process wakeup channel for the message stream. Writers publish the ids of users
+    whose inbox changed; each open stream waits on its user's sequence number and then
+    reads the delta from the database, so the DB stays the source of truth.
+    Messages written by other worker processes are noticed by one watcher thread per
+    database, which polls data_versions['messages'] while streams are open and wakes
+    every stream when it moves. The number of open streams is capped per process.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._seq = {}
+        self._epoch = 0  # bumped by the watcher; wakes every stream
+        self._streams = 0
+        self._watchers = {}
+
+    def seq(self, user_id):
+        with self._cond:
+            return self._seq.get(int(user_id), 0), self._epoch
+
+    def publish(self, *user_ids):
+        with self._cond:
+            for uid in user_ids:
+                uid = int(uid)
+                self._seq[uid] = self._seq.get(uid, 0) + 1
+            self._cond.notify_all()
+
+    def wait(self, user_id, seen_seq, timeout):
+        """Block until user_id's sequence moves past seen_seq or timeout; returns the current sequence."""
+        uid = int(user_id)
+        with self._cond:
+            self._cond.wait_for(lambda: (self._seq.get(uid, 0), self._epoch) != seen_seq, timeout)
+            return self._seq.get(uid, 0), self._epoch
+
+    def open_stream(self, limit):
+        """Count a new stream in; False when `limit` streams are already open in this process."""
+        with self._cond:
+            if self._streams >= limit:
+                return False
+            self._streams += 1
+            return True
+
+    def close_stream(self):
+        with self._cond:
+            self._streams -= 1
+
+    def watch(self, db_path, interval):
+        """Start the cross-process watcher for db_path unless it is running; it stops with the last stream."""
+        with self._cond:
+            thread = self._watchers.get(db_path)
+            if thread is not None and thread.is_alive():
+                return
+            thread = threading.Thread(target=self._watch, args=(db_path, interval), name="message-watch", daemon=True)
+            self._watchers[db_path] = thread
+            thread.start()
+
+    def _watch(self, db_path, interval):
+        last = None
+        while True:
+            with self._cond:
+                if not self._streams:
+                    self._watchers.pop(db_path, None)
+                    return
+            try:
+                current = get_data_version(db_path, "messages")
+            except sqlite3.Error:
+                current = last  # e.g. locked for longer than busy_timeout; try again next tick
+            if last is not None and current != last:
+                with self._cond:
+                    self._epoch += 1
+                    self._cond.notify_all()
+            last = current
+            time.sleep(interval)
+
+
+message_hub = MessageHub()
+
+
+def _insert_message(conn, sender_id, recipient_id, body):
+    now = utc_now_iso()
+    cur = conn.execute(
+        "INSERT INTO messages (sender_id, recipient_id, body, created_at, is_read) VALUES (?, ?, ?, ?, 0)",
+        (sender_id, recipient_id, body, now),
+    )
+    rowid = cur.lastrowid
+    lo, hi = sorted((sender_id, recipient_id))
+    conn.execute(
+        """
+        INSERT INTO conversations (user_lo, user_hi, last_message_id, last_sender_id, last_at, unread_lo, unread_hi)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(user_lo, user_hi) DO UPDATE SET
+            last_message_id = excluded.last_message_id,
+            last_sender_id = excluded.last_sender_id,
+            last_at = excluded.last_at,
+            unread_lo = unread_lo + excluded.unread_lo,
+            unread_hi = unread_hi + excluded.unread_hi
+        """,
+        (lo, hi, rowid, sender_id, now, 1 if recipient_id == lo else 0, 1 if recipient_id == hi and lo != hi else 0),
+    )
+    return {"id": rowid, "sender_id": sender_id, "recipient_id": recipient_id, "body": body, "created_at": now, "is_read": 0}
+
+
 def create_message(db_path, sender_id, recipient_id, body):
-    now = datetime.utcnow().isoformat()
-    conn = sqlite3.connect(db_path)
-    conn.row_factory = sqlite3.Row
-    try:
-        cur = conn.execute(
-            "INSERT INTO messages (sender_id, recipient_id, body, created_at, is_read) VALUES (?, ?, ?, ?, 0)",
-            (int(sender_id), int(recipient_id), body, now),
-        )
-        conn.commit()
-        rowid = cur.lastrowid
-        row = conn.execute("SELECT * FROM messages WHERE id = ?", (rowid,)).fetchone()
-        return dict(row) if row else None
-    finally:
-        conn.close()
+    row = run_write(db_path, _insert_message, int(sender_id), int(recipient_id), body)
+    message_hub.publish(sender_id, recipient_id)
+    return row
 
 
-def get_conversation_rows(db_path, user_a, user_b, limit=500):
-    conn = sqlite3.connect(db_path)
-    conn.row_factory = sqlite3.Row
+def get_conversation_rows(db_path, user_a, user_b, limit=500, since_id=None, before_id=None):
+    """
+    Messages between two users, oldest first.
+      since_id  -> only messages newer than it (incremental refresh), up to limit
+      before_id -> the `limit` messages just before it (scrolling back through history)
+      neither   -> the latest `limit` messages
+    """
+    where = "((sender_id = ? AND recipient_id = ?) OR (sender_id = ? AND recipient_id = ?))"
+    params = [user_a, user_b, user_b, user_a]
+    if since_id is not None:
+        where += " AND id > ?"
+        params.append(int(since_id))
+        order = "ASC"
+    else:
+        if before_id is not None:
+            where += " AND id < ?"
+            params.append(int(before_id))
+        order = "DESC"
+    params.append(limit)
+    conn = get_connection(db_path)
     try:
         rows = conn.execute(
-            """
+            f"""
             SELECT id, sender_id, recipient_id, body, created_at, is_read
             FROM messages
-            WHERE (sender_id = ? AND recipient_id = ?) OR (sender_id = ? AND recipient_id = ?)
-            ORDER BY datetime(created_at) ASC
+            WHERE {where}
+            ORDER BY id {order}
             LIMIT ?
             """,
-            (user_a, user_b, user_b, user_a, limit),
+            params,
         ).fetchall()
-        return [dict(r) for r in rows]
+        rows = [dict(r) for r in rows]
+        if order == "DESC":
+            rows.reverse()
+        return rows
     finally:
         conn.close()
 
 
 def get_conversations_summary(db_path, user_id, limit=50):
-    conn = sqlite3.connect(db_path)
-    conn.row_factory = sqlite3.Row
+    """Inbox for user_id from the conversations table, most recent thread first."""
+    conn = get_connection(db_path)
     try:
         rows = conn.execute(
             """
-            SELECT id, sender_id, recipient_id, body, created_at, is_read
-            FROM messages
-            WHERE sender_id = ? OR recipient_id = ?
-            ORDER BY datetime(created_at) DESC
+            SELECT c.user_hi AS other_id, c.unread_lo AS unread_count, c.last_message_id, c.last_sender_id, c.last_at,
+                   m.body AS last_message, u.username, u.first_name, u.email
+            FROM conversations c
+            JOIN messages m ON m.id = c.last_message_id
+            LEFT JOIN users u ON u.id = c.user_hi
+            WHERE c.user_lo = ?
+            UNION ALL
+            SELECT c.user_lo AS other_id, c.unread_hi AS unread_count, c.last_message_id, c.last_sender_id, c.last_at,
+                   m.body AS last_message, u.username, u.first_name, u.email
+            FROM conversations c
+            JOIN messages m ON m.id = c.last_message_id
+            LEFT JOIN users u ON u.id = c.user_lo
+            WHERE c.user_hi = ? AND c.user_lo <> c.user_hi
+            ORDER BY last_message_id DESC
             LIMIT ?
             """,
-            (user_id, user_id, limit * 3),
+            (user_id, user_id, limit),
         ).fetchall()
+        return [dict(r) for r in rows]
+    finally:
+        conn.close()
 
-        summary = {}
-        for r in rows:
-            other = r["recipient_id"] if r["sender_id"] == user_id else r["sender_id"]
-            if other not in summary:
-                summary[other] = {
-                    "other_id": other,
-                    "last_message": r["body"],
-                    "last_at": r["created_at"],
-                    "last_sender_id": r["sender_id"],
-                    "unread_count": 0,
-                }
-        unread_rows = conn.execute(
+
+def _mark_read(conn, user_id, other_id):
+    cur = conn.execute(
+        "UPDATE messages SET is_read = 1 WHERE recipient_id = ? AND sender_id = ? AND is_read = 0",
+        (user_id, other_id),
+    )
+    lo, hi = sorted((user_id, other_id))
+    side = "unread_lo" if user_id == lo else "unread_hi"
+    conn.execute(f"UPDATE conversations SET {side} = 0 WHERE user_lo = ? AND user_hi = ?", (lo, hi))
+    return cur.rowcount
+
+
+def mark_conversation_read(db_path, user_id, other_id, wait=True):
+    """
+    Clear user_id's unread messages from other_id. Polls call this constantly, so the
+    conversations counter is read first and the write is skipped when nothing is unread.
+    wait=False returns without waiting for the commit.
+    """
+    user_id, other_id = int(user_id), int(other_id)
+    lo, hi = sorted((user_id, other_id))
+    side = "unread_lo" if user_id == lo else "unread_hi"
+    conn = get_connection(db_path)
+    try:
+        row = conn.execute(f"SELECT {side} AS unread FROM conversations WHERE user_lo = ? AND user_hi = ?", (lo, hi)).fetchone()
+    finally:
+        conn.close()
+    if not row or not row["unread"]:
+        return
+    def published(future):
+        if future.exception() is None and future.result():
+            message_hub.publish(user_id)
+
+    result = run_write(db_path, _mark_read, user_id, other_id, wait=wait)
+    if not wait:
+        result.add_done_callback(published)
+    elif result:
+        message_hub.publish(user_id)
+
+
+def get_messages_since(db_path, user_id, since_id, limit=200):
+    """Messages sent or received by user_id with id > since_id, oldest first."""
+    conn = get_connection(db_path)
+    try:
+        rows = conn.execute(
             """
-            SELECT sender_id, recipient_id, COUNT(*) as cnt
+            SELECT id, sender_id, recipient_id, body, created_at, is_read
             FROM messages
-            WHERE recipient_id = ? AND is_read = 0
-            GROUP BY sender_id
+            WHERE id > ? AND (sender_id = ? OR recipient_id = ?)
+            ORDER BY id ASC
+            LIMIT ?
             """,
-            (user_id,),
+            (int(since_id), user_id, user_id, limit),
         ).fetchall()
-        for ur in unread_rows:
-            sender = ur["sender_id"]
-            if sender in summary:
-                summary[sender]["unread_count"] = ur["cnt"]
+        return [dict(r) for r in rows]
+    finally:
+        conn.close()
+
 
-        out = sorted(summary.values(), key=lambda x: x["last_at"], reverse=True)
-        return out
+def get_latest_message_id(db_path, user_id):
+    conn = get_connection(db_path)
+    try:
+        row = conn.execute(
+            "SELECT MAX(id) AS max_id FROM messages WHERE sender_id = ? OR recipient_id = ?",
+            (user_id, user_id),
+        ).fetchone()
+        return (row["max_id"] if row else None) or 0
     finally:
         conn.close()
 
 
-def mark_conversation_read(db_path, user_id, other_id):
-    conn = sqlite3.connect(db_path)
+def get_unread_counts(db_path, user_id):
+    """{other_id: unread message count} for messages addressed to user_id."""
+    conn = get_connection(db_path)
     try:
-        conn.execute(
-            "UPDATE messages SET is_read = 1 WHERE recipient_id = ? AND sender_id = ? AND is_read = 0",
-            (user_id, other_id),
-        )
-        conn.commit()
+        rows = conn.execute(
+            """
+            SELECT user_hi AS other_id, unread_lo AS cnt FROM conversations WHERE user_lo = ? AND unread_lo > 0
+            UNION ALL
+            SELECT user_lo AS other_id, unread_hi AS cnt FROM conversations WHERE user_hi = ? AND unread_hi > 0
+            """,
+            (user_id, user_id),
+        ).fetchall()
+        return {r["other_id"]: r["cnt"] for r in rows}
     finally:
         conn.close()
 
 
+def _delete_conversation(conn, lo, hi):
+    conn.execute(
+        "DELETE FROM messages WHERE (sender_id = ? AND recipient_id = ?) OR (sender_id = ? AND recipient_id = ?)",
+        (lo, hi, hi, lo),
+    )
+    conn.execute("DELETE FROM conversations WHERE user_lo = ? AND user_hi = ?", (lo, hi))
+
+
+def delete_conversation(db_path, user_a, user_b):
+    """Delete every message between two users along with their conversations row."""
+    lo, hi = sorted((int(user_a), int(user_b)))
+    run_write(db_path, _delete_conversation, lo, hi)
+    message_hub.publish(lo, hi)
+
+
 def create_report(db_path, reporter_id, user_a, user_b, message_id=None, message_snapshot=None, reason=None):
-    now = datetime.utcnow().isoformat()
-    conn = sqlite3.connect(db_path)
+    now = utc_now_iso()
+    conn = get_connection(db_path)
     try:
         conn.execute(
             "INSERT INTO message_reports (reporter_id, user_a, user_b, message_id, message_snapshot, reason, created_at, status) VALUES (?, ?, ?, ?, ?, ?, ?, 'open')",
@@ -1828,21 +2267,19 @@ def create_report(db_path, reporter_id, user_a, user_b, message_id=None, message
 
 
 def get_reports(db_path, status=None, limit=200):
-    conn = sqlite3.connect(db_path)
-    conn.row_factory = sqlite3.Row
+    conn = get_connection(db_path)
     try:
         if status:
-            rows = conn.execute("SELECT * FROM message_reports WHERE status = ? ORDER BY datetime(created_at) DESC LIMIT ?", (status, limit)).fetchall()
+            rows = conn.execute("SELECT * FROM message_reports WHERE status = ? ORDER BY created_at DESC LIMIT ?", (status, limit)).fetchall()
         else:
-            rows = conn.execute("SELECT * FROM message_reports ORDER BY datetime(created_at) DESC LIMIT ?", (limit,)).fetchall()
+            rows = conn.execute("SELECT * FROM message_reports ORDER BY created_at DESC LIMIT ?", (limit,)).fetchall()
         return [dict(r) for r in rows]
     finally:
         conn.close()
 
 
 def get_report_by_id(db_path, report_id):
-    conn = sqlite3.connect(db_path)
-    conn.row_factory = sqlite3.Row
+    conn = get_connection(db_path)
     try:
         row = conn.execute("SELECT * FROM message_reports WHERE id = ?", (report_id,)).fetchone()
         return dict(row) if row else None
@@ -1850,31 +2287,25 @@ def get_report_by_id(db_path, report_id):
         conn.close()
 
 
-# Ensure messaging and reports tables exist
-ensure_messages_table()
-ensure_reports_table()
-
-
 # --- Routes / API for messaging / reports ---
 
 
-@app.route("/messages")
+@route("/messages")
 @login_required
 def messages_page():
     # pass current_user id to template for optional use by JS
     return render_template("messages.html", current_user_id=int(current_user.get_id()))
 
 
-@app.route("/api/messages/conversations")
+@route("/api/messages/conversations")
 @login_required
 def api_messages_conversations():
     uid = int(current_user.get_id())
     try:
-        convs = get_conversations_summary(app.config["DATABASE"], uid)
+        convs = get_conversations_summary(current_app.config["DATABASE"], uid)
         out = []
         for c in convs:
-            other_row = get_user_by_id(app.config["DATABASE"], c["other_id"])
-            display = other_row.get("username") or other_row.get("first_name") or other_row.get("email") or f"user-{c['other_id']}"
+            display = c.get("username") or c.get("first_name") or c.get("email") or f"user-{c['other_id']}"
             out.append({
                 "other_id": c["other_id"],
                 "display": display,
@@ -1885,27 +2316,107 @@ def api_messages_conversations():
             })
         return jsonify({"ok": True, "conversations": out})
     except Exception:
-        app.logger.exception("Failed to fetch conversations")
+        current_app.logger.exception("Failed to fetch conversations")
         return jsonify({"ok": False, "error": "Internal server error"}), 500
 
 
-@app.route("/api/messages/conversation/<int:other_id>")
+@route("/api/messages/conversation/<int:other_id>")
 @login_required
 def api_messages_conversation(other_id):
     uid = int(current_user.get_id())
-    other = get_user_by_id(app.config["DATABASE"], other_id)
+    other = get_user_by_id(current_app.config["DATABASE"], other_id)
     if not other:
         return jsonify({"ok": False, "error": "User not found"}), 404
     try:
-        rows = get_conversation_rows(app.config["DATABASE"], uid, other_id)
-        mark_conversation_read(app.config["DATABASE"], uid, other_id)
-        return jsonify({"ok": True, "messages": rows})
+        since_id = request.args.get("since_id", type=int)
+        before_id = request.args.get("before_id", type=int)
+        limit = max(min(request.args.get("limit", 500, type=int), 500), 1)
+        rows = get_conversation_rows(current_app.config["DATABASE"], uid, other_id, limit=limit, since_id=since_id, before_id=before_id)
+        if before_id is None:
+            # the rows are already read; the poll does not need to wait for the commit
+            mark_conversation_read(current_app.config["DATABASE"], uid, other_id, wait=False)
+        # has_more: older history exists beyond this window (not meaningful for since_id)
+        has_more = since_id is None and len(rows) == limit
+        return jsonify({"ok": True, "messages": rows, "has_more": has_more})
     except Exception:
-        app.logger.exception("Failed to fetch conversation")
+        current_app.logger.exception("Failed to fetch conversation")
         return jsonify({"ok": False, "error": "Internal server error"}), 500
 
 
-@app.route("/api/messages/send", methods=["POST"])
+@route("/api/messages/mark_read", methods=["POST"])
+@login_required
+def api_messages_mark_read():
+    data = request.get_json() or {}
+    other_id = data.get("other_id")
+    if not other_id:
+        return jsonify({"ok": False, "error": "other_id required"}), 400
+    try:
+        mark_conversation_read(current_app.config["DATABASE"], int(current_user.get_id()), int(other_id))
+        return jsonify({"ok": True})
+    except Exception:
+        current_app.logger.exception("Failed to mark conversation read")
+        return jsonify({"ok": False, "error": "Internal server error"}), 500
+
+
+@route("/api/messages/stream")
+@login_required
+def api_messages_stream():
+    """
+    Server-Sent Events feed for the current user:
+      event "chat"   -> one new message (sent or received), id = message id
+      event "unread" -> {"counts": {other_id: n}} whenever unread counts change
+    Resumes after the browser's Last-Event-ID (or ?since_id); otherwise starts from now.
+    The stream ends after MESSAGE_STREAM_MAX_AGE seconds and EventSource reconnects.
+    With MESSAGE_STREAM_MAX_CONNECTIONS streams already open in this process it answers
+    503, which EventSource does not retry; messages.js then polls instead.
+    """
+    db_path = current_app.config["DATABASE"]
+    uid = int(current_user.get_id())
+    keepalive = current_app.config["MESSAGE_STREAM_KEEPALIVE"]
+    max_age = current_app.config["MESSAGE_STREAM_MAX_AGE"]
+    since = request.headers.get("Last-Event-ID") or request.args.get("since_id")
+    try:
+        last_id = int(since) if since else get_latest_message_id(db_path, uid)
+    except ValueError:
+        last_id = get_latest_message_id(db_path, uid)
+    if not message_hub.open_stream(current_app.config["MESSAGE_STREAM_MAX_CONNECTIONS"]):
+        return Response("Too many open message streams\n", status=503, mimetype="text/plain", headers={"Retry-After": "60"})
+    message_hub.watch(db_path, current_app.config["MESSAGE_STREAM_POLL"])
+
+    def events():
+        nonlocal last_id
+        seq = message_hub.seq(uid)
+        unread = None
+        deadline = time.monotonic() + max_age
+        yield "retry: 3000\n\n"
+        while time.monotonic() < deadline:
+            while True:
+                rows = get_messages_since(db_path, uid, last_id)
+                for r in rows:
+                    last_id = r["id"]
+                    yield "id: %d\nevent: chat\ndata: %s\n\n" % (r["id"], json.dumps(r))
+                if len(rows) < 200:
+                    break
+            counts = get_unread_counts(db_path, uid)
+            if counts != unread:
+                unread = counts
+                yield "event: unread\ndata: %s\n\n" % json.dumps({"counts": {str(k): v for k, v in counts.items()}})
+            new_seq = message_hub.wait(uid, seq, keepalive)
+            if new_seq == seq:
+                yield ": keepalive\n\n"
+            seq = new_seq
+
+    response = Response(
+        events(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+    # runs when the server closes the response, even if the generator never started
+    response.call_on_close(message_hub.close_stream)
+    return response
+
+
+@route("/api/messages/send", methods=["POST"])
 @login_required
 def api_messages_send():
     data = request.get_json() or {}
@@ -1914,18 +2425,18 @@ def api_messages_send():
     sender_id = int(current_user.get_id())
     if not recipient_id or not body:
         return jsonify({"ok": False, "error": "recipient_id and body required"}), 400
-    recipient = get_user_by_id(app.config["DATABASE"], int(recipient_id))
+    recipient = get_user_by_id(current_app.config["DATABASE"], int(recipient_id))
     if not recipient:
         return jsonify({"ok": False, "error": "Recipient not found"}), 404
     try:
-        msg = create_message(app.config["DATABASE"], sender_id, int(recipient_id), body)
+        msg = create_message(current_app.config["DATABASE"], sender_id, int(recipient_id), body)
         return jsonify({"ok": True, "message": msg})
     except Exception:
-        app.logger.exception("Failed to send message")
+        current_app.logger.exception("Failed to send message")
         return jsonify({"ok": False, "error": "Internal server error"}), 500
 
 
-@app.route("/api/messages/delete_conversation", methods=["POST"])
+@route("/api/messages/delete_conversation", methods=["POST"])
 @login_required
 def api_messages_delete_conversation():
     data = request.get_json() or {}
@@ -1934,22 +2445,14 @@ def api_messages_delete_conversation():
         return jsonify({"ok": False, "error": "other_id required"}), 400
     uid = int(current_user.get_id())
     try:
-        conn = sqlite3.connect(app.config["DATABASE"])
-        try:
-            conn.execute(
-                "DELETE FROM messages WHERE (sender_id = ? AND recipient_id = ?) OR (sender_id = ? AND recipient_id = ?)",
-                (uid, int(other_id), int(other_id), uid),
-            )
-            conn.commit()
-        finally:
-            conn.close()
+        delete_conversation(current_app.config["DATABASE"], uid, int(other_id))
         return jsonify({"ok": True})
     except Exception:
-        app.logger.exception("Failed to delete conversation")
+        current_app.logger.exception("Failed to delete conversation")
         return jsonify({"ok": False, "error": "Internal server error"}), 500
 
 
-@app.route("/api/messages/report", methods=["POST"])
+@route("/api/messages/report", methods=["POST"])
 @login_required
 def api_messages_report():
     data = request.get_json() or {}
@@ -1959,81 +2462,88 @@ def api_messages_report():
     if not other_id or not reason:
         return jsonify({"ok": False, "error": "other_id and reason required"}), 400
     uid = int(current_user.get_id())
-    other = get_user_by_id(app.config["DATABASE"], int(other_id))
+    other = get_user_by_id(current_app.config["DATABASE"], int(other_id))
     if not other:
         return jsonify({"ok": False, "error": "User not found"}), 404
     snapshot = None
     if message_id:
         try:
-            conn = sqlite3.connect(app.config["DATABASE"])
-            conn.row_factory = sqlite3.Row
+            conn = get_connection(current_app.config["DATABASE"])
             row = conn.execute("SELECT body FROM messages WHERE id = ?", (int(message_id),)).fetchone()
             if row:
                 snapshot = row["body"]
             conn.close()
         except Exception:
-            app.logger.exception("Failed to fetch message snapshot")
+            current_app.logger.exception("Failed to fetch message snapshot")
             snapshot = None
     try:
-        create_report(app.config["DATABASE"], uid, uid, int(other_id), message_id=message_id, message_snapshot=snapshot, reason=reason)
+        create_report(current_app.config["DATABASE"], uid, uid, int(other_id), message_id=message_id, message_snapshot=snapshot, reason=reason)
         return jsonify({"ok": True})
     except Exception:
-        app.logger.exception("Failed to create report")
+        current_app.logger.exception("Failed to create report")
         return jsonify({"ok": False, "error": "Internal server error"}), 500
 
 
-@app.route("/api/users/lookup")
+@route("/api/users/lookup")
 @login_required
 def api_users_lookup():
     email = (request.args.get("email") or "").strip().lower()
     if not email:
         return jsonify({"ok": False, "error": "email query parameter required"}), 400
     try:
-        row = get_user_by_email(app.config["DATABASE"], email)
+        row = get_user_by_email(current_app.config["DATABASE"], email)
         if not row:
             return jsonify({"ok": False, "error": "user not found"}), 404
         display = row.get("username") or row.get("first_name") or row.get("email") or f"user-{row.get('id')}"
         return jsonify({"ok": True, "user": {"id": row["id"], "display": display}})
     except Exception:
-        app.logger.exception("User lookup failed")
+        current_app.logger.exception("User lookup failed")
         return jsonify({"ok": False, "error": "Internal server error"}), 500
 
 
 # Admin endpoints to review reports and view conversations
-@app.route("/admin/reports")
+def _attach_report_users(reports):
+    """Attach reporter / user_a_obj / user_b_obj to each report, loading all users in one query."""
+    users = get_users_by_ids(
+        current_app.config["DATABASE"],
+        [uid for r in reports for uid in (r["reporter_id"], r["user_a"], r["user_b"])],
+    )
+    for r in reports:
+        r["reporter"] = users.get(r["reporter_id"])
+        r["user_a_obj"] = users.get(r["user_a"])
+        r["user_b_obj"] = users.get(r["user_b"])
+
+
+@route("/admin/reports")
 @require_roles("admin")
 def admin_reports_page():
     # Get filter from query parameters
     status_filter = request.args.get('status')
     
     if status_filter:
-        reports = get_reports(app.config["DATABASE"], status=status_filter)
+        reports = get_reports(current_app.config["DATABASE"], status=status_filter)
     else:
-        reports = get_reports(app.config["DATABASE"])
+        reports = get_reports(current_app.config["DATABASE"])
     
-    # Enrich reports with user information
-    for r in reports:
-        r["reporter"] = get_user_by_id(app.config["DATABASE"], r["reporter_id"])
-        r["user_a_obj"] = get_user_by_id(app.config["DATABASE"], r["user_a"])
-        r["user_b_obj"] = get_user_by_id(app.config["DATABASE"], r["user_b"])
+    _attach_report_users(reports)
     
     return render_template("admin_reports.html", reports=reports)
 
 
-@app.route("/api/admin/reports")
+@route("/api/admin/reports")
 @require_roles("admin")
 def api_admin_reports():
     try:
-        rows = get_reports(app.config["DATABASE"])
+        rows = get_reports(current_app.config["DATABASE"])
         out = []
         for r in rows:
             out.append(r)
         return jsonify({"ok": True, "reports": out})
     except Exception:
-        app.logger.exception("Failed to fetch admin reports")
+        current_app.logger.exception("Failed to fetch admin reports")
         return jsonify({"ok": False, "error": "Internal server error"}), 500
 
-@app.route("/admin/send-warning", methods=["POST"])
+@route("/admin/send-warning", methods=["POST"])
 @require_roles("admin")
 def admin_send_warning():
     user_id = request.form.get('user_id')
@@ -2043,11 +2553,11 @@ def admin_send_warning():
         flash("User ID required", "danger")
         return redirect(request.referrer or url_for('admin_dashboard'))
     
-    create_simple_warning(app.config["DATABASE"], user_id, message)
+    create_simple_warning(current_app.config["DATABASE"], user_id, message)
     flash("Warning sent", "success")
     return redirect(request.referrer or url_for('admin_dashboard'))
 
-@app.route("/api/admin/conversation")
+@route("/api/admin/conversation")
 @require_roles("admin")
 def api_admin_conversation():
     try:
@@ -2055,24 +2565,24 @@ def api_admin_conversation():
         user_b = request.args.get("user_b")
         if not user_a or not user_b:
             return jsonify({"ok": False, "error": "user_a and user_b required"}), 400
-        rows = get_conversation_rows(app.config["DATABASE"], int(user_a), int(user_b))
+        rows = get_conversation_rows(current_app.config["DATABASE"], int(user_a), int(user_b))
         return jsonify({"ok": True, "messages": rows})
     except Exception:
-        app.logger.exception("Failed to fetch admin conversation")
+        current_app.logger.exception("Failed to fetch admin conversation")
         return jsonify({"ok": False, "error": "Internal server error"}), 500
 
 
 #
 # Client dashboard and job routes (formerly employer)
 #
-@app.route("/client/dashboard")
+@route("/client/dashboard")
 @require_roles("client")
 def client_dashboard():
-    jobs = get_jobs_by_employer(app.config["DATABASE"], int(current_user.get_id()))
+    jobs = get_jobs_by_employer(current_app.config["DATABASE"], int(current_user.get_id()))
     return render_template("employer_dashboard.html", jobs=jobs)
 
 
-@app.route("/post-job", methods=["GET", "POST"])
+@route("/post-job", methods=["GET", "POST"])
 @require_roles("client")
 def post_job():
     if request.method == "POST":
@@ -2095,11 +2605,9 @@ def post_job():
             lat_val = None
             lng_val = None
 
+        geocode_status = None
         if (lat_val is None or lng_val is None) and location_text:
-            g_lat, g_lng, g_name = geocode_address(location_text)
-            if g_lat is not None and g_lng is not None:
-                lat_val = g_lat
-                lng_val = g_lng
+            lat_val, lng_val, geocode_status = resolve_job_location(location_text)
 
         if not title or not description:
             flash("Title and description are required.", "danger")
@@ -2108,7 +2616,7 @@ def post_job():
         employer_id = int(current_user.get_id())
         try:
             job = create_job(
-                app.config["DATABASE"],
+                current_app.config["DATABASE"],
                 employer_id,
                 title,
                 description,
@@ -2117,25 +2625,28 @@ def post_job():
                 lng=lng_val,
                 salary=salary,
                 tags=tags,
+                geocode_status=geocode_status,
             )
+            if geocode_status == "pending":
+                queue_geocoding()
             flash("Job posted.", "success")
             return redirect(url_for("client_dashboard"))
         except Exception as e:
-            app.logger.exception("Failed to create job: %s", e)
+            current_app.logger.exception("Failed to create job: %s", e)
             flash("Unable to create job.", "danger")
             return render_template("post_job.html", title=title, description=description, location_text=location_text, salary=salary, tags=tags, lat=lat_field, lng=lng_field)
 
     return render_template("post_job.html")
 
 
-@app.route("/job/<int:job_id>")
+@route("/job/<int:job_id>")
 @login_required
 def job_detail(job_id):
-    job = get_job_by_id(app.config["DATABASE"], job_id)
+    job = get_job_by_id(current_app.config["DATABASE"], job_id)
     if not job:
         flash("Job not found.", "warning")
         return redirect(url_for("jobs_list"))
-    employer = get_user_by_id(app.config["DATABASE"], job["employer_id"])
+    employer = get_user_by_id(current_app.config["DATABASE"], job["employer_id"])
     is_owner = False
     try:
         is_owner = (current_user.is_authenticated
@@ -2143,19 +2654,20 @@ def job_detail(job_id):
                     and int(current_user.get_id()) == int(job["employer_id"]))
     except Exception:
         is_owner = False
-    return render_template("job_detail.html", job=job, employer=employer, is_owner=is_owner)
+    rating_summary = get_rating_summary(current_app.config["DATABASE"], "job", job_id)
+    return render_template("job_detail.html", job=job, employer=employer, is_owner=is_owner, rating_summary=rating_summary)
 
 
-@app.route("/jobs/<int:job_id>")
+@route("/jobs/<int:job_id>")
 @login_required
 def job_detail_alias(job_id):
     return redirect(url_for("job_detail", job_id=job_id))
 
 
-@app.route("/jobs/<int:job_id>/edit", methods=["GET", "POST"])
+@route("/jobs/<int:job_id>/edit", methods=["GET", "POST"])
 @require_roles("client")
 def edit_job(job_id):
-    job = get_job_by_id(app.config["DATABASE"], job_id)
+    job = get_job_by_id(current_app.config["DATABASE"], job_id)
     if not job:
         flash("Job not found.", "warning")
         return redirect(url_for("client_dashboard"))
@@ -2180,17 +2692,18 @@ def edit_job(job_id):
         except ValueError:
             lat_val = None
             lng_val = None
+        geocode_status = None
         if (lat_val is None or lng_val is None) and location_text:
-            g_lat, g_lng, g_name = geocode_address(location_text)
-            if g_lat is not None and g_lng is not None:
-                lat_val = g_lat
-                lng_val = g_lng
+            lat_val, lng_val, geocode_status = resolve_job_location(location_text)
+        elif job.get("geocode_status") == "pending":
+            # explicit coordinates (or no address) supersede a queued lookup
+            geocode_status = "located" if lat_val is not None and lng_val is not None else "failed"
         if not title or not description:
             flash("Title and description are required.", "danger")
             return render_template("edit_job.html", job=job)
         try:
             updated = update_job(
-                app.config["DATABASE"],
+                current_app.config["DATABASE"],
                 job_id,
                 title=title,
                 description=description,
@@ -2199,16 +2712,19 @@ def edit_job(job_id):
                 lng=lng_val,
                 salary=salary,
                 tags=tags,
+                geocode_status=geocode_status,
             )
+            if geocode_status == "pending":
+                queue_geocoding()
             flash("Job updated.", "success")
             return redirect(url_for("job_detail", job_id=job_id))
         except Exception as e:
-            app.logger.exception("Failed to update job: %s", e)
+            current_app.logger.exception("Failed to update job: %s", e)
             flash("Unable to update job.", "danger")
             return render_template("edit_job.html", job=job)
     return render_template("edit_job.html", job=job)
 
-@app.route("/warning/<int:warning_id>/dismiss", methods=["POST"])
+@route("/warning/<int:warning_id>/dismiss", methods=["POST"])
 @login_required
 def dismiss_warning_route(warning_id):
     """
@@ -2218,8 +2734,7 @@ def dismiss_warning_route(warning_id):
         user_id = int(current_user.get_id())
         
         # Verify warning belongs to user
-        conn = sqlite3.connect(app.config["DATABASE"])
-        conn.row_factory = sqlite3.Row
+        conn = get_connection(current_app.config["DATABASE"])
         warning = conn.execute(
             "SELECT * FROM admin_warnings WHERE id = ? AND user_id = ?",
             (warning_id, user_id)
@@ -2227,19 +2742,19 @@ def dismiss_warning_route(warning_id):
         conn.close()
         
         if warning:
-            dismiss_warning(app.config["DATABASE"], warning_id)
+            dismiss_warning(current_app.config["DATABASE"], warning_id)
             return jsonify({"success": True})
         else:
             return jsonify({"success": False, "error": "Warning not found"}), 404
             
     except Exception as e:
-        app.logger.exception("Failed to dismiss warning")
+        current_app.logger.exception("Failed to dismiss warning")
         return jsonify({"success": False, "error": "Server error"}), 500
 
-@app.route("/jobs/<int:job_id>/delete", methods=["POST"])
+@route("/jobs/<int:job_id>/delete", methods=["POST"])
 @require_roles("client")
 def delete_job_view(job_id):
-    job = get_job_by_id(app.config["DATABASE"], job_id)
+    job = get_job_by_id(current_app.config["DATABASE"], job_id)
     if not job:
         flash("Job not found.", "warning")
         return redirect(url_for("client_dashboard"))
@@ -2247,10 +2762,10 @@ def delete_job_view(job_id):
         flash("You don't have permission to delete that job.", "danger")
         return redirect(url_for("client_dashboard"))
     try:
-        delete_job(app.config["DATABASE"], job_id)
+        delete_job(current_app.config["DATABASE"], job_id)
         flash("Job deleted.", "success")
     except Exception as e:
-        app.logger.exception("Failed to delete job: %s", e)
+        current_app.logger.exception("Failed to delete job: %s", e)
         flash("Unable to delete job.", "danger")
     return redirect(url_for("client_dashboard"))
 
@@ -2258,7 +2773,7 @@ def delete_job_view(job_id):
 #
 # Submit rating (used by profile and job pages)
 #
-@app.route("/submit-rating", methods=["POST"])
+@route("/submit-rating", methods=["POST"])
 @login_required
 def submit_rating():
     target_type = (request.form.get("target_type") or "user").strip()
@@ -2284,12 +2799,12 @@ def submit_rating():
     except Exception:
         pass
     if target_type == "user":
-        tgt = get_user_by_id(app.config["DATABASE"], target_id_i)
+        tgt = get_user_by_id(current_app.config["DATABASE"], target_id_i)
         if not tgt:
             flash("User not found.", "warning")
             return redirect(request.referrer or url_for("index"))
     elif target_type == "job":
-        tgt = get_job_by_id(app.config["DATABASE"], target_id_i)
+        tgt = get_job_by_id(current_app.config["DATABASE"], target_id_i)
         if not tgt:
             flash("Job not found.", "warning")
             return redirect(request.referrer or url_for("index"))
@@ -2298,7 +2813,7 @@ def submit_rating():
         return redirect(request.referrer or url_for("index"))
     try:
         create_rating(
-            app.config["DATABASE"],
+            current_app.config["DATABASE"],
             target_type,
             target_id_i,
             int(current_user.get_id()),
@@ -2307,14 +2822,14 @@ def submit_rating():
         )
         flash("Thanks — your rating has been recorded.", "success")
     except Exception as e:
-        app.logger.exception("Failed to save rating: %s", e)
+        current_app.logger.exception("Failed to save rating: %s", e)
         flash("Unable to save rating. Try again later.", "danger")
     if target_type == "user":
         return redirect(url_for("profile", user_id=target_id_i))
     else:
         return redirect(url_for("job_detail", job_id=target_id_i))
 
-@app.route("/api/check-warnings")
+@route("/api/check-warnings")
 @login_required
 def api_check_warnings():
     """
@@ -2322,7 +2837,7 @@ def api_check_warnings():
     """
     try:
         user_id = int(current_user.get_id())
-        warnings = get_user_unread_warnings(app.config["DATABASE"], user_id)
+        warnings = get_user_unread_warnings(current_app.config["DATABASE"], user_id)
         
         return jsonify({
             "has_warnings": len(warnings) > 0,
@@ -2330,25 +2845,21 @@ def api_check_warnings():
             "count": len(warnings)
         })
     except Exception as e:
-        app.logger.exception("Failed to check warnings")
+        current_app.logger.exception("Failed to check warnings")
         return jsonify({"has_warnings": False, "warnings": [], "count": 0})
 
 #
 # Admin dashboard and actions
 #
-@app.route("/admin/dashboard")
+@route("/admin/dashboard")
 @require_roles("admin")
 def admin_dashboard():
-    users = get_all_users(app.config["DATABASE"])
+    users = get_all_users(current_app.config["DATABASE"])
     
     # Fetch reports for the dashboard
-    reports = get_reports(app.config["DATABASE"], status="open")
+    reports = get_reports(current_app.config["DATABASE"], status="open")
     
-    # Enrich reports with user information
-    for report in reports:
-        report["reporter"] = get_user_by_id(app.config["DATABASE"], report["reporter_id"])
-        report["user_a_obj"] = get_user_by_id(app.config["DATABASE"], report["user_a"])
-        report["user_b_obj"] = get_user_by_id(app.config["DATABASE"], report["user_b"])
+    _attach_report_users(reports)
     
     tpl_path = os.path.join(BASE_DIR, "templates", "admin_dashboard.html")
     if os.path.exists(tpl_path):
@@ -2383,17 +2894,17 @@ def admin_dashboard():
     """
     return render_template_string(html)
 
-@app.route("/admin/reports/<int:report_id>/resolve", methods=["POST"])
+@route("/admin/reports/<int:report_id>/resolve", methods=["POST"])
 @require_roles("admin")
 def admin_resolve_report(report_id):
-    success = update_report_status(app.config["DATABASE"], report_id, "resolved")
+    success = update_report_status(current_app.config["DATABASE"], report_id, "resolved")
     if success:
         flash("Report marked as resolved.", "success")
     else:
         flash("Failed to update report status.", "danger")
     return redirect(url_for("admin_dashboard"))
 
-@app.route("/admin/users/<int:user_id>/ban", methods=["POST"])
+@route("/admin/users/<int:user_id>/ban", methods=["POST"])
 @require_roles("admin")
 def admin_ban_user(user_id):
     days = request.form.get("days")
@@ -2401,24 +2912,23 @@ def admin_ban_user(user_id):
     if days:
         try:
             days_i = int(days)
-            banned_until = datetime.utcnow() + timedelta(days=days_i)
-            banned_until_iso = banned_until.isoformat()
+            banned_until_iso = utc_now_iso(days_i * 86400)
         except Exception:
             banned_until_iso = None
-    set_user_ban(app.config["DATABASE"], user_id, banned_until_iso)
+    set_user_ban(current_app.config["DATABASE"], user_id, banned_until_iso)
     flash("User has been banned.", "success")
     return redirect(url_for("admin_dashboard"))
 
 
-@app.route("/admin/users/<int:user_id>/unban", methods=["POST"])
+@route("/admin/users/<int:user_id>/unban", methods=["POST"])
 @require_roles("admin")
 def admin_unban_user(user_id):
-    unset_user_ban(app.config["DATABASE"], user_id)
+    unset_user_ban(current_app.config["DATABASE"], user_id)
     flash("User has been unbanned.", "success")
     return redirect(url_for("admin_dashboard"))
 
 
-@app.route("/admin/users/<int:user_id>/delete", methods=["POST"])
+@route("/admin/users/<int:user_id>/delete", methods=["POST"])
 @require_roles("admin")
 def admin_delete_user(user_id):
     try:
@@ -2427,21 +2937,21 @@ def admin_delete_user(user_id):
             return redirect(url_for("admin_dashboard"))
     except Exception:
         pass
-    delete_user(app.config["DATABASE"], user_id)
+    delete_user(current_app.config["DATABASE"], user_id)
     flash("User and their related data have been deleted.", "success")
     return redirect(url_for("admin_dashboard"))
 
 
-@app.route("/admin/purge-tokens", methods=["POST"])
+@route("/admin/purge-tokens", methods=["POST"])
 @require_roles("admin")
 def admin_purge_tokens():
-    purge_expired_tokens(app.config["DATABASE"])
+    purge_expired_tokens(current_app.config["DATABASE"])
     flash("Expired tokens purged.", "success")
     return redirect(url_for("admin_dashboard"))
 
 
 # Small helper endpoint used by messages.js to get the current user id
-@app.route("/api/me")
+@route("/api/me")
 @login_required
 def api_me():
     try:
@@ -2449,22 +2959,160 @@ def api_me():
     except Exception:
         return jsonify({"ok": False}), 500
 
-@app.route("/check-warnings")
+@route("/check-warnings")
 @login_required
 def check_warnings():
     user_id = int(current_user.get_id())
-    warnings = get_user_warnings(app.config["DATABASE"], user_id)
+    warnings = get_user_warnings(current_app.config["DATABASE"], user_id)
     
     # Return and DELETE warnings (one-time display)
     if warnings:
         # Delete after showing
-        conn = sqlite3.connect(app.config["DATABASE"])
+        conn = get_connection(current_app.config["DATABASE"])
         conn.execute("DELETE FROM user_warnings WHERE user_id = ?", (user_id,))
         conn.commit()
         conn.close()
     
     return jsonify({"warnings": warnings})
 
+#
+# Query plan check: runs the hot read/write helpers against a scratch database and fails
+# if any of their statements plans a full table scan.  Usage: flask --app app check-query-plans
+#
+def _exercise_hot_queries(db_path):
+    a = create_user(db_path, "plan-a@example.test", generate_password_hash("x"), role="client", username="plan_a", first_name="A", last_name="A", verified=1)
+    b = create_user(db_path, "plan-b@example.test", generate_password_hash("x"), role="contractor", username="plan_b", first_name="B", last_name="B", verified=1)
+    job = create_job(db_path, a["id"], "Plan job", "desc", lat=40.0, lng=-89.0, tags="remote")
+    create_application(db_path, job["id"], b["id"], cover_letter="hi")
+    create_rating(db_path, "user", a["id"], b["id"], 5, "ok")
+    create_token(db_path, b["email"], "verify")
+    msg = create_message(db_path, b["id"], a["id"], "hello")
+    create_report(db_path, b["id"], b["id"], a["id"], message_id=msg["id"], reason="plan")
+    create_simple_warning(db_path, b["id"], "plan")
+    enqueue_email(db_path, b["email"], "plan", text_body="plan")
+
+    with record_queries() as statements:
+        get_user_by_id(db_path, a["id"])
+        get_users_by_ids(db_path, [a["id"], b["id"]])
+        get_user_by_email(db_path, a["email"])
+        get_user_by_username(db_path, "plan_a")
+        get_job_by_id(db_path, job["id"])
+        get_jobs_by_employer(db_path, a["id"])
+        get_jobs(db_path, limit=21)
+        get_jobs(db_path, limit=21, after=(job["created_at"], job["id"]))
+        get_jobs(db_path, q="plan", order="relevance", limit=21)
+        get_jobs(db_path, bbox=bbox_for_radius(40.0, -89.0, 25))
+        get_job_points(db_path, q="plan", bbox=bbox_for_radius(40.0, -89.0, 25))
+        count_jobs(db_path, q="plan")
+        get_jobs_by_ids(db_path, [job["id"]])
+        get_applications_by_job(db_path, job["id"])
+        get_applications_by_user(db_path, b["id"])
+        get_ratings_for_target(db_path, "user", a["id"], limit=21)
+        get_ratings_for_target(db_path, "user", a["id"], limit=21, after=("9999", 0))
+        get_rating_summary(db_path, "user", a["id"])
+        get_latest_token_for_email(db_path, b["email"], "verify")
+        get_conversation_rows(db_path, a["id"], b["id"], limit=50)
+        get_conversation_rows(db_path, a["id"], b["id"], since_id=msg["id"])
+        get_conversation_rows(db_path, a["id"], b["id"], before_id=msg["id"], limit=50)
+        get_conversations_summary(db_path, a["id"])
+        get_unread_counts(db_path, a["id"])
+        get_messages_since(db_path, a["id"], 0)
+        get_latest_message_id(db_path, a["id"])
+        mark_conversation_read(db_path, a["id"], b["id"])
+        delete_rating(db_path, create_rating(db_path, "user", a["id"], b["id"], 3, "plan")["id"])
+        flush_writes(db_path)
+        get_reports(db_path, status="open")
+        get_report_by_id(db_path, 1)
+        get_user_warnings(db_path, b["id"])
+        claim_outbox_batch(db_path)
+        get_cached_geocode(db_path, "1 main st, springfield")
+        claim_geocode_batch(db_path)
+        reserve_rate_slot(db_path, "plan", 1.0)
+        get_job_markers(db_path, bbox_for_radius(40.0, -89.0, 25), limit=501)
+    return list(statements)
+
+
+@site.cli.command("send-emails")
+@click.option("--once", is_flag=True, help="Deliver everything that is due, then exit.")
+def send_emails_command(once):
+    """Deliver queued emails from the foreground (use with EMAIL_WORKER=off)."""
+    if once:
+        click.echo(f"attempted {email_worker.drain()} email(s)")
+        return
+    email_worker.start()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        email_worker.stop(timeout=10)
+
+
+@site.cli.command("geocode-jobs")
+@click.option("--once", is_flag=True, help="Geocode one batch of pending jobs, then exit.")
+def geocode_jobs_command(once):
+    """Geocode jobs saved as 'pending' from the foreground (use with GEOCODE_WORKER=off)."""
+    if once:
+        click.echo(f"geocoded {geocode_worker.run_once()} job(s)")
+        return
+    geocode_worker.start()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        geocode_worker.stop(timeout=10)
+
+
+@site.cli.command("migrate")
+def migrate_command():
+    """Create missing tables and apply pending schema migrations."""
+    applied = migrate_database(current_app.config["DATABASE"])
+    schema_state["version"] = check_schema(current_app.config["DATABASE"])
+    if applied:
+        click.echo(f"applied migration(s) {', '.join(str(v) for v in applied)}; schema is at version {schema_state['version']}")
+    else:
+        click.echo(f"schema is up to date (version {schema_state['version']})")
+
+
+@site.cli.command("backfill-short-locations")
+def backfill_short_locations_command():
+    """Recompute jobs.short_location from location_text for every job."""
+    click.echo(f"updated {backfill_short_locations(current_app.config['DATABASE'])} job(s)")
+
+
+@site.cli.command("check-query-plans")
+def check_query_plans_command():
+    """Fail (exit 1) if a hot query in models.py or app.py plans a full table scan."""
+    import tempfile
+
+    real_db = current_app.config["DATABASE"]
+    with tempfile.TemporaryDirectory() as tmp:
+        scratch = os.path.join(tmp, "plans.db")
+        current_app.config["DATABASE"] = scratch
+        try:
+            migrate_database(scratch)
+            statements = _exercise_hot_queries(scratch)
+            scans = find_table_scans(scratch, statements)
+        finally:
+            current_app.config["DATABASE"] = real_db
+    for sql, detail in scans:
+        click.echo(f"TABLE SCAN ({detail}): {sql}", err=True)
+    click.echo(f"checked {len(statements)} statements, {len(scans)} table scan(s)")
+    if scans:
+        raise SystemExit(1)
+
+
+def __getattr__(name):
+    # `flask --app app` and WSGI servers pointed at "app:app" get a default app, built on
+    # first access so that importing this module stays cheap (use create_app() for more)
+    global app
+    if name == "app":
+        app = create_app()
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
 if __name__ == "__main__":
     # For local development only
+    app = create_app()
+    migrate_database(app.config["DATABASE"])
     app.run(debug=True)
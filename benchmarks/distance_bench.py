@@ -0,0 +1,68 @@
+# benchmarks/distance_bench.py - scalar vs vectorized distance engine
+#
+# Usage: python benchmarks/distance_bench.py [num_jobs] [repeats]
+# Times a radius + distance-sort pass over synthetic jobs (roughly the continental US)
+# with both engines, using the same rank() call /jobs and /api/jobs_nearby make.
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from geo import ScalarDistanceEngine, make_distance_engine, load_numpy
+
+
+def synthetic_jobs(n, seed=42):
+    rnd = random.Random(seed)
+    jobs = []
+    for i in range(1, n + 1):
+        if rnd.random() < 0.05:
+            jobs.append({"id": i, "lat": None, "lng": None})
+        else:
+            jobs.append({"id": i, "lat": rnd.uniform(25.0, 49.0), "lng": rnd.uniform(-124.0, -67.0)})
+    return jobs
+
+
+def best_of(fn, repeats):
+    best = None
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - t0
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    jobs = synthetic_jobs(n)
+    center = (39.78, -89.65)
+    radius = 250.0
+
+    scalar = ScalarDistanceEngine()
+    t_scalar = best_of(lambda: scalar.rank(center[0], center[1], jobs, radius=radius, by_distance=True), repeats)
+    print(f"jobs={n} radius={radius}mi")
+    print(f"scalar rank:          {t_scalar * 1000:9.2f} ms")
+
+    if load_numpy() is None:
+        print("numpy not installed; skipping vectorized engine")
+        return
+
+    vector = make_distance_engine("numpy", load_rows=lambda: jobs, version=lambda: 1)
+    t_load = best_of(vector.columns, 1)
+    t_rank = best_of(lambda: vector.rank(center[0], center[1], jobs, radius=radius, by_distance=True), repeats)
+    t_within = best_of(lambda: vector.within(center[0], center[1], radius), repeats)
+    print(f"numpy column load:    {t_load * 1000:9.2f} ms (once per jobs version)")
+    print(f"numpy rank:           {t_rank * 1000:9.2f} ms ({t_scalar / t_rank:.1f}x)")
+    print(f"numpy within (ids):   {t_within * 1000:9.2f} ms ({t_scalar / t_within:.1f}x)")
+
+    # sanity check: both engines agree on membership and order
+    a = [(r["id"], round(d, 6) if d is not None else None) for r, d in scalar.rank(center[0], center[1], jobs, radius=radius, by_distance=True)]
+    b = [(r["id"], round(d, 6) if d is not None else None) for r, d in vector.rank(center[0], center[1], jobs, radius=radius, by_distance=True)]
+    print("results match:", a == b)
+
+
+if __name__ == "__main__":
+    main()
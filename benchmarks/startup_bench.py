@@ -0,0 +1,65 @@
+# benchmarks/startup_bench.py - cold start of a web worker
+#
+# Usage: python benchmarks/startup_bench.py [runs]
+# Each run is a fresh interpreter (what a pre-fork server or a test process pays) timing
+# `import app`, create_app() and the first request against an already migrated database.
+# Also reports which optional heavy modules were imported along the way.
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = r"""
+import json, sys, time
+t0 = time.perf_counter()
+import app as site_app
+t1 = time.perf_counter()
+flask_app = site_app.create_app({"DATABASE": sys.argv[1], "EMAIL_WORKER": "off", "GEOCODE_WORKER": "off"})
+t2 = time.perf_counter()
+status = flask_app.test_client().get("/").status_code
+t3 = time.perf_counter()
+print(json.dumps({
+    "import": t1 - t0,
+    "create_app": t2 - t1,
+    "first_request": t3 - t2,
+    "status": status,
+    "loaded": [m for m in ("requests", "flask_mail", "numpy", "brotli") if m in sys.modules],
+}))
+"""
+
+
+def run_once(db_path):
+    out = subprocess.run(
+        [sys.executable, "-c", CHILD, db_path],
+        cwd=ROOT, capture_output=True, text=True, check=True,
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    sys.path.insert(0, ROOT)
+    from models import migrate_database
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.db")
+        migrate_database(db_path)
+        run_once(db_path)  # warm the bytecode cache so every run measures the same thing
+        results = [run_once(db_path) for _ in range(runs)]
+
+    print(f"runs={runs} (median / min, ms)")
+    for key in ("import", "create_app", "first_request"):
+        values = [r[key] * 1000 for r in results]
+        print(f"{key + ':':16s}{statistics.median(values):9.2f} / {min(values):.2f}")
+    total = [(r["import"] + r["create_app"] + r["first_request"]) * 1000 for r in results]
+    print(f"{'total:':16s}{statistics.median(total):9.2f} / {min(total):.2f}")
+    print("first request status:", results[0]["status"])
+    print("optional modules imported:", ", ".join(results[0]["loaded"]) or "none")
+
+
+if __name__ == "__main__":
+    main()
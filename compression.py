@@ -0,0 +1,89 @@
+# compression.py - gzip / brotli response compression (wired up as an after_request hook in app.py)
+#
+# Bodies are compressed when the client accepts it, the mimetype is allowlisted and the
+# body is at least min_size bytes. Streamed responses (NDJSON export) are gzipped chunk
+# by chunk. A response may carry a `compressed_cache` dict so repeated bodies (the
+# /api/jobs snapshot) are compressed once per encoding instead of once per request.
+import zlib
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip needs nothing extra
+    brotli = None
+
+DEFAULT_MIMETYPES = (
+    "text/html",
+    "text/css",
+    "text/plain",
+    "text/javascript",
+    "application/javascript",
+    "application/json",
+    "application/x-ndjson",
+)
+
+
+def choose_encoding(accept_encodings, streamed=False):
+    """Best of br/gzip for an Accept-Encoding header (werkzeug Accept object), or None."""
+    q_gzip = accept_encodings["gzip"]
+    q_br = accept_encodings["br"] if brotli is not None and not streamed else 0
+    if q_br and q_br >= q_gzip:
+        return "br"
+    if q_gzip:
+        return "gzip"
+    return None
+
+
+def compress(data, encoding, gzip_level=6, brotli_quality=5):
+    if encoding == "br":
+        return brotli.compress(data, quality=brotli_quality)
+    return zlib.compress(data, gzip_level, wbits=31)  # wbits=31: gzip container
+
+
+def gzip_stream(chunks, level=6):
+    """Gzip an iterable of str/bytes chunks, flushing after each so streaming stays incremental."""
+    comp = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode("utf-8")
+        if chunk:
+            yield comp.compress(chunk) + comp.flush(zlib.Z_SYNC_FLUSH)
+    yield comp.flush()
+
+
+def compress_response(response, accept_encodings, min_size=1024, mimetypes=DEFAULT_MIMETYPES, gzip_level=6, brotli_quality=5):
+    """Compress a Flask/werkzeug response in place when worthwhile; returns the response."""
+    if response.mimetype not in mimetypes:
+        return response
+    response.vary.add("Accept-Encoding")
+    if (
+        response.status_code < 200
+        or response.status_code >= 300
+        or response.status_code == 204
+        or "Content-Encoding" in response.headers
+        or response.direct_passthrough
+    ):
+        return response
+    streamed = response.is_streamed
+    encoding = choose_encoding(accept_encodings, streamed=streamed)
+    if encoding is None:
+        return response
+    if streamed:
+        response.response = gzip_stream(response.response, gzip_level)
+        response.headers.pop("Content-Length", None)
+    else:
+        cache = getattr(response, "compressed_cache", None)
+        body = cache.get(encoding) if cache is not None else None
+        if body is None:
+            data = response.get_data()
+            if len(data) < min_size:
+                return response
+            body = compress(data, encoding, gzip_level, brotli_quality)
+            if cache is not None:
+                cache[encoding] = body
+        response.set_data(body)
+    response.headers["Content-Encoding"] = encoding
+    # the representation differs per encoding, so a strong validator must become weak
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
@@ -0,0 +1,326 @@
+# geo.py - distance helpers for job search (scalar and vectorized engines)
+import math
+import threading
+
+np = None  # numpy is optional (the scalar engine needs nothing extra); see load_numpy()
+
+EARTH_RADIUS_MILES = 3958.8
+
+
+def haversine_miles(lat1, lon1, lat2, lon2):
+    # returns distance in miles between two points
+    R = EARTH_RADIUS_MILES
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    dphi = math.radians(lat2 - lat1)
+    dlambda = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+    return R * c
+
+
+def load_numpy():
+    """Import numpy the first time a vectorized engine is built; None if it is not installed."""
+    global np
+    if np is None:
+        try:
+            import numpy
+        except ImportError:
+            return None
+        np = numpy
+    return np
+
+
+def _coord(value):
+    if value is None or value == "":
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class ScalarDistanceEngine:
+    """Per-row haversine with the math module. Always available."""
+
+    name = "scalar"
+
+    def rank(self, center_lat, center_lng, rows, radius=None, by_distance=False):
+        """
+        Returns [(row, distance_miles or None)] for rows (dicts with id/lat/lng).
+        Rows farther than radius are dropped; rows without coordinates are kept with None.
+        by_distance sorts nearest first (unlocated last), otherwise input order is kept.
+        """
+        out = []
+        for r in rows:
+            jlat = _coord(r.get("lat"))
+            jlng = _coord(r.get("lng"))
+            dist = None
+            if jlat is not None and jlng is not None:
+                dist = haversine_miles(center_lat, center_lng, jlat, jlng)
+                if radius is not None and dist > radius:
+                    continue
+            out.append((r, dist))
+        if by_distance:
+            out.sort(key=lambda x: (x[1] is None, x[1] if x[1] is not None else 0.0))
+        return out
+
+
+class CoordinateColumns:
+    """Located jobs as parallel float64 arrays, ids sorted ascending."""
+
+    def __init__(self, ids, lats, lngs):
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.lat_rad = np.radians(np.asarray(lats, dtype=np.float64))
+        self.lng_rad = np.radians(np.asarray(lngs, dtype=np.float64))
+        self.cos_lat = np.cos(self.lat_rad)
+
+    @classmethod
+    def from_rows(cls, rows):
+        ids, lats, lngs = [], [], []
+        for r in rows:
+            jlat = _coord(r.get("lat"))
+            jlng = _coord(r.get("lng"))
+            if jlat is None or jlng is None:
+                continue
+            ids.append(r["id"])
+            lats.append(jlat)
+            lngs.append(jlng)
+        order = sorted(range(len(ids)), key=ids.__getitem__)
+        return cls([ids[i] for i in order], [lats[i] for i in order], [lngs[i] for i in order])
+
+    def __len__(self):
+        return len(self.ids)
+
+    def distances(self, center_lat, center_lng, index=None):
+        """Haversine distance in miles from the center to every column entry (or to `index`)."""
+        lat = self.lat_rad if index is None else self.lat_rad[index]
+        lng = self.lng_rad if index is None else self.lng_rad[index]
+        cos_lat = self.cos_lat if index is None else self.cos_lat[index]
+        phi1 = math.radians(center_lat)
+        a = np.sin((lat - phi1) / 2.0) ** 2 + math.cos(phi1) * cos_lat * np.sin((lng - math.radians(center_lng)) / 2.0) ** 2
+        return EARTH_RADIUS_MILES * 2.0 * np.arctan2(np.sqrt(a), np.sqrt(1.0 - a))
+
+    def within(self, center_lat, center_lng, radius=None):
+        """(ids, distances) of entries inside radius, nearest first, in one vectorized pass."""
+        dist = self.distances(center_lat, center_lng)
+        if radius is not None:
+            mask = dist <= radius
+            ids, dist = self.ids[mask], dist[mask]
+        else:
+            ids = self.ids
+        order = np.argsort(dist, kind="stable")
+        return ids[order], dist[order]
+
+
+class NumpyDistanceEngine:
+    """
+    Vectorized engine. Job coordinates are cached as CoordinateColumns and reloaded
+    whenever version() changes (models.get_data_version(db, "jobs") in the app).
+    """
+
+    name = "numpy"
+
+    def __init__(self, load_rows, version):
+        if load_numpy() is None:
+            raise RuntimeError("numpy is not installed")
+        self._load_rows = load_rows
+        self._version = version
+        self._columns = None
+        self._columns_version = None
+        self._lock = threading.Lock()
+
+    def columns(self):
+        current = self._version()
+        if self._columns is None or current != self._columns_version:
+            with self._lock:
+                if self._columns is None or current != self._columns_version:
+                    self._columns = CoordinateColumns.from_rows(self._load_rows())
+                    self._columns_version = current
+        return self._columns
+
+    def within(self, center_lat, center_lng, radius=None):
+        return self.columns().within(center_lat, center_lng, radius)
+
+    def rank(self, center_lat, center_lng, rows, radius=None, by_distance=False):
+        """Same contract as ScalarDistanceEngine.rank, computed against the cached columns."""
+        rows = list(rows)
+        if not rows:
+            return []
+        cols = self.columns()
+        row_ids = np.fromiter((r["id"] for r in rows), dtype=np.int64, count=len(rows))
+        pos = np.searchsorted(cols.ids, row_ids)
+        pos = np.minimum(pos, max(len(cols) - 1, 0))
+        found = (cols.ids[pos] == row_ids) if len(cols) else np.zeros(len(rows), dtype=bool)
+        dist = np.full(len(rows), np.nan)
+        if found.any():
+            dist[found] = cols.distances(center_lat, center_lng, pos[found])
+        keep = np.ones(len(rows), dtype=bool)
+        if radius is not None:
+            keep = ~(dist > radius)  # nan (unlocated) rows stay
+        idx = np.nonzero(keep)[0]
+        if by_distance:
+            # argsort puts nan last, matching the scalar engine's unlocated-last ordering
+            idx = idx[np.argsort(dist[idx], kind="stable")]
+        return [(rows[i], None if math.isnan(dist[i]) else float(dist[i])) for i in idx]
+
+
+class ClusterIndex:
+    """
+    Grid index over located jobs for the map. At each zoom level the world is cut into
+    square cells about cell_px screen pixels wide (256px tiles); every cell keeps its
+    job count, coordinate sums (for the centroid) and one job id. Grids are built lazily
+    per zoom and dropped whenever version() changes, so a viewport query only touches
+    the cells it covers, independent of how many jobs exist.
+    """
+
+    def __init__(self, load_rows, version, cell_px=64):
+        self._load_rows = load_rows
+        self._version = version
+        self.cell_px = cell_px
+        self._points = None
+        self._points_version = None
+        self._grids = {}
+        self._lock = threading.Lock()
+
+    def cell_size(self, zoom):
+        """Cell width in degrees at an integer zoom level."""
+        return 360.0 / (2 ** zoom) * (self.cell_px / 256.0)
+
+    def _grid(self, zoom):
+        current = self._version()
+        with self._lock:
+            if self._points is None or current != self._points_version:
+                self._points = []
+                for r in self._load_rows():
+                    jlat = _coord(r.get("lat"))
+                    jlng = _coord(r.get("lng"))
+                    if jlat is not None and jlng is not None:
+                        self._points.append((r["id"], jlat, jlng))
+                self._points_version = current
+                self._grids = {}
+            grid = self._grids.get(zoom)
+            if grid is None:
+                size = self.cell_size(zoom)
+                grid = {}
+                for job_id, jlat, jlng in self._points:
+                    key = (int((jlng + 180.0) // size), int((jlat + 90.0) // size))
+                    cell = grid.get(key)
+                    if cell is None:
+                        grid[key] = [1, jlat, jlng, job_id]
+                    else:
+                        cell[0] += 1
+                        cell[1] += jlat
+                        cell[2] += jlng
+                self._grids[zoom] = grid
+            return grid
+
+    def clusters(self, south, west, north, east, zoom):
+        """
+        Cells intersecting the viewport as dicts with count and centroid lat/lng;
+        single-job cells also carry that job's id. west > east wraps the antimeridian.
+        """
+        zoom = max(0, int(zoom))
+        grid = self._grid(zoom)
+        size = self.cell_size(zoom)
+        lng_ranges = [(west, east)] if west <= east else [(west, 180.0), (-180.0, east)]
+        y0, y1 = int((south + 90.0) // size), int((north + 90.0) // size)
+        out = []
+        for w, e in lng_ranges:
+            x0, x1 = int((w + 180.0) // size), int((e + 180.0) // size)
+            if (x1 - x0 + 1) * (y1 - y0 + 1) > len(grid):
+                cells = [(k, c) for k, c in grid.items() if x0 <= k[0] <= x1 and y0 <= k[1] <= y1]
+            else:
+                cells = [((x, y), grid[(x, y)]) for x in range(x0, x1 + 1) for y in range(y0, y1 + 1) if (x, y) in grid]
+            for _, (count, lat_sum, lng_sum, job_id) in cells:
+                item = {"lat": lat_sum / count, "lng": lng_sum / count, "count": count}
+                if count == 1:
+                    item["id"] = job_id
+                out.append(item)
+        return out
+
+
+def make_distance_engine(name, load_rows=None, version=None):
+    """Build the engine selected by DISTANCE_ENGINE, falling back to scalar without numpy."""
+    if (name or "").lower() == "numpy" and load_rows is not None and load_numpy() is not None:
+        return NumpyDistanceEngine(load_rows, version or (lambda: None))
+    return ScalarDistanceEngine()
+
+
+# ---- short addresses ----
+# "123 Main St, Springfield, Illinois, 62701, United States" -> "123 Main St, Springfield, IL".
+# Computed once when a job is written and stored in jobs.short_location.
+US_STATES = {
+    "alabama":"AL","alaska":"AK","arizona":"AZ","arkansas":"AR","california":"CA","colorado":"CO",
+    "connecticut":"CT","delaware":"DE","florida":"FL","georgia":"GA","hawaii":"HI","idaho":"ID",
+    "illinois":"IL","indiana":"IN","iowa":"IA","kansas":"KS","kentucky":"KY","louisiana":"LA",
+    "maine":"ME","maryland":"MD","massachusetts":"MA","michigan":"MI","minnesota":"MN","mississippi":"MS",
+    "missouri":"MO","montana":"MT","nebraska":"NE","nevada":"NV","new hampshire":"NH","new jersey":"NJ",
+    "new mexico":"NM","new york":"NY","north carolina":"NC","north dakota":"ND","ohio":"OH",
+    "oklahoma":"OK","oregon":"OR","pennsylvania":"PA","rhode island":"RI","south carolina":"SC",
+    "south dakota":"SD","tennessee":"TN","texas":"TX","utah":"UT","vermont":"VT","virginia":"VA",
+    "washington":"WA","west virginia":"WV","wisconsin":"WI","wyoming":"WY","district of columbia":"DC"
+}
+
+
+def _lookup_us_state_abbrev(name):
+    if not name:
+        return None
+    n = name.strip().lower()
+    if len(n) == 2 and n.upper() in US_STATES.values():
+        return n.upper()
+    if n in US_STATES:
+        return US_STATES[n]
+    return None
+
+
+def short_addr_from_display(display_name):
+    if not display_name:
+        return ""
+    parts = [p.strip() for p in display_name.split(",") if p.strip()]
+    if not parts:
+        return ""
+    street = parts[0]
+    city = None
+    state = None
+    if len(parts) >= 2:
+        city = parts[1]
+    candidates = []
+    if len(parts) >= 3:
+        candidates.extend(parts[2:5])
+    else:
+        candidates.extend(parts[1:])
+    for c in candidates:
+        if not c:
+            continue
+        if c.replace(" ", "").isdigit():
+            continue
+        abbrev = _lookup_us_state_abbrev(c)
+        if abbrev:
+            state = abbrev
+            break
+        first_tok = c.split()[0]
+        abbrev = _lookup_us_state_abbrev(first_tok)
+        if abbrev:
+            state = abbrev
+            break
+    if state is None:
+        if len(parts) >= 3:
+            region = parts[2]
+            if region and region.lower() != parts[-1].lower():
+                state = region
+            else:
+                state = parts[-2] if len(parts) >= 2 else None
+        else:
+            state = None
+    out_parts = []
+    if street:
+        out_parts.append(street)
+    city_state = []
+    if city:
+        city_state.append(city)
+    if state:
+        city_state.append(state)
+    if city_state:
+        out_parts.append(", ".join(city_state))
+    return ", ".join(out_parts)
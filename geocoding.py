@@ -0,0 +1,227 @@
+# geocoding.py - address -> (lat, lng, display_name) via Nominatim, with a two-level cache
+#
+# Lookups go: in-memory LRU -> geocode_cache table -> HTTP. Misses ("no such place") are
+# cached too, with a shorter TTL; transport errors are not cached so they retry next time.
+# Network requests are spaced at least min_interval seconds apart (Nominatim allows 1/s)
+# across every process sharing the database, through the rate_limits table.
+# GeocodeWorker resolves jobs saved with geocode_status='pending' in the background; each
+# worker claims its batch with a lease, so workers in several processes never fetch the same job.
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from models import (
+    get_cached_geocode,
+    put_cached_geocode,
+    utc_now_iso,
+    claim_geocode_batch,
+    release_geocode_claims,
+    reserve_rate_slot,
+    set_job_geocode,
+)
+
+log = logging.getLogger(__name__)
+
+NOMINATIM_URL = "https://nominatim.openstreetmap.org/search"
+NOT_FOUND = (None, None, None)
+RATE_LIMIT_NAME = "nominatim"
+
+
+def is_permanent_error(exc):
+    """True for an HTTP 4xx (other than 429): retrying the same address will not help."""
+    status = getattr(getattr(exc, "response", None), "status_code", None)
+    return status is not None and 400 <= status < 500 and status != 429
+
+
+def normalize_address(address):
+    """Cache key for an address: case, whitespace and punctuation around separators ignored."""
+    text = re.sub(r"\s+", " ", str(address or "")).strip().lower()
+    text = re.sub(r"\s*,\s*", ", ", text)
+    return text.strip(" ,.")
+
+
+class Geocoder:
+    """
+    Nominatim client with an LRU (max_entries) in front of the persistent geocode_cache table.
+    ttl / negative_ttl are seconds for found / not-found results.
+    """
+
+    def __init__(self, db_path, url=NOMINATIM_URL, user_agent="GetAJob/1.0 (dev@localhost)", timeout=8,
+                 ttl=30 * 86400, negative_ttl=86400, max_entries=1024, min_interval=1.0):
+        self.db_path = db_path
+        self.url = url
+        self.user_agent = user_agent
+        self.timeout = timeout
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self.min_interval = min_interval
+        self._lru = OrderedDict()  # key -> ((lat, lng, name), expires_at)
+        self._lock = threading.Lock()
+        self._session = None
+        self._throttle_lock = threading.Lock()
+
+    @property
+    def session(self):
+        # one keep-alive session, opened on first use
+        if self._session is None:
+            import requests  # deferred so processes that never geocode skip the import
+
+            self._session = requests.Session()
+            self._session.headers["User-Agent"] = self.user_agent
+        return self._session
+
+    def cached(self, address):
+        """(found, result) from the LRU or the cache table without any network call."""
+        key = normalize_address(address)
+        if not key:
+            return True, NOT_FOUND
+        now = utc_now_iso()
+        with self._lock:
+            entry = self._lru.get(key)
+            if entry is not None:
+                if entry[1] > now:
+                    self._lru.move_to_end(key)
+                    return True, entry[0]
+                del self._lru[key]
+        row = get_cached_geocode(self.db_path, key)
+        if row is None:
+            return False, None
+        result = (row["lat"], row["lng"], row["display_name"]) if row["found"] else NOT_FOUND
+        self._remember(key, result, row["expires_at"])
+        return True, result
+
+    def lookup(self, address):
+        """Returns (lat, lng, display_name), or (None, None, None) if not found / on failure."""
+        try:
+            return self.resolve(address)
+        except Exception as e:
+            log.warning("Geocode failed for %r: %s", address, e)
+            return NOT_FOUND
+
+    def resolve(self, address):
+        """Like lookup(), but transport/HTTP errors propagate so callers can retry later."""
+        hit, result = self.cached(address)
+        if hit:
+            return result
+        result = self.fetch(address)
+        self.store(address, result)
+        return result
+
+    def _throttle(self):
+        if self.min_interval <= 0:
+            return
+        # the slot is reserved in the database, so all processes together stay under the limit;
+        # the lock keeps this process's threads from each holding a slot while they sleep
+        with self._throttle_lock:
+            wait = reserve_rate_slot(self.db_path, RATE_LIMIT_NAME, self.min_interval)
+            if wait > 0:
+                time.sleep(wait)
+
+    def fetch(self, address):
+        """One Nominatim request. Raises on transport/HTTP errors; NOT_FOUND when there is no match."""
+        self._throttle()
+        resp = self.session.get(self.url, params={"q": address, "format": "json", "limit": 1}, timeout=self.timeout)
+        resp.raise_for_status()
+        data = resp.json()
+        if isinstance(data, list) and len(data) > 0:
+            item = data[0]
+            return float(item.get("lat")), float(item.get("lon")), item.get("display_name")
+        return NOT_FOUND
+
+    def store(self, address, result):
+        key = normalize_address(address)
+        found = result[0] is not None and result[1] is not None
+        expires_at = put_cached_geocode(
+            self.db_path, key, result[0], result[1], result[2], found,
+            self.ttl if found else self.negative_ttl,
+        )
+        self._remember(key, result, expires_at)
+
+    def _remember(self, key, result, expires_at):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._lru[key] = (result, expires_at)
+            self._lru.move_to_end(key)
+            while len(self._lru) > self.max_entries:
+                self._lru.popitem(last=False)
+
+
+class GeocodeWorker:
+    """
+    Resolves jobs with geocode_status='pending' from a daemon thread (start()) or the
+    foreground (run_once()). Requests go through the geocoder, so they share its cache
+    and rate limit. A job whose address is rejected (HTTP 4xx) is marked failed; on a
+    transport error, 5xx or 429 the batch stops, its unfinished claims are released and
+    it is retried after retry_interval. Claims expire after lease_seconds if a worker dies.
+    """
+
+    def __init__(self, geocoder, db_path, batch_size=20, poll_interval=30.0, retry_interval=60.0, lease_seconds=300):
+        self.geocoder = geocoder
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self.retry_interval = retry_interval
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._stopping.clear()
+                self._thread = threading.Thread(target=self._run, name="geocode-jobs", daemon=True)
+                self._thread.start()
+
+    def stop(self, timeout=None):
+        self._stopping.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            if self._thread.is_alive():
+                return
+            self._thread = None
+        self._stopping.clear()
+
+    def wake(self):
+        self._wake.set()
+
+    def run_once(self):
+        """Geocode one batch of pending jobs. Returns the number of jobs settled; raises on transport errors."""
+        rows = claim_geocode_batch(self.db_path, self.batch_size, self.lease_seconds)
+        done = 0
+        try:
+            for row in rows:
+                if self._stopping.is_set():
+                    break
+                try:
+                    lat, lng, _ = self.geocoder.resolve(row["location_text"]) if row["location_text"] else NOT_FOUND
+                except Exception as e:
+                    if not is_permanent_error(e):
+                        raise
+                    log.warning("Geocoding rejected job %s (%r): %s", row["id"], row["location_text"], e)
+                    lat, lng = None, None
+                set_job_geocode(self.db_path, row["id"], row["location_text"], lat, lng)
+                done += 1
+        finally:
+            release_geocode_claims(self.db_path, [r["id"] for r in rows[done:]])
+        return done
+
+    def _run(self):
+        while not self._stopping.is_set():
+            wait = self.poll_interval
+            try:
+                if self.run_once() == self.batch_size:
+                    continue
+            except Exception as e:
+                log.warning("Geocoding worker will retry in %ss: %s", self.retry_interval, e)
+                wait = self.retry_interval
+            self._wake.wait(wait)
+            self._wake.clear()
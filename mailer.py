@@ -0,0 +1,218 @@
+# mailer.py - background delivery of the email outbox, plus a local SMTP stand-in
+#
+# Requests only call models.enqueue_email(); OutboxWorker drains email_outbox in batches,
+# sending each batch over a single SMTP connection and retrying failures with backoff.
+# Run the stand-in with `python mailer.py [port]` and point MAIL_SERVER/MAIL_PORT at it.
+import logging
+import random
+import socketserver
+import sys
+import threading
+
+from models import claim_outbox_batch, mark_email_sent, mark_email_failed
+
+log = logging.getLogger(__name__)
+
+
+def backoff_seconds(attempt, base=30, cap=3600):
+    """Delay before retrying after the attempt-th failure (1-based): exponential, capped, +/-20% jitter."""
+    delay = min(cap, base * (2 ** (attempt - 1)))
+    return delay * random.uniform(0.8, 1.2)
+
+
+class OutboxWorker:
+    """
+    Delivers queued emails from a daemon thread (start()) or the foreground (run_once()/drain()).
+    wake() makes the thread look at the outbox immediately instead of at the next poll.
+    Without a `mail` (flask_mail.Mail) one is created for the app when the first batch is sent.
+    """
+
+    def __init__(self, app, mail=None, batch_size=50, max_attempts=6, backoff_base=30, backoff_max=3600, poll_interval=5.0):
+        self.app = app
+        self.mail = mail
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.poll_interval = poll_interval
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._stopping.clear()
+                self._thread = threading.Thread(target=self._run, name="email-outbox", daemon=True)
+                self._thread.start()
+
+    def stop(self, timeout=None):
+        self._stopping.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def wake(self):
+        self._wake.set()
+
+    def run_once(self):
+        """Claim and deliver one batch. Returns the number of emails attempted."""
+        rows = claim_outbox_batch(self.app.config["DATABASE"], self.batch_size)
+        if rows:
+            self._deliver(rows)
+        return len(rows)
+
+    def drain(self):
+        """Deliver until nothing is due. Returns the number of emails attempted."""
+        total = 0
+        while True:
+            n = self.run_once()
+            total += n
+            if n < self.batch_size:
+                return total
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                if self.run_once() == self.batch_size:
+                    continue  # probably more waiting
+            except Exception:
+                log.exception("Email outbox worker failed")
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+
+    def _mail(self):
+        if self.mail is None:
+            from flask_mail import Mail  # only processes that deliver email pay for the import
+
+            self.mail = Mail(self.app)
+        return self.mail
+
+    def _message(self, row):
+        from flask_mail import Message
+
+        return Message(
+            subject=row["subject"],
+            recipients=[row["recipient"]],
+            body=row["text_body"] or row["subject"],
+            html=row["html_body"],
+        )
+
+    def _deliver(self, rows):
+        db_path = self.app.config["DATABASE"]
+        pending = list(rows)
+        with self.app.app_context():
+            try:
+                with self._mail().connect() as conn:
+                    while pending:
+                        row = pending[0]
+                        try:
+                            conn.send(self._message(row))
+                        except Exception as e:
+                            self._failed(row, e)
+                        else:
+                            mark_email_sent(db_path, row["id"])
+                        pending.pop(0)
+            except Exception as e:
+                # could not connect (or the connection broke between messages)
+                log.warning("SMTP connection failed, %d email(s) will be retried: %s", len(pending), e)
+                for row in pending:
+                    self._failed(row, e)
+
+    def _failed(self, row, error):
+        attempt = row["attempts"] + 1
+        if attempt >= self.max_attempts:
+            log.error("Giving up on email %s to %s after %d attempts: %s", row["id"], row["recipient"], attempt, error)
+            mark_email_failed(self.app.config["DATABASE"], row["id"], error)
+        else:
+            mark_email_failed(
+                self.app.config["DATABASE"], row["id"], error,
+                retry_in_seconds=backoff_seconds(attempt, self.backoff_base, self.backoff_max),
+            )
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    def _reply(self, line):
+        self.wfile.write((line + "\r\n").encode())
+
+    def handle(self):
+        self.server.connections += 1
+        self._reply("220 localhost SMTP stand-in")
+        mail_from, rcpt_tos = None, []
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode("utf-8", "replace").strip()
+            verb = command[:4].upper()
+            if verb == "EHLO":
+                self.wfile.write(b"250-localhost\r\n250 HELP\r\n")
+            elif verb == "HELO":
+                self._reply("250 localhost")
+            elif verb == "MAIL":
+                mail_from, rcpt_tos = command.partition(":")[2].strip(), []
+                self._reply("250 OK")
+            elif verb == "RCPT":
+                rcpt_tos.append(command.partition(":")[2].strip())
+                self._reply("250 OK")
+            elif verb == "DATA":
+                self._reply("354 End data with <CR><LF>.<CR><LF>")
+                data = []
+                for raw in self.rfile:
+                    if raw in (b".\r\n", b".\n"):
+                        break
+                    data.append(raw[1:] if raw.startswith(b"..") else raw)
+                self.server.received(mail_from, rcpt_tos, b"".join(data))
+                self._reply("250 OK")
+            elif verb in ("RSET", "NOOP"):
+                if verb == "RSET":
+                    mail_from, rcpt_tos = None, []
+                self._reply("250 OK")
+            elif verb == "QUIT":
+                self._reply("221 Bye")
+                return
+            else:
+                self._reply("502 Command not implemented")
+
+
+class LocalSMTPServer(socketserver.ThreadingTCPServer):
+    """
+    Minimal SMTP sink for development and tests. Accepts every message and keeps
+    (mail_from, rcpt_tos, data) tuples in .messages; .connections counts sessions.
+    """
+
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, host="127.0.0.1", port=0, echo=False):
+        super().__init__((host, port), _SMTPHandler)
+        self.messages = []
+        self.connections = 0
+        self.echo = echo
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def received(self, mail_from, rcpt_tos, data):
+        self.messages.append((mail_from, rcpt_tos, data))
+        if self.echo:
+            print(f"---- from {mail_from} to {', '.join(rcpt_tos)}\n{data.decode('utf-8', 'replace')}", flush=True)
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, name="smtp-stand-in", daemon=True).start()
+        return self
+
+
+if __name__ == "__main__":
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 1025
+    server = LocalSMTPServer(port=port, echo=True)
+    print(f"SMTP stand-in listening on 127.0.0.1:{server.port} (MAIL_SERVER=127.0.0.1 MAIL_PORT={server.port} MAIL_USE_TLS=0)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
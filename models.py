@@ -1,8 +1,18 @@
 # models.py
 import sqlite3
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
+import contextlib
+import math
 import os
+import queue
+import re
 import secrets
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+
+from geo import short_addr_from_display
 
 def _row_factory(cursor, row):
     d = {}
@@ -10,11 +20,539 @@ def _row_factory(cursor, row):
         d[col[0]] = row[idx]
     return d
 
+# ---- connection pooling ----
+# Every helper below opens a connection with get_connection() and closes it when done.
+# Connections come from a small per-database pool, so close() only hands the
+# connection back; PRAGMAs are applied once when a connection is first opened.
+# When a request scope is installed (see set_connection_scope), all helpers used
+# during one request share a single pinned connection that is released at teardown.
+
+DEFAULT_POOL_SIZE = 8
+DEFAULT_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "temp_store": "MEMORY",
+    "busy_timeout": 5000,  # ms to wait for another connection's write lock
+}
+
+class PooledConnection(sqlite3.Connection):
+    """sqlite3 connection whose close() returns it to its pool instead of closing it."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.pool = None
+        self.pinned = False
+
+    def close(self):
+        # pinned connections belong to the request scope and are released at teardown
+        if self.pinned:
+            return
+        if self.pool is not None:
+            self.pool.release(self)
+        else:
+            super().close()
+
+    def dispose(self):
+        super().close()
+
+class ConnectionPool:
+    """
+    Keeps up to `size` idle connections for one database file.
+    acquire() never blocks: when the pool is empty a new connection is opened, and
+    connections returned to a full pool are closed.
+    """
+
+    def __init__(self, db_path, size=DEFAULT_POOL_SIZE, pragmas=None):
+        self.db_path = db_path
+        self.size = max(int(size), 0)
+        self.pragmas = dict(DEFAULT_PRAGMAS if pragmas is None else pragmas)
+        self._idle = queue.LifoQueue(maxsize=self.size) if self.size else None
+        self.tables = set()  # optional tables (FTS, R*Tree) known to exist, see _has_table()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, factory=PooledConnection, check_same_thread=False)
+        conn.row_factory = _row_factory
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name}={value}")
+        conn.pool = self
+        return conn
+
+    def acquire(self):
+        if self._idle is not None:
+            try:
+                return self._idle.get_nowait()
+            except queue.Empty:
+                pass
+        return self._connect()
+
+    def release(self, conn):
+        conn.pinned = False
+        conn.set_trace_callback(None)
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            conn.dispose()
+            return
+        if self._idle is None:
+            conn.dispose()
+            return
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            conn.dispose()
+
+    def close_all(self):
+        if self._idle is None:
+            return
+        while True:
+            try:
+                self._idle.get_nowait().dispose()
+            except queue.Empty:
+                break
+
+_pools = {}
+_pools_lock = threading.Lock()
+_pool_settings = {"size": DEFAULT_POOL_SIZE, "pragmas": None}
+_db_pool_settings = {}  # db_path -> settings overriding _pool_settings
+_connection_scope = None
+
+def _update_settings(defaults, per_db, db_path, changes):
+    """
+    Apply `changes` (None values ignored) to db_path's settings, or to the defaults when
+    db_path is None. Returns the db_paths whose effective settings changed (None = every
+    database without its own settings).
+    """
+    current = per_db.get(db_path, defaults) if db_path is not None else defaults
+    updated = dict(current, **{k: v for k, v in changes.items() if v is not None})
+    if db_path is None:
+        defaults.update(updated)
+    else:
+        per_db[db_path] = updated
+    return [] if updated == current else [db_path]
+
+def configure_pool(size=None, pragmas=None, db_path=None):
+    """
+    Set pool size / per-connection PRAGMAs for db_path, or the defaults for databases without
+    their own settings. Only pools whose settings changed are drained (and rebuilt lazily), so
+    configuring one app's database leaves the pools of other apps alone.
+    """
+    with _pools_lock:
+        changed = _update_settings(_pool_settings, _db_pool_settings, db_path, {"size": size, "pragmas": pragmas})
+        for path in list(_pools):
+            if path in changed or (None in changed and path not in _db_pool_settings):
+                _pools.pop(path).close_all()
+
+def get_pool(db_path):
+    pool = _pools.get(db_path)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(db_path)
+            if pool is None:
+                settings = _db_pool_settings.get(db_path, _pool_settings)
+                pool = ConnectionPool(db_path, settings["size"], settings["pragmas"])
+                _pools[db_path] = pool
+    return pool
+
+def set_connection_scope(getter):
+    """
+    Install a callable returning a dict (db_path -> connection) for the current
+    request, or None outside of one. app.py wires this to flask.g.
+    """
+    global _connection_scope
+    _connection_scope = getter
+
+def release_connections(conns):
+    """Release every connection pinned to a finished request scope."""
+    if not conns:
+        return
+    for conn in conns.values():
+        conn.pool.release(conn)
+    conns.clear()
+
 def get_connection(db_path):
-    conn = sqlite3.connect(db_path)
-    conn.row_factory = _row_factory
+    scope = _connection_scope() if _connection_scope is not None else None
+    if scope is None:
+        conn = get_pool(db_path).acquire()
+    else:
+        conn = scope.get(db_path)
+        if conn is None:
+            conn = get_pool(db_path).acquire()
+            conn.pinned = True
+            scope[db_path] = conn
+    if _query_log is not None:
+        conn.set_trace_callback(_query_log.append)
     return conn
 
+# ---- single writer ----
+# With configure_writer(enabled=True), write helpers hand their work to one writer thread
+# per database and process instead of committing from the request thread. The thread takes
+# everything queued (up to max_batch writes), runs it in a single BEGIN IMMEDIATE transaction
+# with a SAVEPOINT per write, so one failing write does not undo the others, and commits
+# once. Concurrent requests then share commits instead of queueing on the SQLite lock.
+# Callers that need a result (a row id) wait for the commit, at most `timeout` seconds; the
+# rest can get a Future. If the thread dies, everything queued fails and get_writer() starts
+# a new one for the next write.
+
+DEFAULT_WRITER_BATCH = 100
+DEFAULT_WRITER_TIMEOUT = 30.0
+
+class WriteQueue:
+    """Writer thread for one database. submit(fn, *args) runs fn(conn, *args) in the next batch."""
+
+    def __init__(self, db_path, max_batch=DEFAULT_WRITER_BATCH, timeout=DEFAULT_WRITER_TIMEOUT):
+        self.db_path = db_path
+        self.max_batch = max(int(max_batch), 1)
+        self.timeout = timeout
+        self.pid = os.getpid()  # threads do not survive fork(); get_writer() starts a new one
+        self._queue = queue.Queue()
+        self._closed = False
+        self._error = None
+        self._thread = threading.Thread(target=self._run, name="sqlite-writer", daemon=True)
+        self._thread.start()
+
+    @property
+    def alive(self):
+        return not self._closed and self._thread.is_alive()
+
+    def submit(self, fn, *args, wait=True):
+        """
+        Queue a write. With wait=True block until its batch is committed and return fn's result
+        (re-raising its exception); with wait=False return a Future right away. Raises
+        sqlite3.OperationalError if the writer has stopped or does not commit within timeout
+        (the write may still be committed later in that case).
+        """
+        if not self.alive:
+            raise sqlite3.OperationalError("database writer is not running")
+        future = Future()
+        self._queue.put((fn, args, future))
+        if self._closed:
+            self._fail_queued()  # the thread closed between the check and put()
+        if not wait:
+            return future
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            raise sqlite3.OperationalError(f"database writer did not commit within {self.timeout}s") from None
+
+    def flush(self):
+        """Wait until everything queued so far is committed."""
+        self.submit(lambda conn: None)
+
+    def stop(self, timeout=None):
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+    def _next_batch(self):
+        item = self._queue.get()
+        if item is None:
+            return None
+        batch = [item]
+        while len(batch) < self.max_batch:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                self._queue.put(None)  # stop after this batch
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        try:
+            conn = get_pool(self.db_path).acquire()
+        except Exception as e:
+            self._close(e)
+            return
+        batch = ()
+        try:
+            while True:
+                batch = self._next_batch()
+                if batch is None:
+                    break
+                self._commit(conn, batch)
+        except BaseException as e:
+            self._close(e, batch)
+            raise
+        finally:
+            conn.pool.release(conn)
+        self._close(sqlite3.OperationalError("database writer stopped"))
+
+    def _close(self, error, batch=()):
+        """Refuse new writes and fail everything not yet committed (`batch` and the queue) with error."""
+        self._error = error
+        self._closed = True
+        for _, _, future in batch or ():
+            if not future.done():
+                future.set_exception(error)
+        self._fail_queued()
+
+    def _fail_queued(self):
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            if item is not None and not item[2].done():
+                item[2].set_exception(self._error)
+
+    def _commit(self, conn, batch):
+        conn.set_trace_callback(_query_log.append if _query_log is not None else None)
+        results = []
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for fn, args, future in batch:
+                conn.execute("SAVEPOINT write")
+                try:
+                    results.append((future, True, fn(conn, *args)))
+                    conn.execute("RELEASE write")
+                except Exception as e:
+                    conn.execute("ROLLBACK TO write")
+                    conn.execute("RELEASE write")
+                    results.append((future, False, e))
+            conn.commit()
+        except Exception as e:
+            # BEGIN or COMMIT failed (e.g. busy past busy_timeout): nothing in the batch was written
+            if conn.in_transaction:
+                conn.rollback()
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for future, ok, value in results:
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
+
+_writers = {}
+_writer_settings = {"enabled": False, "max_batch": DEFAULT_WRITER_BATCH, "timeout": DEFAULT_WRITER_TIMEOUT}
+_db_writer_settings = {}  # db_path -> settings overriding _writer_settings
+
+def configure_writer(enabled=None, max_batch=None, timeout=None, db_path=None):
+    """
+    Turn the writer thread on or off for db_path (or by default). Writers whose settings
+    changed finish their queue and are restarted lazily; the others keep running.
+    """
+    with _pools_lock:
+        changed = _update_settings(
+            _writer_settings, _db_writer_settings, db_path,
+            {"enabled": None if enabled is None else bool(enabled), "max_batch": max_batch, "timeout": timeout},
+        )
+        writers = [
+            _writers.pop(path) for path in list(_writers)
+            if path in changed or (None in changed and path not in _db_writer_settings)
+        ]
+    for writer in writers:
+        if writer.pid == os.getpid():
+            writer.stop()
+
+def get_writer(db_path):
+    """The WriteQueue for db_path, or None when writes go straight to a connection."""
+    settings = _db_writer_settings.get(db_path, _writer_settings)
+    if not settings["enabled"]:
+        return None
+    writer = _writers.get(db_path)
+    if writer is None or writer.pid != os.getpid() or not writer.alive:
+        with _pools_lock:
+            writer = _writers.get(db_path)
+            if writer is None or writer.pid != os.getpid() or not writer.alive:
+                writer = WriteQueue(db_path, settings["max_batch"], settings["timeout"])
+                _writers[db_path] = writer
+    return writer
+
+def run_write(db_path, fn, *args, wait=True):
+    """
+    Run fn(conn, *args) as one committed write, on the writer thread when it is enabled.
+    fn must not commit. Returns fn's result, or a Future for it with wait=False.
+    """
+    writer = get_writer(db_path)
+    if writer is not None:
+        return writer.submit(fn, *args, wait=wait)
+    future = Future()
+    conn = get_connection(db_path)
+    try:
+        result = fn(conn, *args)
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        if wait:
+            raise
+        future.set_exception(e)
+        return future
+    finally:
+        conn.close()
+    if wait:
+        return result
+    future.set_result(result)
+    return future
+
+def flush_writes(db_path):
+    """Wait for queued writes to db_path to be committed (no-op without the writer thread)."""
+    writer = get_writer(db_path)
+    if writer is not None:
+        writer.flush()
+
+# ---- query plan checks ----
+_query_log = None
+
+@contextlib.contextmanager
+def record_queries():
+    """Collect every SQL statement (parameters expanded) run through get_connection()."""
+    global _query_log
+    _query_log = []
+    try:
+        yield _query_log
+    finally:
+        _query_log = None
+
+def find_table_scans(db_path, statements):
+    """
+    EXPLAIN QUERY PLAN each SELECT/UPDATE/DELETE and return [(sql, plan_detail)] for
+    every full table scan (a SCAN step that uses no index). Virtual tables, subqueries
+    and schema lookups are ignored.
+    """
+    conn = get_connection(db_path)
+    scans = []
+    seen = set()
+    try:
+        for sql in statements:
+            text = " ".join(sql.split())
+            if text in seen or not re.match(r"(?i)\s*(SELECT|UPDATE|DELETE|WITH)\b", text):
+                continue
+            seen.add(text)
+            plan = [r["detail"] for r in conn.execute("EXPLAIN QUERY PLAN " + sql).fetchall()]
+            derived = {m.group(2) for d in plan for m in [re.match(r"(CO-ROUTINE|MATERIALIZE) (\S+)", d)] if m}
+            for detail in plan:
+                m = re.match(r"SCAN (\S+)$", detail)
+                if m and m.group(1) not in derived and m.group(1) not in ("CONSTANT", "sqlite_master"):
+                    scans.append((text, detail))
+    finally:
+        conn.close()
+    return scans
+
+# ---- user cache ----
+# get_user_by_id() runs for every authenticated request (Flask-Login's user_loader) and
+# again in many views. Rows are memoized per request (see set_request_memo) and kept in
+# a small process-wide cache with a short TTL. Every helper that changes a user row
+# calls invalidate_user(), so bans and deletions are visible on the next lookup.
+
+DEFAULT_USER_CACHE_TTL = 5.0
+DEFAULT_USER_CACHE_SIZE = 1024
+
+class UserCache:
+    """Thread-safe LRU of user rows keyed by (db_path, user_id), each entry expiring after `ttl` seconds."""
+
+    def __init__(self, ttl=DEFAULT_USER_CACHE_TTL, max_size=DEFAULT_USER_CACHE_SIZE):
+        self.ttl = float(ttl)
+        self.max_size = max(int(max_size), 0)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, db_path, user_id):
+        key = (db_path, user_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            row, expires = entry
+            if expires <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return row
+
+    def put(self, db_path, user_id, row):
+        if self.ttl <= 0 or self.max_size == 0:
+            return
+        with self._lock:
+            self._entries[(db_path, user_id)] = (row, time.monotonic() + self.ttl)
+            self._entries.move_to_end((db_path, user_id))
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, db_path, user_id=None, email=None):
+        with self._lock:
+            if user_id is not None:
+                self._entries.pop((db_path, user_id), None)
+            if email is not None:
+                stale = [k for k, (row, _) in self._entries.items() if k[0] == db_path and row["email"] == email]
+                for k in stale:
+                    del self._entries[k]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+_user_cache = UserCache()
+_request_memo = None
+
+_db_user_caches = {}  # db_path -> UserCache with its own settings
+
+def configure_user_cache(ttl=None, max_size=None, db_path=None):
+    """
+    Set the process cache TTL (seconds; 0 disables it) and maximum number of entries for
+    db_path, or for databases without their own cache. The cache is only replaced (and
+    emptied) when the settings change.
+    """
+    global _user_cache
+    ttl = float(DEFAULT_USER_CACHE_TTL if ttl is None else ttl)
+    max_size = max(int(DEFAULT_USER_CACHE_SIZE if max_size is None else max_size), 0)
+    current = _user_cache if db_path is None else _db_user_caches.get(db_path)
+    if current is not None and (current.ttl, current.max_size) == (ttl, max_size):
+        return
+    cache = UserCache(ttl, max_size)
+    if db_path is None:
+        _user_cache = cache
+    else:
+        _db_user_caches[db_path] = cache
+
+def _user_cache_for(db_path):
+    return _db_user_caches.get(db_path, _user_cache)
+
+def set_request_memo(getter):
+    """
+    Install a callable returning a dict for memoizing lookups within the current
+    request, or None outside of one. app.py wires this to flask.g.
+    """
+    global _request_memo
+    _request_memo = getter
+
+def _memo():
+    return _request_memo() if _request_memo is not None else None
+
+def invalidate_user(db_path, user_id=None, email=None):
+    """Drop a user from the process cache and the current request's memo."""
+    _user_cache_for(db_path).invalidate(db_path, user_id=user_id, email=email)
+    memo = _memo()
+    if memo:
+        for key in [k for k, row in memo.items() if k[0] == "user" and k[1] == db_path
+                    and (k[2] == user_id or (email is not None and row is not None and row["email"] == email))]:
+            del memo[key]
+
+# ---- timestamps ----
+# Every timestamp column holds UTC in one fixed-width ISO format, so plain string
+# comparison is chronological and ORDER BY / range filters can use indexes directly.
+TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%S.%f"
+
+def format_timestamp(dt):
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return dt.strftime(TIMESTAMP_FORMAT)
+
+def utc_now_iso(offset_seconds=0):
+    return format_timestamp(datetime.utcnow() + timedelta(seconds=offset_seconds))
+
+def normalize_timestamp(value):
+    """Rewrite any ISO-like / SQLite CURRENT_TIMESTAMP string in TIMESTAMP_FORMAT; None if unparseable."""
+    if value is None or value == "":
+        return None
+    try:
+        return format_timestamp(datetime.fromisoformat(str(value).strip().replace("Z", "+00:00")))
+    except ValueError:
+        return None
+
 def _columns_for_table(conn, table):
     cur = conn.cursor()
     cur.execute(f"PRAGMA table_info('{table}')")
@@ -25,6 +563,16 @@ def _table_exists(conn, table):
     cur.execute("SELECT name FROM sqlite_master WHERE type='table' AND name = ?", (table,))
     return cur.fetchone() is not None
 
+def _has_table(conn, table):
+    """_table_exists() for request-time checks; tables found once are remembered by the pool."""
+    pool = getattr(conn, "pool", None)
+    if pool is not None and table in pool.tables:
+        return True
+    found = _table_exists(conn, table)
+    if found and pool is not None:
+        pool.tables.add(table)
+    return found
+
 def _ensure_table(conn, create_sql):
     cur = conn.cursor()
     cur.execute(create_sql)
@@ -47,7 +595,6 @@ def init_db(db_path):
         os.makedirs(db_dir, exist_ok=True)
 
     conn = get_connection(db_path)
-    conn.execute("PRAGMA journal_mode=WAL;")
 
     # Create tables if missing (CREATE TABLE IF NOT EXISTS)
     _ensure_table(
@@ -144,8 +691,472 @@ def init_db(db_path):
         # Log but continue
         print("models.init_db: failed to add application file columns:", e)
 
+    _ensure_messaging_tables(conn)
+    _ensure_data_versions(conn)
+
+    try:
+        _ensure_jobs_search_index(conn)
+    except sqlite3.OperationalError as e:
+        # SQLite built without FTS5: search_jobs() falls back to LIKE scans
+        print("models.init_db: full-text search index unavailable:", e)
+
+    try:
+        _ensure_jobs_spatial_index(conn)
+    except sqlite3.OperationalError as e:
+        # SQLite built without R*Tree: radius queries fall back to scanning every job
+        print("models.init_db: spatial index unavailable:", e)
+
     conn.close()
 
+def _ensure_messaging_tables(conn):
+    cur = conn.cursor()
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS user_warnings (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            message TEXT NOT NULL,
+            created_at TEXT NOT NULL
+        )
+    """
+    )
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            sender_id INTEGER NOT NULL,
+            recipient_id INTEGER NOT NULL,
+            body TEXT NOT NULL,
+            created_at TEXT NOT NULL,
+            is_read INTEGER NOT NULL DEFAULT 0
+        )
+    """
+    )
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS message_reports (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            reporter_id INTEGER NOT NULL,
+            user_a INTEGER NOT NULL,
+            user_b INTEGER NOT NULL,
+            message_id INTEGER,
+            message_snapshot TEXT,
+            reason TEXT,
+            created_at TEXT NOT NULL,
+            status TEXT DEFAULT 'open'
+        )
+    """
+    )
+    conn.commit()
+    _ensure_conversations_table(conn)
+
+def _ensure_conversations_table(conn):
+    """
+    One row per user pair (user_lo < user_hi, or equal for notes-to-self) summarizing the
+    thread: last message id/sender/time and unread counters for each side. It is kept
+    current in the same transaction as create_message(), mark_conversation_read() and
+    delete_conversation() in app.py, so the inbox is a single indexed read.
+    """
+    created = not _table_exists(conn, "conversations")
+    cur = conn.cursor()
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS conversations (
+            user_lo INTEGER NOT NULL,
+            user_hi INTEGER NOT NULL,
+            last_message_id INTEGER NOT NULL,
+            last_sender_id INTEGER NOT NULL,
+            last_at TEXT NOT NULL,
+            unread_lo INTEGER NOT NULL DEFAULT 0,
+            unread_hi INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_lo, user_hi)
+        )
+    """
+    )
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_conversations_lo ON conversations(user_lo, last_message_id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_conversations_hi ON conversations(user_hi, last_message_id)")
+    if created:
+        # backfill from existing messages
+        cur.execute(
+            """
+            INSERT INTO conversations (user_lo, user_hi, last_message_id, last_sender_id, last_at, unread_lo, unread_hi)
+            SELECT p.lo, p.hi, p.last_id, m.sender_id, m.created_at, p.unread_lo, p.unread_hi
+            FROM (
+                SELECT min(sender_id, recipient_id) AS lo,
+                       max(sender_id, recipient_id) AS hi,
+                       MAX(id) AS last_id,
+                       SUM(CASE WHEN is_read = 0 AND recipient_id = min(sender_id, recipient_id) THEN 1 ELSE 0 END) AS unread_lo,
+                       SUM(CASE WHEN is_read = 0 AND recipient_id = max(sender_id, recipient_id) AND sender_id <> recipient_id THEN 1 ELSE 0 END) AS unread_hi
+                FROM messages
+                GROUP BY lo, hi
+            ) p
+            JOIN messages m ON m.id = p.last_id
+        """
+        )
+    conn.commit()
+
+def _ensure_data_versions(conn):
+    """
+    Per-table change counters bumped by triggers, so in-process caches (distance columns,
+    API snapshots) can tell cheaply whether jobs changed, across workers too.
+    """
+    cur = conn.cursor()
+    cur.execute(
+        """
+        CREATE TABLE IF NOT EXISTS data_versions (
+            name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        )
+    """
+    )
+    cur.execute("INSERT OR IGNORE INTO data_versions (name, version) VALUES ('jobs', 0)")
+    for event in ("INSERT", "UPDATE", "DELETE"):
+        cur.execute(
+            f"""
+            CREATE TRIGGER IF NOT EXISTS jobs_version_{event.lower()} AFTER {event} ON jobs BEGIN
+                UPDATE data_versions SET version = version + 1 WHERE name = 'jobs';
+            END
+        """
+        )
+    conn.commit()
+
+def get_data_version(db_path, name):
+    conn = get_connection(db_path)
+    cur = conn.cursor()
+    cur.execute("SELECT version FROM data_versions WHERE name = ?", (name,))
+    row = cur.fetchone()
+    conn.close()
+    return row["version"] if row else None
+
+def _ensure_jobs_search_index(conn):
+    """
+    FTS5 index over jobs.title/description/tags (external content table).
+    Triggers keep it in sync with every INSERT/UPDATE/DELETE on jobs, which covers
+    create_job, update_job, delete_job and delete_user.
+    """
+    created = not _table_exists(conn, "jobs_fts")
+    cur = conn.cursor()
+    cur.execute(
+        """
+        CREATE VIRTUAL TABLE IF NOT EXISTS jobs_fts USING fts5(
+            title, description, tags,
+            content='jobs', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2'
+        )
+    """
+    )
+    cur.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS jobs_fts_ai AFTER INSERT ON jobs BEGIN
+            INSERT INTO jobs_fts(rowid, title, description, tags)
+            VALUES (new.id, new.title, new.description, coalesce(new.tags, ''));
+        END
+    """
+    )
+    cur.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS jobs_fts_ad AFTER DELETE ON jobs BEGIN
+            INSERT INTO jobs_fts(jobs_fts, rowid, title, description, tags)
+            VALUES ('delete', old.id, old.title, old.description, coalesce(old.tags, ''));
+        END
+    """
+    )
+    cur.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS jobs_fts_au AFTER UPDATE OF title, description, tags ON jobs BEGIN
+            INSERT INTO jobs_fts(jobs_fts, rowid, title, description, tags)
+            VALUES ('delete', old.id, old.title, old.description, coalesce(old.tags, ''));
+            INSERT INTO jobs_fts(rowid, title, description, tags)
+            VALUES (new.id, new.title, new.description, coalesce(new.tags, ''));
+        END
+    """
+    )
+    if created:
+        # index rows that existed before the search table did
+        cur.execute("INSERT INTO jobs_fts(jobs_fts) VALUES ('rebuild')")
+    conn.commit()
+
+# ---- schema migrations ----
+# Ordered (version, description, function(conn)) steps. apply_migrations() runs every step
+# newer than the highest version recorded in schema_version, each in its own transaction.
+
+def _migration_secondary_indexes(conn):
+    statements = [
+        "CREATE INDEX IF NOT EXISTS idx_users_created_at ON users(created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_jobs_employer ON jobs(employer_id, created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_jobs_created ON jobs(created_at, id)",
+        "CREATE INDEX IF NOT EXISTS idx_applications_job ON applications(job_id, created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_applications_user ON applications(user_id, created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_ratings_target ON ratings(target_type, target_id, created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_ratings_rater ON ratings(rater_id)",
+        "CREATE INDEX IF NOT EXISTS idx_tokens_email_purpose ON tokens(email, purpose, created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_tokens_expires ON tokens(expires_at)",
+        "CREATE INDEX IF NOT EXISTS idx_messages_pair ON messages(sender_id, recipient_id, id)",
+        "CREATE INDEX IF NOT EXISTS idx_messages_recipient ON messages(recipient_id, id)",
+        "CREATE INDEX IF NOT EXISTS idx_messages_unread ON messages(recipient_id, sender_id) WHERE is_read = 0",
+        "CREATE INDEX IF NOT EXISTS idx_reports_status ON message_reports(status, created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_reports_created ON message_reports(created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_user_warnings_user ON user_warnings(user_id)",
+    ]
+    for sql in statements:
+        conn.execute(sql)
+
+# (table, key column, timestamp columns) rewritten by the timestamp migration
+TIMESTAMP_COLUMNS = [
+    ("users", "id", ["created_at", "banned_until"]),
+    ("jobs", "id", ["created_at"]),
+    ("applications", "id", ["created_at"]),
+    ("ratings", "id", ["created_at"]),
+    ("tokens", "id", ["created_at", "expires_at"]),
+    ("messages", "id", ["created_at"]),
+    ("message_reports", "id", ["created_at"]),
+    ("user_warnings", "id", ["created_at"]),
+    ("conversations", "rowid", ["last_at"]),
+]
+
+def _migration_normalize_timestamps(conn):
+    for table, key, columns in TIMESTAMP_COLUMNS:
+        if not _table_exists(conn, table):
+            continue
+        cols = ", ".join(columns)
+        rows = conn.execute(f"SELECT {key} AS k, {cols} FROM {table}").fetchall()
+        for row in rows:
+            updates = {}
+            for col in columns:
+                value = row[col]
+                fixed = normalize_timestamp(value)
+                if value is not None and fixed is not None and fixed != value:
+                    updates[col] = fixed
+            if updates:
+                assignments = ", ".join(f"{col} = ?" for col in updates)
+                conn.execute(f"UPDATE {table} SET {assignments} WHERE {key} = ?", list(updates.values()) + [row["k"]])
+
+def _migration_email_outbox(conn):
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS email_outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            recipient TEXT NOT NULL,
+            subject TEXT NOT NULL,
+            text_body TEXT,
+            html_body TEXT,
+            status TEXT NOT NULL DEFAULT 'pending',  -- pending | sending | sent | failed
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at TEXT NOT NULL,
+            last_error TEXT,
+            created_at TEXT NOT NULL,
+            sent_at TEXT
+        )
+    """
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_email_outbox_due ON email_outbox(status, next_attempt_at)")
+
+def _migration_geocode_cache(conn):
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS geocode_cache (
+            address_key TEXT PRIMARY KEY,  -- geocoding.normalize_address()
+            lat REAL,
+            lng REAL,
+            display_name TEXT,
+            found INTEGER NOT NULL,        -- 0 = negative entry (no match)
+            fetched_at TEXT NOT NULL,
+            expires_at TEXT NOT NULL
+        )
+    """
+    )
+
+def _migration_job_geocode_status(conn):
+    # NULL: nothing to geocode; 'pending': queued for the geocoding worker;
+    # 'located' / 'failed': the worker (or an explicit lat/lng) settled it
+    if "geocode_status" not in _columns_for_table(conn, "jobs"):
+        conn.execute("ALTER TABLE jobs ADD COLUMN geocode_status TEXT")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_geocode_pending ON jobs(id) WHERE geocode_status = 'pending'")
+
+def _migration_job_short_location(conn):
+    if "short_location" not in _columns_for_table(conn, "jobs"):
+        conn.execute("ALTER TABLE jobs ADD COLUMN short_location TEXT")
+    _backfill_short_locations(conn)
+
+def _migration_unique_applications(conn):
+    # keep each applicant's first application to a job, then let the index enforce it
+    conn.execute(
+        """
+        DELETE FROM applications WHERE id NOT IN (
+            SELECT MIN(id) FROM applications GROUP BY job_id, user_id
+        )
+    """
+    )
+    conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_applications_job_user ON applications(job_id, user_id)")
+
+def _migration_rating_aggregates(conn):
+    """
+    Per-target rating sum, count and 1-5 star histogram, kept in step with ratings by
+    triggers so every insert/delete (including the bulk deletes in delete_user and
+    delete_job) updates it in the same transaction.
+    """
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS rating_aggregates (
+            target_type TEXT NOT NULL,
+            target_id INTEGER NOT NULL,
+            rating_sum INTEGER NOT NULL DEFAULT 0,
+            rating_count INTEGER NOT NULL DEFAULT 0,
+            stars_1 INTEGER NOT NULL DEFAULT 0,
+            stars_2 INTEGER NOT NULL DEFAULT 0,
+            stars_3 INTEGER NOT NULL DEFAULT 0,
+            stars_4 INTEGER NOT NULL DEFAULT 0,
+            stars_5 INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (target_type, target_id)
+        )
+    """
+    )
+    conn.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS ratings_aggregate_ai AFTER INSERT ON ratings BEGIN
+            INSERT INTO rating_aggregates (target_type, target_id, rating_sum, rating_count, stars_1, stars_2, stars_3, stars_4, stars_5)
+            VALUES (new.target_type, new.target_id, new.rating, 1,
+                    new.rating = 1, new.rating = 2, new.rating = 3, new.rating = 4, new.rating = 5)
+            ON CONFLICT(target_type, target_id) DO UPDATE SET
+                rating_sum = rating_sum + excluded.rating_sum,
+                rating_count = rating_count + 1,
+                stars_1 = stars_1 + excluded.stars_1,
+                stars_2 = stars_2 + excluded.stars_2,
+                stars_3 = stars_3 + excluded.stars_3,
+                stars_4 = stars_4 + excluded.stars_4,
+                stars_5 = stars_5 + excluded.stars_5;
+        END
+    """
+    )
+    conn.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS ratings_aggregate_ad AFTER DELETE ON ratings BEGIN
+            UPDATE rating_aggregates SET
+                rating_sum = rating_sum - old.rating,
+                rating_count = rating_count - 1,
+                stars_1 = stars_1 - (old.rating = 1),
+                stars_2 = stars_2 - (old.rating = 2),
+                stars_3 = stars_3 - (old.rating = 3),
+                stars_4 = stars_4 - (old.rating = 4),
+                stars_5 = stars_5 - (old.rating = 5)
+            WHERE target_type = old.target_type AND target_id = old.target_id;
+            DELETE FROM rating_aggregates
+            WHERE target_type = old.target_type AND target_id = old.target_id AND rating_count <= 0;
+        END
+    """
+    )
+    conn.execute("DELETE FROM rating_aggregates")
+    conn.execute(
+        """
+        INSERT INTO rating_aggregates (target_type, target_id, rating_sum, rating_count, stars_1, stars_2, stars_3, stars_4, stars_5)
+        SELECT target_type, target_id, SUM(rating), COUNT(*),
+               SUM(rating = 1), SUM(rating = 2), SUM(rating = 3), SUM(rating = 4), SUM(rating = 5)
+        FROM ratings GROUP BY target_type, target_id
+    """
+    )
+
+def _migration_geocode_claims(conn):
+    # workers claim pending jobs with a lease (claim_geocode_batch) and share one
+    # Nominatim request budget through rate_limits (reserve_rate_slot)
+    if "geocode_lease_until" not in _columns_for_table(conn, "jobs"):
+        conn.execute("ALTER TABLE jobs ADD COLUMN geocode_lease_until TEXT")
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS rate_limits (
+            name TEXT PRIMARY KEY,
+            next_at REAL NOT NULL  -- unix time of the next free request slot
+        )
+    """
+    )
+
+def _migration_messages_version(conn):
+    # data_versions['messages'] moves whenever a conversation changes (new message, read,
+    # delete), so message streams in every process can notice writes made elsewhere
+    conn.execute("INSERT OR IGNORE INTO data_versions (name, version) VALUES ('messages', 0)")
+    for event in ("INSERT", "UPDATE", "DELETE"):
+        conn.execute(
+            f"""
+            CREATE TRIGGER IF NOT EXISTS messages_version_{event.lower()} AFTER {event} ON conversations BEGIN
+                UPDATE data_versions SET version = version + 1 WHERE name = 'messages';
+            END
+        """
+        )
+
+MIGRATIONS = [
+    (1, "secondary indexes for hot lookups", _migration_secondary_indexes),
+    (2, "normalize timestamps to fixed-width UTC ISO", _migration_normalize_timestamps),
+    (3, "email outbox", _migration_email_outbox),
+    (4, "geocode cache", _migration_geocode_cache),
+    (5, "jobs.geocode_status for background geocoding", _migration_job_geocode_status),
+    (6, "precomputed jobs.short_location", _migration_job_short_location),
+    (7, "one application per job and user", _migration_unique_applications),
+    (8, "rating aggregates", _migration_rating_aggregates),
+    (9, "geocode claims and shared rate limit", _migration_geocode_claims),
+    (10, "data version for messages", _migration_messages_version),
+]
+
+def get_schema_version(conn):
+    if not _table_exists(conn, "schema_version"):
+        return 0
+    row = conn.execute("SELECT MAX(version) AS v FROM schema_version").fetchone()
+    return (row["v"] if row else None) or 0
+
+def apply_migrations(db_path):
+    """Run pending MIGRATIONS; safe to call from several workers at once. Returns the applied versions."""
+    conn = get_connection(db_path)
+    applied = []
+    try:
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INTEGER PRIMARY KEY,
+                description TEXT,
+                applied_at TEXT NOT NULL
+            )
+        """
+        )
+        for version, description, fn in MIGRATIONS:
+            if version <= get_schema_version(conn):
+                continue
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # re-check under the write lock in case another worker got here first
+                if version <= get_schema_version(conn):
+                    conn.rollback()
+                    continue
+                fn(conn)
+                conn.execute(
+                    "INSERT INTO schema_version (version, description, applied_at) VALUES (?, ?, ?)",
+                    (version, description, utc_now_iso()),
+                )
+                conn.commit()
+                applied.append(version)
+            except Exception:
+                conn.rollback()
+                raise
+        if applied:
+            conn.execute("PRAGMA optimize")
+    finally:
+        conn.close()
+    return applied
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+def migrate_database(db_path):
+    """Create missing base tables, then run pending MIGRATIONS. Used by `flask --app app migrate`."""
+    init_db(db_path)
+    return apply_migrations(db_path)
+
+def check_schema(db_path):
+    """Schema version recorded in db_path (0 for a new database); no DDL is run."""
+    if not os.path.exists(db_path):
+        return 0
+    conn = get_connection(db_path)
+    try:
+        return get_schema_version(conn)
+    finally:
+        conn.close()
+
 # ---- helper functions for app logic below ----
 
 # Users
@@ -157,7 +1168,7 @@ def create_user(db_path, email, password_hash, role="candidate", username=None,
         """INSERT INTO users
            (email,password_hash,role,username,first_name,last_name,verified,created_at)
            VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
-        (email, password_hash, role, username, first_name, last_name, verified, datetime.utcnow().isoformat()),
+        (email, password_hash, role, username, first_name, last_name, verified, utc_now_iso()),
     )
     conn.commit()
     user_id = cur.lastrowid
@@ -181,12 +1192,58 @@ def get_user_by_username(db_path, username):
     return row
 
 def get_user_by_id(db_path, id):
-    conn = get_connection(db_path)
-    cur = conn.cursor()
-    cur.execute("SELECT id, email, role, is_banned, banned_until, created_at, username, first_name, last_name, verified FROM users WHERE id = ?", (id,))
-    row = cur.fetchone()
-    conn.close()
-    return row
+    memo = _memo()
+    key = ("user", db_path, id)
+    if memo is not None and key in memo:
+        row = memo[key]
+        return dict(row) if row is not None else None
+    row = _user_cache_for(db_path).get(db_path, id)
+    if row is None:
+        conn = get_connection(db_path)
+        cur = conn.cursor()
+        cur.execute("SELECT id, email, role, is_banned, banned_until, created_at, username, first_name, last_name, verified FROM users WHERE id = ?", (id,))
+        row = cur.fetchone()
+        conn.close()
+        if row is not None:
+            _user_cache_for(db_path).put(db_path, id, row)
+    if memo is not None:
+        memo[key] = row
+    # callers get their own copy so cached rows are never mutated in place
+    return dict(row) if row is not None else None
+
+def get_users_by_ids(db_path, ids):
+    """
+    Load many users in one IN-query. Returns {user_id: row}; missing ids are simply absent.
+    Rows already memoized for this request or in the user cache are not queried again.
+    """
+    memo = _memo()
+    out = {}
+    missing = []
+    for uid in {int(i) for i in ids if i is not None}:
+        key = ("user", db_path, uid)
+        row = memo.get(key) if memo is not None and key in memo else _user_cache_for(db_path).get(db_path, uid)
+        if row is not None:
+            out[uid] = row
+        elif memo is None or key not in memo:
+            missing.append(uid)
+    if missing:
+        conn = get_connection(db_path)
+        cur = conn.cursor()
+        # stay well under SQLite's bound-parameter limit
+        for i in range(0, len(missing), 500):
+            chunk = missing[i:i + 500]
+            cur.execute(
+                "SELECT id, email, role, is_banned, banned_until, created_at, username, first_name, last_name, verified FROM users WHERE id IN (%s)" % ",".join("?" * len(chunk)),
+                chunk,
+            )
+            for row in cur.fetchall():
+                out[row["id"]] = row
+                _user_cache_for(db_path).put(db_path, row["id"], row)
+        conn.close()
+    if memo is not None:
+        for uid, row in out.items():
+            memo[("user", db_path, uid)] = row
+    return {uid: dict(row) for uid, row in out.items()}
 
 def set_user_verified(db_path, email):
     conn = get_connection(db_path)
@@ -195,6 +1252,7 @@ def set_user_verified(db_path, email):
     conn.commit()
     updated = cur.rowcount
     conn.close()
+    invalidate_user(db_path, email=email)
     return updated > 0
 
 def update_user_password(db_path, email, password_hash):
@@ -204,6 +1262,7 @@ def update_user_password(db_path, email, password_hash):
     conn.commit()
     updated = cur.rowcount
     conn.close()
+    invalidate_user(db_path, email=email)
     return updated > 0
 
 def get_all_users(db_path):
@@ -223,6 +1282,7 @@ def set_user_ban(db_path, user_id, banned_until_iso=None):
         cur.execute("UPDATE users SET is_banned=1, banned_until=NULL WHERE id = ?", (user_id,))
     conn.commit()
     conn.close()
+    invalidate_user(db_path, user_id=user_id)
     return True
 
 def unset_user_ban(db_path, user_id):
@@ -231,6 +1291,7 @@ def unset_user_ban(db_path, user_id):
     cur.execute("UPDATE users SET is_banned=0, banned_until=NULL WHERE id = ?", (user_id,))
     conn.commit()
     conn.close()
+    invalidate_user(db_path, user_id=user_id)
     return True
 
 def delete_user(db_path, user_id):
@@ -247,6 +1308,7 @@ def delete_user(db_path, user_id):
     cur.execute("DELETE FROM users WHERE id = ?", (user_id,))
     conn.commit()
     conn.close()
+    invalidate_user(db_path, user_id=user_id)
     return True
 
 # Tokens: DB-backed hex tokens for email verification and password reset
@@ -254,19 +1316,10 @@ def create_token(db_path, email, purpose, expires_seconds=3600):
     conn = get_connection(db_path)
     cur = conn.cursor()
     token = secrets.token_hex(24)  # 48 hex chars (~192 bits)
-    expires_at = (datetime.utcnow() + timedelta(seconds=expires_seconds)).isoformat()
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS tokens (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            token TEXT UNIQUE NOT NULL,
-            email TEXT NOT NULL,
-            purpose TEXT NOT NULL,
-            expires_at TEXT NOT NULL,
-            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
-        )""")
+    expires_at = utc_now_iso(expires_seconds)
     cur.execute(
-        "INSERT INTO tokens (token, email, purpose, expires_at) VALUES (?, ?, ?, ?)",
-        (token, email, purpose, expires_at),
+        "INSERT INTO tokens (token, email, purpose, expires_at, created_at) VALUES (?, ?, ?, ?, ?)",
+        (token, email, purpose, expires_at, utc_now_iso()),
     )
     conn.commit()
     conn.close()
@@ -335,7 +1388,7 @@ def get_latest_token_for_email(db_path, email, purpose):
         SELECT token, email, purpose, expires_at, created_at
         FROM tokens
         WHERE email = ? AND purpose = ?
-        ORDER BY datetime(created_at) DESC
+        ORDER BY created_at DESC
         LIMIT 1
         """,
         (email, purpose),
@@ -363,27 +1416,117 @@ def get_latest_token_for_email(db_path, email, purpose):
 def purge_expired_tokens(db_path):
     conn = get_connection(db_path)
     cur = conn.cursor()
-    now = datetime.utcnow().isoformat()
+    now = utc_now_iso()
     cur.execute("DELETE FROM tokens WHERE expires_at <= ?", (now,))
     conn.commit()
     conn.close()
 
+# Email outbox: requests enqueue rows here and the sender worker (mailer.py) delivers them.
+# A claimed row is leased by pushing next_attempt_at forward, so a worker that dies
+# mid-batch only delays those emails until the lease runs out.
+
+def enqueue_email(db_path, recipient, subject, text_body=None, html_body=None):
+    now = utc_now_iso()
+    conn = get_connection(db_path)
+    cur = conn.cursor()
+    cur.execute(
+        "INSERT INTO email_outbox (recipient, subject, text_body, html_body, status, next_attempt_at, created_at) VALUES (?, ?, ?, ?, 'pending', ?, ?)",
+        (recipient, subject, text_body, html_body, now, now),
+    )
+    conn.commit()
+    email_id = cur.lastrowid
+    conn.close()
+    return email_id
+
+def claim_outbox_batch(db_path, limit=50, lease_seconds=300):
+    """Atomically claim up to `limit` due emails (pending, or sending with an expired lease)."""
+    now = utc_now_iso()
+    conn = get_connection(db_path)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        rows = conn.execute(
+            "SELECT id, recipient, subject, text_body, html_body, attempts FROM email_outbox WHERE status IN ('pending', 'sending') AND next_attempt_at <= ? ORDER BY next_attempt_at LIMIT ?",
+            (now, limit),
+        ).fetchall()
+        if rows:
+            conn.execute(
+                "UPDATE email_outbox SET status = 'sending', next_attempt_at = ? WHERE id IN (%s)" % ",".join("?" * len(rows)),
+                [utc_now_iso(lease_seconds)] + [r["id"] for r in rows],
+            )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    return rows
+
+def mark_email_sent(db_path, email_id):
+    conn = get_connection(db_path)
+    conn.execute("UPDATE email_outbox SET status = 'sent', sent_at = ?, last_error = NULL WHERE id = ?", (utc_now_iso(), email_id))
+    conn.commit()
+    conn.close()
+
+def mark_email_failed(db_path, email_id, error, retry_in_seconds=None):
+    """Record a failed attempt; retry after retry_in_seconds, or give up for good when it is None."""
+    conn = get_connection(db_path)
+    if retry_in_seconds is None:
+        conn.execute(
+            "UPDATE email_outbox SET status = 'failed', attempts = attempts + 1, last_error = ? WHERE id = ?",
+            (str(error)[:1000], email_id),
+        )
+    else:
+        conn.execute(
+            "UPDATE email_outbox SET status = 'pending', attempts = attempts + 1, last_error = ?, next_attempt_at = ? WHERE id = ?",
+            (str(error)[:1000], utc_now_iso(retry_in_seconds), email_id),
+        )
+    conn.commit()
+    conn.close()
+
+# Geocode cache: one row per normalized address, including "not found" results.
+
+def get_cached_geocode(db_path, address_key):
+    """Unexpired cache row for address_key, or None."""
+    conn = get_connection(db_path)
+    row = conn.execute(
+        "SELECT lat, lng, display_name, found, expires_at FROM geocode_cache WHERE address_key = ? AND expires_at > ?",
+        (address_key, utc_now_iso()),
+    ).fetchone()
+    conn.close()
+    return row
+
+def put_cached_geocode(db_path, address_key, lat, lng, display_name, found, ttl_seconds):
+    """Insert or refresh a cache row. Returns its expires_at."""
+    expires_at = utc_now_iso(ttl_seconds)
+    conn = get_connection(db_path)
+    conn.execute(
+        """INSERT INTO geocode_cache (address_key, lat, lng, display_name, found, fetched_at, expires_at)
+           VALUES (?, ?, ?, ?, ?, ?, ?)
+           ON CONFLICT(address_key) DO UPDATE SET lat = excluded.lat, lng = excluded.lng,
+               display_name = excluded.display_name, found = excluded.found,
+               fetched_at = excluded.fetched_at, expires_at = excluded.expires_at""",
+        (address_key, lat, lng, display_name, 1 if found else 0, utc_now_iso(), expires_at),
+    )
+    conn.commit()
+    conn.close()
+    return expires_at
+
 # Jobs
-def create_job(db_path, employer_id, title, description, location_text=None, lat=None, lng=None, salary="", tags=None, availability=""):
+def create_job(db_path, employer_id, title, description, location_text=None, lat=None, lng=None, salary="", tags=None, availability="", geocode_status=None):
     conn = get_connection(db_path)
     cur = conn.cursor()
     cur.execute(
         """INSERT INTO jobs
-           (employer_id, title, description, location_text, lat, lng, salary, tags, availability, created_at)
-           VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
-        (employer_id, title, description, location_text, lat, lng, salary, tags, availability, datetime.utcnow().isoformat()),
+           (employer_id, title, description, location_text, short_location, lat, lng, salary, tags, availability, created_at, geocode_status)
+           VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+        (employer_id, title, description, location_text, short_addr_from_display(location_text), lat, lng, salary, tags, availability, utc_now_iso(), geocode_status),
     )
     conn.commit()
     job_id = cur.lastrowid
     conn.close()
     return get_job_by_id(db_path, job_id)
 
-def update_job(db_path, job_id, title=None, description=None, location_text=None, lat=None, lng=None, salary=None, tags=None, availability=None):
+def update_job(db_path, job_id, title=None, description=None, location_text=None, lat=None, lng=None, salary=None, tags=None, availability=None, geocode_status=None):
     conn = get_connection(db_path)
     cur = conn.cursor()
     fields = []
@@ -394,6 +1537,7 @@ def update_job(db_path, job_id, title=None, description=None, location_text=None
         fields.append("description = ?"); params.append(description)
     if location_text is not None:
         fields.append("location_text = ?"); params.append(location_text)
+        fields.append("short_location = ?"); params.append(short_addr_from_display(location_text))
     if lat is not None:
         fields.append("lat = ?"); params.append(lat)
     if lng is not None:
@@ -404,6 +1548,9 @@ def update_job(db_path, job_id, title=None, description=None, location_text=None
         fields.append("tags = ?"); params.append(tags)
     if availability is not None:
         fields.append("availability = ?"); params.append(availability)
+    if geocode_status is not None:
+        # a new address is claimable at once, even if a worker holds a lease on the old one
+        fields.append("geocode_status = ?, geocode_lease_until = NULL"); params.append(geocode_status)
     if not fields:
         conn.close()
         return get_job_by_id(db_path, job_id)
@@ -424,49 +1571,418 @@ def delete_job(db_path, job_id):
     conn.close()
     return True
 
-def get_jobs(db_path, limit=None):
+def _ensure_jobs_spatial_index(conn):
+    """
+    R*Tree over job coordinates (one point-sized box per located job), maintained by
+    triggers on jobs. Radius queries read a bounding-box candidate set from it and
+    only compute exact distances for those rows.
+    """
+    created = not _table_exists(conn, "jobs_rtree")
+    cur = conn.cursor()
+    cur.execute("CREATE VIRTUAL TABLE IF NOT EXISTS jobs_rtree USING rtree(id, min_lat, max_lat, min_lng, max_lng)")
+    cur.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS jobs_rtree_ai AFTER INSERT ON jobs
+        WHEN new.lat IS NOT NULL AND new.lng IS NOT NULL BEGIN
+            INSERT INTO jobs_rtree(id, min_lat, max_lat, min_lng, max_lng)
+            VALUES (new.id, new.lat, new.lat, new.lng, new.lng);
+        END
+    """
+    )
+    cur.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS jobs_rtree_ad AFTER DELETE ON jobs BEGIN
+            DELETE FROM jobs_rtree WHERE id = old.id;
+        END
+    """
+    )
+    cur.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS jobs_rtree_au AFTER UPDATE OF lat, lng ON jobs BEGIN
+            DELETE FROM jobs_rtree WHERE id = old.id;
+            INSERT INTO jobs_rtree(id, min_lat, max_lat, min_lng, max_lng)
+            SELECT new.id, new.lat, new.lat, new.lng, new.lng
+            WHERE new.lat IS NOT NULL AND new.lng IS NOT NULL;
+        END
+    """
+    )
+    # jobs without coordinates are always part of a radius result (they have no distance)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_jobs_unlocated ON jobs(id) WHERE lat IS NULL OR lng IS NULL")
+    if created:
+        cur.execute(
+            """
+            INSERT INTO jobs_rtree(id, min_lat, max_lat, min_lng, max_lng)
+            SELECT id, lat, lat, lng, lng FROM jobs WHERE lat IS NOT NULL AND lng IS NOT NULL
+        """
+        )
+    conn.commit()
+
+EARTH_RADIUS_MILES = 3958.8
+
+def bbox_for_radius(lat, lng, radius_miles):
+    """
+    Returns (min_lat, max_lat, min_lng, max_lng) enclosing every point within
+    radius_miles of (lat, lng). Longitude widens to the full range near the poles
+    or when the box would cross the antimeridian.
+    """
+    dlat = math.degrees(radius_miles / EARTH_RADIUS_MILES)
+    min_lat = max(lat - dlat, -90.0)
+    max_lat = min(lat + dlat, 90.0)
+    cos_lat = math.cos(math.radians(max(abs(min_lat), abs(max_lat))))
+    if cos_lat < 1e-6:
+        return min_lat, max_lat, -180.0, 180.0
+    dlng = math.degrees(radius_miles / (EARTH_RADIUS_MILES * cos_lat))
+    min_lng = lng - dlng
+    max_lng = lng + dlng
+    if dlng >= 180.0 or min_lng < -180.0 or max_lng > 180.0:
+        return min_lat, max_lat, -180.0, 180.0
+    return min_lat, max_lat, min_lng, max_lng
+
+# Job search: filters are pushed into SQL so only one page of rows is materialized.
+JOB_COLUMNS = "j.id, j.employer_id, j.title, j.description, j.location_text, j.short_location, j.lat, j.lng, j.salary, j.tags, j.availability, j.created_at"
+
+def _fts_query(q):
+    """
+    Turn free text into an FTS5 MATCH expression: every word must match as a prefix.
+    Words are quoted so user input can never be parsed as FTS syntax.
+    """
+    words = re.findall(r"\w+", q or "")
+    return " ".join('"%s"*' % w for w in words)
+
+def _job_search_sql(conn, q=None, tags=None, remote_only=False, bbox=None):
+    """
+    Returns (from_sql, where_clauses, params, ranked) for the given job filters.
+    bbox (see bbox_for_radius) keeps located jobs inside the box plus jobs without coordinates.
+    """
+    from_sql = "FROM jobs j"
+    where = []
+    params = []
+    ranked = False
+    if q:
+        if _has_table(conn, "jobs_fts"):
+            match = _fts_query(q)
+            if not match:
+                where.append("0")
+            else:
+                from_sql = "FROM jobs_fts JOIN jobs j ON j.id = jobs_fts.rowid"
+                where.append("jobs_fts MATCH ?")
+                params.append(match)
+                ranked = True
+        else:
+            like = "%" + q.lower() + "%"
+            where.append("(lower(j.title) LIKE ? OR lower(j.description) LIKE ? OR lower(coalesce(j.tags, '')) LIKE ?)")
+            params.extend([like, like, like])
+    wanted = [t.strip().lower() for t in (tags or "").split(",") if t.strip()]
+    if wanted:
+        where.append("(" + " OR ".join("lower(coalesce(j.tags, '')) LIKE ?" for _ in wanted) + ")")
+        params.extend("%" + w + "%" for w in wanted)
+    if remote_only:
+        where.append("lower(coalesce(j.tags, '')) LIKE '%remote%'")
+    if bbox is not None:
+        if _has_table(conn, "jobs_rtree"):
+            where.append(
+                "j.id IN (SELECT id FROM jobs_rtree WHERE max_lat >= ? AND min_lat <= ? AND max_lng >= ? AND min_lng <= ?"
+                " UNION ALL SELECT id FROM jobs WHERE lat IS NULL OR lng IS NULL)"
+            )
+        else:
+            where.append("((j.lat BETWEEN ? AND ? AND j.lng BETWEEN ? AND ?) OR j.lat IS NULL OR j.lng IS NULL)")
+        params.extend(bbox)
+    return from_sql, where, params, ranked
+
+def get_jobs(db_path, limit=None, q=None, tags=None, remote_only=False, bbox=None, order="date", after=None, offset=0):
+    """
+    Filtered job listing, newest first. q is matched against title/description/tags through
+    the FTS index, tags is a comma separated list (any may match), bbox restricts to a
+    coordinate box through the R*Tree. order="relevance" ranks q matches with bm25
+    (title weighted highest). after=(created_at, id) is a keyset cursor for date order:
+    only rows after it are returned, so a deep page costs the same as the first one.
+    """
     conn = get_connection(db_path)
     cur = conn.cursor()
-    sql = "SELECT id, employer_id, title, description, location_text, lat, lng, salary, tags, availability, created_at FROM jobs ORDER BY created_at DESC"
+    from_sql, where, params, ranked = _job_search_sql(conn, q, tags, remote_only, bbox)
+    if after is not None:
+        where.append("(j.created_at, j.id) < (?, ?)")
+        params.extend([after[0], int(after[1])])
+    sql = f"SELECT {JOB_COLUMNS} {from_sql}"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    if order == "relevance" and ranked:
+        sql += " ORDER BY bm25(jobs_fts, 10.0, 1.0, 5.0), j.created_at DESC, j.id DESC"
+    else:
+        sql += " ORDER BY j.created_at DESC, j.id DESC"
     if limit:
-        sql += " LIMIT ?"
-        cur.execute(sql, (limit,))
+        sql += " LIMIT ? OFFSET ?"
+        params = params + [int(limit), max(int(offset or 0), 0)]
+    cur.execute(sql, params)
+    rows = cur.fetchall()
+    conn.close()
+    return rows
+
+def get_job_points(db_path, q=None, tags=None, remote_only=False, bbox=None, order="date"):
+    """
+    id/lat/lng/created_at of every job matching the filters, without the wide columns.
+    Used for distance filtering and ordering; full rows are then loaded for one page
+    with get_jobs_by_ids(). order="id" gives a stable tiebreak for distance ordering;
+    order="relevance" ranks q matches with bm25 like get_jobs().
+    """
+    conn = get_connection(db_path)
+    cur = conn.cursor()
+    from_sql, where, params, ranked = _job_search_sql(conn, q, tags, remote_only, bbox)
+    sql = f"SELECT j.id, j.lat, j.lng, j.created_at {from_sql}"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    if order == "id":
+        sql += " ORDER BY j.id"
+    elif order == "relevance" and ranked:
+        sql += " ORDER BY bm25(jobs_fts, 10.0, 1.0, 5.0), j.created_at DESC, j.id DESC"
     else:
-        cur.execute(sql)
+        sql += " ORDER BY j.created_at DESC, j.id DESC"
+    cur.execute(sql, params)
+    rows = cur.fetchall()
+    conn.close()
+    return rows
+
+_count_cache = {}
+_COUNT_CACHE_MAX = 256
+
+def count_jobs(db_path, q=None, tags=None, remote_only=False, bbox=None):
+    """
+    Number of jobs matching the filters. Results are memoized per jobs data version,
+    so repeated listings of an unchanged table skip the COUNT entirely.
+    """
+    version = get_data_version(db_path, "jobs")
+    key = (db_path, version, q or None, tags or None, bool(remote_only), tuple(bbox) if bbox else None)
+    cached = _count_cache.get(key)
+    if cached is not None:
+        return cached
+    conn = get_connection(db_path)
+    cur = conn.cursor()
+    from_sql, where, params, _ = _job_search_sql(conn, q, tags, remote_only, bbox)
+    sql = f"SELECT COUNT(*) AS cnt {from_sql}"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    cur.execute(sql, params)
+    row = cur.fetchone()
+    conn.close()
+    count = row["cnt"] if row else 0
+    if len(_count_cache) >= _COUNT_CACHE_MAX:
+        _count_cache.clear()
+    _count_cache[key] = count
+    return count
+
+def get_job_coordinates(db_path):
+    """id/lat/lng of every located job, for the vectorized distance engine."""
+    conn = get_connection(db_path)
+    cur = conn.cursor()
+    cur.execute("SELECT id, lat, lng FROM jobs WHERE lat IS NOT NULL AND lng IS NOT NULL ORDER BY id")
     rows = cur.fetchall()
     conn.close()
     return rows
 
+def iter_jobs(db_path, after_id=None, batch_size=500):
+    """
+    Yield every job in id order (optionally only ids > after_id), reading batch_size rows
+    at a time with fetchmany() so memory stays flat for any table size. The connection
+    comes straight from the pool rather than the request scope, because a streamed
+    response keeps iterating after the request has been torn down.
+    """
+    conn = get_pool(db_path).acquire()
+    cur = conn.cursor()
+    try:
+        cur.execute(
+            "SELECT id, employer_id, title, description, location_text, short_location, lat, lng, salary, tags, availability, created_at FROM jobs WHERE id > ? ORDER BY id",
+            (after_id or 0,),
+        )
+        while True:
+            rows = cur.fetchmany(batch_size)
+            if not rows:
+                break
+            yield from rows
+    finally:
+        cur.close()
+        conn.close()
+
+def get_job_markers(db_path, bbox, limit=500):
+    """id/title/lat/lng/short_location of located jobs inside bbox=(min_lat, max_lat, min_lng, max_lng), via the R*Tree."""
+    min_lat, max_lat, min_lng, max_lng = bbox
+    conn = get_connection(db_path)
+    rows = conn.execute(
+        """SELECT j.id, j.title, j.lat, j.lng, j.short_location FROM jobs_rtree r JOIN jobs j ON j.id = r.id
+           WHERE r.min_lat <= ? AND r.max_lat >= ? AND r.min_lng <= ? AND r.max_lng >= ?
+           LIMIT ?""",
+        (max_lat, min_lat, max_lng, min_lng, limit),
+    ).fetchall()
+    conn.close()
+    return rows
+
 def get_job_by_id(db_path, job_id):
     conn = get_connection(db_path)
     cur = conn.cursor()
-    cur.execute("SELECT id, employer_id, title, description, location_text, lat, lng, salary, tags, availability, created_at FROM jobs WHERE id = ?", (job_id,))
+    cur.execute("SELECT id, employer_id, title, description, location_text, short_location, lat, lng, salary, tags, availability, created_at, geocode_status FROM jobs WHERE id = ?", (job_id,))
     row = cur.fetchone()
     conn.close()
     return row
 
+def get_jobs_by_ids(db_path, ids):
+    """Load many jobs in one IN-query. Returns {job_id: row}; missing ids are simply absent."""
+    ids = list({int(i) for i in ids if i is not None})
+    if not ids:
+        return {}
+    conn = get_connection(db_path)
+    cur = conn.cursor()
+    out = {}
+    # stay well under SQLite's bound-parameter limit
+    for i in range(0, len(ids), 500):
+        chunk = ids[i:i + 500]
+        cur.execute(
+            "SELECT id, employer_id, title, description, location_text, short_location, lat, lng, salary, tags, availability, created_at FROM jobs WHERE id IN (%s)" % ",".join("?" * len(chunk)),
+            chunk,
+        )
+        for row in cur.fetchall():
+            out[row["id"]] = row
+    conn.close()
+    return out
+
 def get_jobs_by_employer(db_path, employer_id):
     conn = get_connection(db_path)
     cur = conn.cursor()
     cur.execute(
-        "SELECT id, employer_id, title, description, location_text, lat, lng, salary, tags, availability, created_at FROM jobs WHERE employer_id = ? ORDER BY created_at DESC",
+        "SELECT id, employer_id, title, description, location_text, short_location, lat, lng, salary, tags, availability, created_at, geocode_status FROM jobs WHERE employer_id = ? ORDER BY created_at DESC",
         (employer_id,),
     )
     rows = cur.fetchall()
     conn.close()
     return rows
 
-# Applications
-def create_application(db_path, job_id, user_id, cover_letter="", resume_text="", cover_letter_path=None, resume_path=None):
+def _backfill_short_locations(conn, batch_size=500):
+    """Recompute jobs.short_location for every row in id order; returns the number of rows changed."""
+    changed = 0
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            "SELECT id, location_text, short_location FROM jobs WHERE id > ? ORDER BY id LIMIT ?",
+            (last_id, batch_size),
+        ).fetchall()
+        if not rows:
+            return changed
+        for r in rows:
+            short = short_addr_from_display(r["location_text"])
+            if short != r["short_location"]:
+                conn.execute("UPDATE jobs SET short_location = ? WHERE id = ?", (short, r["id"]))
+                changed += 1
+        last_id = rows[-1]["id"]
+
+def backfill_short_locations(db_path):
+    """Bring jobs.short_location up to date (e.g. after changing geo.short_addr_from_display)."""
     conn = get_connection(db_path)
-    cur = conn.cursor()
-    cur.execute(
-        "INSERT INTO applications (job_id, user_id, cover_letter, resume_text, cover_letter_path, resume_path, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
-        (job_id, user_id, cover_letter, resume_text, cover_letter_path, resume_path, datetime.utcnow().isoformat()),
+    try:
+        changed = _backfill_short_locations(conn)
+        conn.commit()
+    finally:
+        conn.close()
+    return changed
+
+def claim_geocode_batch(db_path, limit=20, lease_seconds=300):
+    """
+    Atomically claim up to `limit` pending jobs (unclaimed, or with an expired lease) so
+    workers in other processes skip them. Jobs stay 'pending' until set_job_geocode().
+    """
+    now = utc_now_iso()
+    conn = get_connection(db_path)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        rows = conn.execute(
+            "SELECT id, location_text FROM jobs WHERE geocode_status = 'pending' AND (geocode_lease_until IS NULL OR geocode_lease_until <= ?) ORDER BY id LIMIT ?",
+            (now, limit),
+        ).fetchall()
+        if rows:
+            conn.execute(
+                "UPDATE jobs SET geocode_lease_until = ? WHERE id IN (%s)" % ",".join("?" * len(rows)),
+                [utc_now_iso(lease_seconds)] + [r["id"] for r in rows],
+            )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    return rows
+
+def release_geocode_claims(db_path, job_ids):
+    """Give claimed jobs back to the queue right away (e.g. the batch stopped on a transport error)."""
+    if not job_ids:
+        return
+    conn = get_connection(db_path)
+    conn.execute(
+        "UPDATE jobs SET geocode_lease_until = NULL WHERE id IN (%s)" % ",".join("?" * len(job_ids)),
+        list(job_ids),
     )
     conn.commit()
-    app_id = cur.lastrowid
     conn.close()
+
+def reserve_rate_slot(db_path, name, interval):
+    """
+    Reserve the next `interval`-spaced request slot for `name`, shared by every process
+    using this database. Returns the seconds to wait before sending the request.
+    """
+    now = time.time()
+    conn = get_connection(db_path)
+    try:
+        row = conn.execute(
+            """
+            INSERT INTO rate_limits (name, next_at) VALUES (?, ?)
+            ON CONFLICT(name) DO UPDATE SET next_at = MAX(next_at, ?) + ?
+            RETURNING next_at
+            """,
+            (name, now + interval, now, interval),
+        ).fetchone()
+        conn.commit()
+    finally:
+        conn.close()
+    return max(row["next_at"] - interval - now, 0.0)
+
+def set_job_geocode(db_path, job_id, location_text, lat, lng):
+    """
+    Store the worker's result for a pending job: coordinates (status 'located') or, when
+    lat/lng are None, status 'failed'. Jobs whose address changed since they were read are left alone.
+    The jobs triggers keep jobs_rtree and data_versions in step, so spatial search and
+    the distance engines pick the new coordinates up on their next query.
+    """
+    conn = get_connection(db_path)
+    cur = conn.cursor()
+    if lat is None or lng is None:
+        cur.execute(
+            "UPDATE jobs SET geocode_status = 'failed', geocode_lease_until = NULL WHERE id = ? AND geocode_status = 'pending' AND location_text = ?",
+            (job_id, location_text),
+        )
+    else:
+        cur.execute(
+            "UPDATE jobs SET lat = ?, lng = ?, geocode_status = 'located', geocode_lease_until = NULL WHERE id = ? AND geocode_status = 'pending' AND location_text = ?",
+            (lat, lng, job_id, location_text),
+        )
+    conn.commit()
+    updated = cur.rowcount
+    conn.close()
+    return updated > 0
+
+# Applications
+def _insert_application(conn, job_id, user_id, cover_letter, resume_text, cover_letter_path, resume_path):
+    cur = conn.execute(
+        """INSERT INTO applications (job_id, user_id, cover_letter, resume_text, cover_letter_path, resume_path, created_at)
+           VALUES (?, ?, ?, ?, ?, ?, ?)
+           ON CONFLICT(job_id, user_id) DO NOTHING""",
+        (job_id, user_id, cover_letter, resume_text, cover_letter_path, resume_path, utc_now_iso()),
+    )
+    return cur.lastrowid if cur.rowcount == 1 else None
+
+def create_application(db_path, job_id, user_id, cover_letter="", resume_text="", cover_letter_path=None, resume_path=None):
+    """
+    Returns the new application as a dict, or None if this user already applied for the job.
+    The check is the UNIQUE(job_id, user_id) index, so concurrent submits cannot both succeed.
+    """
+    app_id = run_write(db_path, _insert_application, job_id, user_id, cover_letter, resume_text, cover_letter_path, resume_path)
+    if app_id is None:
+        return None
     return {"id": app_id, "job_id": job_id, "user_id": user_id, "cover_letter_path": cover_letter_path, "resume_path": resume_path}
 
 # and update get_applications_by_job to include the filename columns:
@@ -497,41 +2013,62 @@ def get_applications_by_user(db_path, user_id):
     return rows
 
 # Ratings
-def create_rating(db_path, target_type, target_id, rater_id, rating, comment=""):
-    conn = get_connection(db_path)
-    cur = conn.cursor()
-    cur.execute(
+def _insert_rating(conn, target_type, target_id, rater_id, rating, comment):
+    cur = conn.execute(
         "INSERT INTO ratings (target_type, target_id, rater_id, rating, comment, created_at) VALUES (?, ?, ?, ?, ?, ?)",
-        (target_type, target_id, rater_id, rating, comment, datetime.utcnow().isoformat()),
+        (target_type, target_id, rater_id, rating, comment, utc_now_iso()),
     )
-    conn.commit()
-    rid = cur.lastrowid
-    conn.close()
+    return cur.lastrowid
+
+def create_rating(db_path, target_type, target_id, rater_id, rating, comment=""):
+    rid = run_write(db_path, _insert_rating, target_type, target_id, rater_id, rating, comment)
     return {"id": rid, "target_type": target_type, "target_id": target_id, "rater_id": rater_id, "rating": rating}
 
-def get_ratings_for_target(db_path, target_type, target_id):
+def get_ratings_for_target(db_path, target_type, target_id, limit=None, after=None):
+    """
+    Ratings for a target, newest first. after=(created_at, id) is a keyset cursor like
+    get_jobs(): only older ratings are returned, so every page reads just `limit` rows.
+    """
+    sql = (
+        "SELECT r.id, r.target_type, r.target_id, r.rater_id, r.rating, r.comment, r.created_at, u.email as rater_email "
+        "FROM ratings r JOIN users u ON u.id = r.rater_id WHERE r.target_type = ? AND r.target_id = ?"
+    )
+    params = [target_type, target_id]
+    if after is not None:
+        sql += " AND (r.created_at, r.id) < (?, ?)"
+        params.extend([after[0], int(after[1])])
+    sql += " ORDER BY r.created_at DESC, r.id DESC"
+    if limit:
+        sql += " LIMIT ?"
+        params.append(int(limit))
     conn = get_connection(db_path)
     cur = conn.cursor()
-    cur.execute(
-        "SELECT r.id, r.target_type, r.target_id, r.rater_id, r.rating, r.comment, r.created_at, u.email as rater_email FROM ratings r JOIN users u ON u.id = r.rater_id WHERE r.target_type = ? AND r.target_id = ? ORDER BY r.created_at DESC",
-        (target_type, target_id),
-    )
+    cur.execute(sql, params)
     rows = cur.fetchall()
     conn.close()
     return rows
 
-def get_average_rating_for_target(db_path, target_type, target_id):
+def get_rating_summary(db_path, target_type, target_id):
+    """
+    {"avg", "count", "histogram"} for a target from rating_aggregates, one primary key lookup.
+    histogram maps each star value 5..1 to its number of ratings.
+    """
     conn = get_connection(db_path)
     cur = conn.cursor()
-    cur.execute(
-        "SELECT AVG(rating) as avg_rating, COUNT(*) as count FROM ratings WHERE target_type = ? AND target_id = ?",
-        (target_type, target_id),
-    )
+    cur.execute("SELECT * FROM rating_aggregates WHERE target_type = ? AND target_id = ?", (target_type, target_id))
     row = cur.fetchone()
     conn.close()
-    if not row:
-        return {"avg": None, "count": 0}
-    return {"avg": row.get("avg_rating"), "count": row.get("count")}
+    if not row or not row["rating_count"]:
+        return {"avg": None, "count": 0, "histogram": {star: 0 for star in range(5, 0, -1)}}
+    return {
+        "avg": row["rating_sum"] / row["rating_count"],
+        "count": row["rating_count"],
+        "histogram": {star: row[f"stars_{star}"] for star in range(5, 0, -1)},
+    }
+
+def get_average_rating_for_target(db_path, target_type, target_id):
+    summary = get_rating_summary(db_path, target_type, target_id)
+    return {"avg": summary["avg"], "count": summary["count"]}
 
 def get_rating_by_id(db_path, rating_id):
     conn = get_connection(db_path)
@@ -541,10 +2078,10 @@ def get_rating_by_id(db_path, rating_id):
     conn.close()
     return row
 
+def _delete_rating(conn, rating_id):
+    conn.execute("DELETE FROM ratings WHERE id = ?", (rating_id,))
+
 def delete_rating(db_path, rating_id):
-    conn = get_connection(db_path)
-    cur = conn.cursor()
-    cur.execute("DELETE FROM ratings WHERE id = ?", (rating_id,))
-    conn.commit()
-    conn.close()
+    # the ratings_aggregate_ad trigger updates rating_aggregates in the same transaction
+    run_write(db_path, _delete_rating, rating_id)
     return True
@@ -32,7 +32,12 @@
   let activeOther = null;
   let messages = [];
   let pollTimer = null;
+  let stream = null;
   let selectedMessageId = null;
+  // conversation history is fetched in windows of PAGE_SIZE; older ones load on scroll-up
+  const PAGE_SIZE = 50;
+  let hasOlder = false;
+  let loadingOlder = false;
 
   function esc(s){ return String(s||'').replace(/[&<>"']/g, function(m){ return ({'&':'&amp;','<':'&lt;','>':'&gt;','"':'&quot;',"'":'&#39;'})[m]; }); }
 
@@ -75,6 +80,7 @@
     chatLastSeen.textContent = conv.last_at ? ('Last: ' + conv.last_at) : '';
     chatBody.innerHTML = '<div class="no-conv">Loading messages…</div>';
     messages = [];
+    hasOlder = false;
     deleteBtn.style.display = 'inline-flex';
     reportBtn.style.display = 'inline-flex';
     await loadConversationMessages();
@@ -85,10 +91,11 @@
   async function loadConversationMessages() {
     if (!activeOther) return;
     try {
-      const res = await fetch('/api/messages/conversation/' + encodeURIComponent(activeOther), { credentials: "same-origin" });
+      const res = await fetch('/api/messages/conversation/' + encodeURIComponent(activeOther) + '?limit=' + PAGE_SIZE, { credentials: "same-origin" });
       const j = await res.json();
       if (!j.ok) { chatBody.innerHTML = '<div class="no-conv">Failed to load messages</div>'; return; }
       messages = j.messages || [];
+      hasOlder = !!j.has_more;
       renderMessages();
       await fetchConversations();
     } catch (e) {
@@ -97,7 +104,30 @@
     }
   }
 
-  function renderMessages() {
+  async function loadOlderMessages() {
+    if (!activeOther || !hasOlder || loadingOlder || messages.length === 0) return;
+    loadingOlder = true;
+    const otherAtStart = activeOther;
+    try {
+      const url = '/api/messages/conversation/' + encodeURIComponent(activeOther) + '?limit=' + PAGE_SIZE + '&before_id=' + encodeURIComponent(messages[0].id);
+      const res = await fetch(url, { credentials: "same-origin" });
+      const j = await res.json();
+      if (!j.ok || otherAtStart !== activeOther) return;
+      hasOlder = !!j.has_more;
+      const older = j.messages || [];
+      if (older.length) {
+        const fromBottom = chatBody.scrollHeight - chatBody.scrollTop;
+        messages = older.concat(messages);
+        renderMessages(fromBottom);
+      }
+    } catch (e) {
+      console.error('load older error', e);
+    } finally {
+      loadingOlder = false;
+    }
+  }
+
+  function renderMessages(keepFromBottom) {
     chatBody.innerHTML = '';
     selectedMessageId = null;
     if (!messages || messages.length === 0) {
@@ -122,7 +152,12 @@
       });
       chatBody.appendChild(div);
     });
-    chatBody.scrollTop = chatBody.scrollHeight + 200;
+    if (keepFromBottom) {
+      // older history was prepended: keep the same messages in view
+      chatBody.scrollTop = chatBody.scrollHeight - keepFromBottom;
+    } else {
+      chatBody.scrollTop = chatBody.scrollHeight + 200;
+    }
   }
 
   async function sendMessage() {
@@ -141,7 +176,7 @@
         alert(j.error || 'Failed to send message');
       } else {
         chatInput.value = '';
-        messages.push(j.message);
+        if (!messages.some(x => Number(x.id) === Number(j.message.id))) messages.push(j.message);
         renderMessages();
         fetchConversations();
       }
@@ -153,15 +188,74 @@
     }
   }
 
+  // Server push: /api/messages/stream sends each new message ("chat") and unread count
+  // changes ("unread"). Polling below is only used when EventSource is unavailable or the
+  // server refuses the stream (503 when it has too many open); EventSource does not retry that.
+  function startStream() {
+    if (!window.EventSource) return false;
+    stream = new EventSource('/api/messages/stream', { withCredentials: true });
+    stream.addEventListener('error', function () {
+      if (stream && stream.readyState === EventSource.CLOSED) {
+        stream = null;
+        startPolling();
+      }
+    });
+    stream.addEventListener('chat', function (ev) {
+      let m;
+      try { m = JSON.parse(ev.data); } catch (e) { return; }
+      const otherId = Number(m.sender_id) === Number(window.CURRENT_USER_ID) ? Number(m.recipient_id) : Number(m.sender_id);
+      if (activeOther && otherId === Number(activeOther)) {
+        if (!messages.some(x => Number(x.id) === Number(m.id))) {
+          messages.push(m);
+          renderMessages();
+        }
+        if (Number(m.sender_id) === Number(activeOther)) markRead(activeOther);
+      }
+      const conv = conversations.find(c => Number(c.other_id) === otherId);
+      if (conv) {
+        conv.last_message = m.body;
+        conv.last_at = m.created_at;
+        conv.last_sender_id = m.sender_id;
+        conversations = [conv].concat(conversations.filter(c => c !== conv));
+        renderConversations(convSearch.value);
+      } else {
+        fetchConversations();
+      }
+    });
+    stream.addEventListener('unread', function (ev) {
+      let counts;
+      try { counts = JSON.parse(ev.data).counts || {}; } catch (e) { return; }
+      conversations.forEach(c => { c.unread_count = counts[String(c.other_id)] || 0; });
+      renderConversations(convSearch.value);
+    });
+    return true;
+  }
+
+  async function markRead(otherId) {
+    try {
+      await fetch('/api/messages/mark_read', {
+        method: 'POST',
+        credentials: "same-origin",
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ other_id: otherId })
+      });
+    } catch (e) {
+      console.error('mark read error', e);
+    }
+  }
+
   function startPolling() {
+    if (stream) return;
     if (pollTimer) clearInterval(pollTimer);
     pollTimer = setInterval(async () => {
       if (!activeOther) return;
       try {
-        const res = await fetch('/api/messages/conversation/' + encodeURIComponent(activeOther), { credentials: "same-origin" });
+        // only ask for what we don't have yet
+        const lastId = messages.length ? messages[messages.length - 1].id : 0;
+        const res = await fetch('/api/messages/conversation/' + encodeURIComponent(activeOther) + '?since_id=' + encodeURIComponent(lastId), { credentials: "same-origin" });
         const j = await res.json();
-        if (j.ok) {
-          messages = j.messages || [];
+        if (j.ok && (j.messages || []).length) {
+          messages = messages.concat(j.messages);
           renderMessages();
           fetchConversations();
         }
@@ -253,6 +347,7 @@
     }
   });
 
+  chatBody.addEventListener('scroll', function () { if (chatBody.scrollTop < 40) loadOlderMessages(); });
   sendBtn.addEventListener('click', sendMessage);
   chatInput.addEventListener('keydown', function (e) { if (e.key === 'Enter' && (e.ctrlKey || e.metaKey)) { sendMessage(); } });
   convSearch.addEventListener('input', function () { renderConversations(this.value); });
@@ -274,6 +369,7 @@
     }
   }
 
+  startStream();
   openFromUrl();
 
   window.__messages_ui = { fetchConversations, openConversation, loadConversationMessages };